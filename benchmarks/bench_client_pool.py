@@ -0,0 +1,68 @@
+# ----------------------------
+# 基准：每次新建客户端 vs 共享连接池
+# 用法：python -m benchmarks.bench_client_pool
+# ----------------------------
+import asyncio
+import statistics
+import time
+
+from openai import AsyncOpenAI
+
+from benchmarks.mock_server import MockServer
+from core.client_pool import ClientPool
+
+ROUNDS = 50
+
+
+class StaticConfig:
+    def __init__(self, **values):
+        self.values = values
+
+    def get(self, key):
+        return self.values.get(key)
+
+
+async def run_requests(get_client, server):
+    timings = []
+    before = server.connection_count
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        client = get_client()
+        await client.chat.completions.create(
+            model="mock-model",
+            messages=[{"role": "user", "content": "在吗"}]
+        )
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings, server.connection_count - before
+
+
+def report(name, timings, connections):
+    print(f"{name:<12} mean={statistics.mean(timings):7.2f}ms "
+          f"p50={statistics.median(timings):7.2f}ms "
+          f"max={max(timings):7.2f}ms  new_connections={connections}")
+
+
+async def run():
+    with MockServer() as server:
+        cfg = StaticConfig(api_key="sk-mock", base_url=server.base_url,
+                           connect_timeout=10, read_timeout=60)
+
+        def fresh_client():
+            return AsyncOpenAI(api_key="sk-mock", base_url=server.base_url)
+
+        pool = ClientPool()
+
+        # 先各自热身一次，排除导入与首次初始化的开销
+        await run_requests(fresh_client, server)
+        pool.get_client(cfg)
+
+        report("fresh", *await run_requests(fresh_client, server))
+        report("pooled", *await run_requests(lambda: pool.get_client(cfg), server))
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
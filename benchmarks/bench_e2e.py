@@ -0,0 +1,270 @@
+# ----------------------------
+# 基准：端到端请求延迟（PromptBuilder + AIWorker + 引擎，针对本地模拟服务）
+# 用法：python -m benchmarks.bench_e2e [--rounds 30] [--latency 0.05] [--token-rate 200]
+#       [--malformed-rate 0.1] [--format json_schema] [--refill 1] [--output benchmarks/results/new.json] [--compare benchmarks/results/old.json]
+# ----------------------------
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from benchmarks.mock_server import MockServer, MALFORMED_KINDS
+from core.ai_engine import AIWorker
+from core.config import ConfigManager
+from core.direction_manager import DirectionManager
+from core.metrics import metrics, percentile
+from core.option_parser import OptionStreamParser, parse_options
+from core.prompt_builder import PromptMode
+
+REPLY_TEXT = "[热情同意] 好呀，周末一起去看电影吧\n[撒娇] 哥哥最好了，请我喝奶茶嘛～\n[幽默调侃] 你是不是又想偷懒了？"
+CONTEXT = [
+    {"role": "user", "content": "今天好累啊"},
+    {"role": "assistant", "content": "辛苦啦，晚上早点休息"},
+]
+TIMEOUT_MS = 30000
+EXPECTED_OPTIONS = parse_options(REPLY_TEXT)
+
+
+def summarize(values):
+    return {
+        "n": len(values),
+        "p50": percentile(values, 50),
+        "p95": percentile(values, 95),
+        "p99": percentile(values, 99),
+        "mean": sum(values) / len(values) if values else None,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Runner:
+    def __init__(self, args, server):
+        self.args = args
+        self.server = server
+        self.cfg = ConfigManager(os.path.join(tempfile.mkdtemp(), "bench_config.json"))
+        self.cfg.update({
+            "api_key": "sk-mock",
+            "base_url": server.base_url,
+            "model": "mock-model",
+            "response_cache_enabled": False,
+            "max_retries": 0,
+            "engine_max_concurrency": args.concurrency,
+            "option_output_format": args.format,
+            "option_refill_attempts": args.refill,
+        })
+        self.preset_str = DirectionManager().get_all_directions_string()
+        self.errors = {}
+        # 最终结果中含有占位、重复或解析错误选项的组数
+        self.incomplete = 0
+
+    def maybe_inject_malformed(self):
+        if self.args.malformed_rate and random.random() < self.args.malformed_rate:
+            self.server.inject({"malformed": random.choice(MALFORMED_KINDS)})
+
+    def run_one(self, mode, stream=None):
+        """
+        启动一个 AIWorker 并等待其结束，返回 (首个结果耗时, 全部结果耗时)，单位 ms。
+        计时在主线程中进行，包含信号排队回到界面线程的开销。
+        """
+        worker = AIWorker(self.cfg, mode=mode, prompt="周末有什么安排吗", context=CONTEXT,
+                          preset_directions_str=self.preset_str, stream=stream, use_cache=False)
+        marks = {}
+        loop = QEventLoop()
+
+        def mark(name):
+            marks.setdefault(name, time.perf_counter())
+
+        worker.option_parsed.connect(lambda *_: mark("first"))
+        worker.finished_options.connect(lambda options: (mark("all"), self.count_incomplete(options)))
+        worker.finished_reply.connect(lambda _: mark("all"))
+        worker.error_occurred.connect(lambda err: self.errors.update({err: self.errors.get(err, 0) + 1}))
+        worker.finished.connect(lambda: (mark("done"), loop.quit()))
+        QTimer.singleShot(TIMEOUT_MS, loop.quit)
+
+        start = time.perf_counter()
+        worker.start()
+        loop.exec()
+        end = marks.get("all", marks.get("done"))
+        if end is None:
+            return None
+        first = marks.get("first", end)
+        return (first - start) * 1000, (end - start) * 1000
+
+    def count_incomplete(self, options):
+        contents = {o["content"] for o in options}
+        if len(contents) < len(EXPECTED_OPTIONS) or any(o not in EXPECTED_OPTIONS for o in options):
+            self.incomplete += 1
+
+    def sequential(self, mode, stream=None):
+        first, total = [], []
+        for _ in range(self.args.rounds):
+            self.maybe_inject_malformed()
+            result = self.run_one(mode, stream)
+            if result:
+                first.append(result[0])
+                total.append(result[1])
+        return first, total
+
+    def throughput(self, mode, stream):
+        """并发提交 rounds 个请求，统计每秒完成数"""
+        loop = QEventLoop()
+        remaining = [self.args.rounds]
+        workers = []
+
+        def on_done():
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                loop.quit()
+
+        start = time.perf_counter()
+        for _ in range(self.args.rounds):
+            worker = AIWorker(self.cfg, mode=mode, prompt="周末有什么安排吗", context=CONTEXT,
+                              preset_directions_str=self.preset_str, stream=stream, use_cache=False)
+            worker.finished.connect(on_done)
+            workers.append(worker)
+            worker.start()
+        QTimer.singleShot(TIMEOUT_MS, loop.quit)
+        loop.exec()
+        elapsed = time.perf_counter() - start
+        return (self.args.rounds - remaining[0]) / elapsed
+
+
+def parse_timings(rounds, chunk_chars):
+    """选项解析本身的耗时（μs）：流式增量解析与一次性解析"""
+    chunks = [REPLY_TEXT[i:i + chunk_chars] for i in range(0, len(REPLY_TEXT), chunk_chars)]
+    stream_us, batch_us = [], []
+    for _ in range(max(rounds, 100)):
+        start = time.perf_counter()
+        parser = OptionStreamParser()
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.finish()
+        stream_us.append((time.perf_counter() - start) * 1e6)
+
+        start = time.perf_counter()
+        parse_options(REPLY_TEXT)
+        batch_us.append((time.perf_counter() - start) * 1e6)
+    return stream_us, batch_us
+
+
+def run_all(args):
+    results = {}
+    with MockServer(latency=args.latency, reply_text=REPLY_TEXT,
+                    token_rate=args.token_rate, chunk_chars=args.chunk_chars) as server:
+        runner = Runner(args, server)
+        # 预热连接池，避免首个样本包含建连开销
+        runner.run_one(PromptMode.PRELOAD.value)
+
+        _, preload = runner.sequential(PromptMode.PRELOAD.value)
+        results["preload_ms"] = summarize(preload)
+
+        _, chat = runner.sequential(PromptMode.DIRECT_CHAT.value)
+        results["direct_chat_ms"] = summarize(chat)
+
+        metrics.reset("options.")
+        requests_before = server.request_count
+        first, total = runner.sequential(PromptMode.GENERATE_OPTIONS.value, stream=True)
+        results["options_stream_first_ms"] = summarize(first)
+        results["options_stream_all_ms"] = summarize(total)
+
+        _, total = runner.sequential(PromptMode.GENERATE_OPTIONS.value, stream=False)
+        results["options_blocking_all_ms"] = summarize(total)
+        # 每组选项平均发出的请求数（含补全请求），以及首次回复的格式质量分布
+        results["options_requests_per_set"] = (server.request_count - requests_before) / (2 * args.rounds)
+        results["options_parse"] = {name: metrics.get(f"options.parse.{name}")
+                                    for name in ("clean", "repaired", "partial", "failed")}
+
+        results["options_stream_rps"] = runner.throughput(PromptMode.GENERATE_OPTIONS.value, stream=True)
+        results["errors"] = runner.errors
+        results["options_incomplete"] = runner.incomplete
+
+    stream_us, batch_us = parse_timings(args.rounds, args.chunk_chars)
+    results["parse_stream_us"] = summarize(stream_us)
+    results["parse_batch_us"] = summarize(batch_us)
+    return results
+
+
+def print_report(results, baseline=None):
+    base = (baseline or {}).get("results", {})
+    print(f"{'metric':<26} {'p50':>9} {'p95':>9} {'p99':>9}  {'Δp50 vs baseline':>16}")
+    for name, value in results.items():
+        if not isinstance(value, dict) or "p50" not in value:
+            continue
+        if value["n"] == 0:
+            print(f"{name:<26} {'-':>9} {'-':>9} {'-':>9}")
+            continue
+        delta = ""
+        old = base.get(name)
+        if old and old.get("p50"):
+            delta = f"{(value['p50'] - old['p50']) / old['p50']:+.1%}"
+        print(f"{name:<26} {value['p50']:9.2f} {value['p95']:9.2f} {value['p99']:9.2f}  {delta:>16}")
+    rps = results.get("options_stream_rps")
+    if rps is not None:
+        old_rps = base.get("options_stream_rps")
+        delta = f"  ({(rps - old_rps) / old_rps:+.1%})" if old_rps else ""
+        print(f"{'options_stream_rps':<26} {rps:9.1f}{delta}")
+    if "options_requests_per_set" in results:
+        print(f"{'options_requests_per_set':<26} {results['options_requests_per_set']:9.2f}")
+    if results.get("options_parse"):
+        print("first reply format:", results["options_parse"])
+    if results.get("options_incomplete"):
+        print("incomplete option sets:", results["options_incomplete"])
+    if results.get("errors"):
+        print("errors:", results["errors"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GalChat end-to-end latency benchmark")
+    parser.add_argument("--rounds", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务首字节前延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200, help="流式输出速度（事件/秒）")
+    parser.add_argument("--chunk-chars", type=int, default=2, help="每个流式事件的字符数")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回异常输出的请求比例")
+    parser.add_argument("--format", default="text", choices=["text", "json_schema", "json_object"],
+                        help="选项输出格式")
+    parser.add_argument("--refill", type=int, default=1, help="缺失选项的补全请求次数")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="结果 JSON 路径")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 对比")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    app = QCoreApplication(sys.argv)
+    results = run_all(args)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+
+    if args.output:
+        record = {
+            "commit": git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "params": vars(args),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(record, f, indent=2, ensure_ascii=False)
+        print(f"结果已保存到 {args.output}")
+    del app
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# ----------------------------
+# 基准：重试与故障转移
+# 用法：python -m benchmarks.bench_failover
+# ----------------------------
+import asyncio
+import time
+
+from benchmarks.mock_server import MockServer
+from core.config import ConfigManager
+from core.endpoint_router import call_with_failover, endpoint_health
+
+
+def request(client, model):
+    return client.chat.completions.create(
+        model=model, messages=[{"role": "user", "content": "在吗"}])
+
+
+class StreamRequest:
+    """读完整个流式回复，记录是否已经收到内容"""
+
+    def __init__(self):
+        self.output_started = False
+
+    async def __call__(self, client, model):
+        self.output_started = False
+        stream = await client.chat.completions.create(
+            model=model, messages=[{"role": "user", "content": "在吗"}], stream=True)
+        text = ""
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                self.output_started = True
+                text += chunk.choices[0].delta.content
+        return text
+
+
+async def timed(name, cfg, servers, request_fn=request):
+    before = [s.request_count for s in servers]
+    start = time.perf_counter()
+    output_started = (lambda: request_fn.output_started) if isinstance(request_fn, StreamRequest) else None
+    try:
+        await call_with_failover(cfg, request_fn, log=lambda text: print("   ", text),
+                                 output_started=output_started)
+        result = "ok"
+    except Exception as e:
+        result = f"error: {e.__class__.__name__}"
+    elapsed = (time.perf_counter() - start) * 1000
+    hits = [s.request_count - b for s, b in zip(servers, before)]
+    print(f"{name:<28} {result:<24} {elapsed:8.1f}ms  requests(primary, fallback)={hits}")
+
+
+async def run():
+    with MockServer() as primary, MockServer() as fallback:
+        cfg = ConfigManager("bench_config.json")
+        cfg.config = dict(cfg.default_config, api_key="sk-mock", base_url=primary.base_url,
+                          model="mock-model", retry_base_delay=0.05, endpoint_cooldown=5,
+                          fallback_endpoints=[{"base_url": fallback.base_url}])
+        servers = [primary, fallback]
+
+        primary.inject({"status": 503})
+        await timed("503 then success", cfg, servers)
+
+        primary.inject({"status": 429, "headers": {"Retry-After": "0.3"}})
+        await timed("429 with Retry-After", cfg, servers)
+
+        primary.inject({"reset": True})
+        await timed("connection reset", cfg, servers)
+
+        # 流在首个内容片段之前断开可以重试；已经输出过内容时直接报错
+        primary.inject({"reset_after": 0})
+        await timed("stream reset before output", cfg, servers, StreamRequest())
+
+        primary.inject({"reset_after": 2})
+        await timed("stream reset after output", cfg, servers, StreamRequest())
+
+        primary.inject(*[{"status": 500}] * 3)
+        await timed("primary down -> failover", cfg, servers)
+        await timed("primary in cool-down", cfg, servers)
+        print("    cool-down:", endpoint_health.snapshot())
+
+
+
+def main():
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+# ----------------------------
+# 基准：词库检索索引
+# 用法：python -m benchmarks.bench_lexicon_index [词条数]
+# ----------------------------
+import json
+import random
+import statistics
+import sys
+import time
+
+from core.context_manager import estimate_tokens
+from core.lexicon_index import LexiconIndex
+
+QUERIES = ["在吗", "周末有空吗", "今天好累啊", "你在干嘛呢", "这个问题怎么解决",
+           "晚安", "我有点难过", "推荐个电影呗", "明天要考试了", "哈哈哈笑死我了"]
+TOP_K = 30
+
+
+def synthesize(base, size, seed=42):
+    """用现有词库的片段随机拼接出指定规模的词库"""
+    rng = random.Random(seed)
+    pieces = [p for entry in base for p in entry.replace("，", ",").split(",") if p]
+    return [f"{rng.choice(pieces)}，{rng.choice(pieces)}" for _ in range(size)]
+
+
+def main():
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with open("lexicon.json", "r", encoding="utf-8") as f:
+        base = json.load(f)
+    entries = synthesize(base, size)
+
+    start = time.perf_counter()
+    index = LexiconIndex(entries)
+    build_ms = (time.perf_counter() - start) * 1000
+
+    timings = []
+    for _ in range(5):
+        for query in QUERIES:
+            start = time.perf_counter()
+            index.top_k(query, TOP_K)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+
+    full_tokens = estimate_tokens("、".join(entries))
+    topk_tokens = statistics.mean(estimate_tokens("、".join(index.top_k(q, TOP_K))) for q in QUERIES)
+
+    print(f"entries={size}  build={build_ms:.0f}ms  terms={len(index.postings)}")
+    print(f"query  p50={timings[len(timings) // 2]:.2f}ms  "
+          f"p95={timings[int(len(timings) * 0.95)]:.2f}ms  max={timings[-1]:.2f}ms")
+    print(f"prompt tokens  full={full_tokens}  top{TOP_K}={topk_tokens:.0f}  "
+          f"reduction={1 - topk_tokens / full_tokens:.2%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+# ----------------------------
+# 基准：冷启动耗时（进程启动 → 窗口显示 → 可交互）
+# 用法：python -m benchmarks.bench_startup [次数]
+# ----------------------------
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 与 main.py 的 __main__ 相同的启动流程，首次空闲后输出各时间点并退出。
+# Linux 下 perf_counter 基于 CLOCK_MONOTONIC，父子进程的读数可以直接相减。
+PROBE = """
+import json, sys, time
+import main
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QTimer
+
+app = QApplication(sys.argv)
+window = main.MainWindow()
+window.show()
+
+def report():
+    marks = dict(window.startup_marks, imported=main.STARTUP_T0)
+    print(json.dumps(marks))
+    app.quit()
+
+QTimer.singleShot(0, report)
+app.exec()
+"""
+
+
+def run_once(workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"))
+    start = time.perf_counter()
+    out = subprocess.run([sys.executable, "-c", PROBE], cwd=workdir, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    marks = json.loads(out.strip().splitlines()[-1])
+    return {name: (value - start) * 1000 for name, value in marks.items()}
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    # 在临时目录中运行，避免读写仓库里的配置、会话与日志
+    with tempfile.TemporaryDirectory() as workdir:
+        run_once(workdir)  # 首次运行会生成默认文件并预热磁盘缓存，不计入结果
+        samples = [run_once(workdir) for _ in range(rounds)]
+
+    # imported: 开始导入 main；shown: 窗口显示；interactive: 首帧后事件循环空闲
+    print(f"{'stage':<12} {'median':>10} {'min':>10} {'max':>10}")
+    for name in ("imported", "shown", "interactive"):
+        values = [s[name] for s in samples]
+        print(f"{name:<12} {statistics.median(values):8.1f}ms {min(values):8.1f}ms {max(values):8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
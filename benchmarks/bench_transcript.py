@@ -0,0 +1,61 @@
+# ----------------------------
+# 基准：聊天记录视图追加 10 万条消息
+# 用法：python -m benchmarks.bench_transcript [总条数]
+# ----------------------------
+import os
+import resource
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication
+
+from ui.transcript_view import TranscriptView
+
+SAMPLE = 200
+TEXTS = ["在吗", "周末有什么安排吗", "刚看到消息，不好意思回复晚了，今天一直在忙，晚上有空一起吃饭吗？",
+         "哈哈哈哈", "慢慢来，别急，总会解决的"]
+
+
+def append_one(view, i):
+    view.append_message("Master" if i % 2 else "AI", TEXTS[i % len(TEXTS)],
+                        "#333333" if i % 2 else "#0984e3", align_right=bool(i % 2))
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    app = QApplication(sys.argv)
+    view = TranscriptView()
+    view.resize(800, 600)
+    view.show()
+    app.processEvents()
+
+    checkpoints = [c for c in (1000, 10000, 25000, 50000, 100000) if c <= total] or [total]
+    count = 0
+    print(f"{'messages':>9} {'append+paint/msg':>17} {'max RSS':>10}")
+    for checkpoint in checkpoints:
+        # 快速填充到检查点（每批之间处理一次事件）
+        while count < checkpoint - SAMPLE:
+            append_one(view, count)
+            count += 1
+            if count % 5000 == 0:
+                app.processEvents()
+        app.processEvents()
+
+        # 采样：每追加一条都处理事件（即布局 + 绘制）
+        start = time.perf_counter()
+        for _ in range(SAMPLE):
+            append_one(view, count)
+            count += 1
+            app.processEvents()
+        per_msg = (time.perf_counter() - start) * 1000 / SAMPLE
+        print(f"{count:>9} {per_msg:>14.3f}ms {rss_mb():>8.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
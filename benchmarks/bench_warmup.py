@@ -0,0 +1,110 @@
+# ----------------------------
+# 基准：空闲后首个请求的延迟（不预热 / GET /models 预热 / 预热请求 / 空闲心跳）
+# 用法：python -m benchmarks.bench_warmup [--rounds 8] [--connect-latency 0.1] [--idle-timeout 1.0]
+# ----------------------------
+import argparse
+import os
+import sys
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtCore import QCoreApplication, QEventLoop, QTimer
+
+from benchmarks.bench_e2e import REPLY_TEXT, Runner, summarize
+from benchmarks.mock_server import MockServer
+from core.ai_engine import AIWorker
+from core.prompt_builder import PromptMode
+
+
+class RunnerArgs:
+    concurrency = 4
+    malformed_rate = 0
+    format = "text"
+    refill = 1
+
+
+def idle(seconds):
+    """空闲等待，期间照常处理 Qt 事件（心跳定时器在这里触发）"""
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    loop.exec()
+
+
+def warm_up(runner, mode):
+    runner.cfg.update({"warmup_mode": mode})
+    worker = AIWorker(runner.cfg, mode=PromptMode.PRELOAD.value, preset_directions_str=runner.preset_str)
+    tokens = []
+    worker.timing_recorded.connect(lambda t: tokens.append(t["prompt_tokens"] + t["completion_tokens"]))
+    loop = QEventLoop()
+    worker.finished.connect(loop.quit)
+    worker.start()
+    loop.exec()
+    return sum(tokens)
+
+
+def run_scenario(args, name):
+    with MockServer(latency=args.latency, reply_text=REPLY_TEXT, token_rate=args.token_rate,
+                    chunk_chars=2, connect_latency=args.connect_latency,
+                    idle_timeout=args.idle_timeout) as server:
+        runner = Runner(RunnerArgs, server)
+        heartbeat = QTimer()
+        workers = []
+        if name == "heartbeat":
+            def beat():
+                # 与界面的心跳一致：不论 warmup_mode 如何都只发 GET /models
+                worker = AIWorker(runner.cfg, mode=PromptMode.PRELOAD.value, warmup_mode="models")
+                workers.append(worker)
+                worker.start()
+
+            heartbeat.timeout.connect(beat)
+            heartbeat.start(int(args.heartbeat * 1000))
+
+        first, total, tokens = [], [], 0
+        for _ in range(args.rounds):
+            idle(args.idle_timeout * 1.5)
+            if name in ("models", "completion"):
+                tokens += warm_up(runner, name)
+            result = runner.run_one(PromptMode.GENERATE_OPTIONS.value, stream=True)
+            if result:
+                first.append(result[0])
+                total.append(result[1])
+        heartbeat.stop()
+        return {"first": summarize(first), "total": summarize(total),
+                "warmup_tokens": tokens / args.rounds, "connections": server.connection_count,
+                "errors": runner.errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GalChat warm-up benchmark")
+    parser.add_argument("--rounds", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务首字节前延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=200)
+    parser.add_argument("--connect-latency", type=float, default=0.1, help="新连接的握手延迟（秒）")
+    parser.add_argument("--idle-timeout", type=float, default=1.0, help="服务端关闭空闲连接的时长（秒）")
+    parser.add_argument("--heartbeat", type=float, default=0.5, help="心跳间隔（秒）")
+    args = parser.parse_args()
+
+    app = QCoreApplication(sys.argv)
+    # 先在进程内完成 SDK 导入与首次请求的初始化，避免计入第一个场景
+    with MockServer(reply_text=REPLY_TEXT) as server:
+        Runner(RunnerArgs, server).run_one(PromptMode.GENERATE_OPTIONS.value, stream=True)
+
+    # none: 不预热；completion: max_tokens=1 的预热请求；models: GET /models；heartbeat: 空闲期间定期 GET /models
+    scenarios = ["none", "completion", "models", "heartbeat"]
+    results = {name: run_scenario(args, name) for name in scenarios}
+
+    baseline = results["none"]["first"]["p50"]
+    print(f"首个选项耗时（空闲 {args.idle_timeout * 1.5:.1f}s 之后，握手 {args.connect_latency * 1000:.0f}ms）")
+    print(f"{'scenario':<12} {'p50':>9} {'p95':>9} {'vs none':>9} {'tokens/round':>13} {'conns':>6}")
+    for name in scenarios:
+        r = results[name]
+        p50, p95 = r["first"]["p50"], r["first"]["p95"]
+        saved = f"{p50 - baseline:+.1f}ms" if name != "none" else ""
+        print(f"{name:<12} {p50:8.1f}ms {p95:8.1f}ms {saved:>9} {r['warmup_tokens']:13.0f} {r['connections']:6d}")
+        if r["errors"]:
+            print("    errors:", r["errors"])
+    del app
+
+
+if __name__ == "__main__":
+    main()
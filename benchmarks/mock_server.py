@@ -0,0 +1,279 @@
+# ----------------------------
+# 本地 OpenAI 兼容模拟服务
+# ----------------------------
+import json
+import re
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 可注入的异常输出，见 MockServer.inject
+MALFORMED_KINDS = ("chatter", "unlabeled", "partial", "truncated", "bad_chunk")
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    # 使用 HTTP/1.1，允许 keep-alive 复用连接
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connection_count += 1
+        if self.server.idle_timeout:
+            # 空闲超过该时长的 keep-alive 连接由服务端关闭
+            self.connection.settimeout(self.server.idle_timeout)
+        if self.server.connect_latency:
+            # 模拟新连接的握手开销（TCP + TLS 往返）
+            time.sleep(self.server.connect_latency)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _apply_fault(self):
+        """按注入顺序消费一个故障，返回 True 表示本次请求已被故障处理"""
+        self.malformed = None
+        self.reset_after = None
+        with self.server.fault_lock:
+            fault = self.server.faults.pop(0) if self.server.faults else None
+        if not fault:
+            return False
+        if fault.get("malformed"):
+            self.malformed = fault["malformed"]
+            return False
+        if fault.get("reset_after") is not None:
+            self.reset_after = fault["reset_after"]
+            return False
+        if fault.get("delay"):
+            time.sleep(fault["delay"])
+            return False
+        if fault.get("reset"):
+            # 不返回任何内容直接断开，模拟连接被重置
+            self.close_connection = True
+            self.connection.close()
+            return True
+        status = fault.get("status", 500)
+        body = json.dumps({"error": {"message": f"injected {status}"}}).encode("utf-8")
+        self.send_response(status)
+        for name, value in fault.get("headers", {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        return True
+
+    def _reply_content(self, body):
+        """
+        回复内容：补全请求中跳过 assistant 已经给出过的选项，只返回新的；
+        请求 JSON 输出时改为 {"options": [...]} 形式。
+        """
+        messages = body.get("messages", [])
+        # 补全请求的倒数第二条是 assistant 给出的已有选项
+        given = ""
+        if len(messages) >= 2 and messages[-2].get("role") == "assistant":
+            given = messages[-2].get("content") or ""
+            # 普通的历史回复不是选项格式
+            if not given.startswith(("[", "{")):
+                given = ""
+        lines = [line for line in self.server.reply_text.split("\n")
+                 if line and re.sub(r"^\[.*?\]\s*", "", line) not in given]
+        fmt = (body.get("response_format") or {}).get("type")
+        if fmt not in ("json_schema", "json_object"):
+            return "\n".join(lines)
+        options = []
+        for line in lines:
+            match = re.match(r"^\[(.*?)\]\s*(.*)$", line)
+            options.append({"label": match.group(1), "content": match.group(2)} if match else {"content": line})
+        return json.dumps({"options": options}, ensure_ascii=False)
+
+    def _malformed_content(self, content):
+        """按注入的类型改写回复内容，模拟模型不按格式输出"""
+        if self.malformed == "chatter":
+            return "好的，下面是三个回复方案：\n" + content + "\n希望对你有帮助！"
+        is_json = content.startswith("{")
+        if self.malformed == "unlabeled":
+            if is_json:
+                return re.sub(r'"label":\s*"[^"]*",\s*', "", content)
+            return re.sub(r"^\[.*?\]\s*", "", content, flags=re.MULTILINE)
+        if self.malformed == "partial":
+            if is_json:
+                return content[:content.index("}") + 1] + "]}"
+            return content.split("\n", 1)[0]
+        if self.malformed == "truncated":
+            return content[:len(content) // 2]
+        return content
+
+    def _send_stream(self, content, include_usage=False):
+        """以 SSE 形式返回，每 chunk_chars 个字符一个事件，使用 chunked 编码"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        step = max(1, self.server.chunk_chars)
+        try:
+            for i in range(0, len(content), step):
+                if self.reset_after is not None and i == self.reset_after * step:
+                    # 已发出 reset_after 个事件后以 RST 断开，模拟流读到一半连接被重置；
+                    # 先稍等让客户端读走已发出的内容，否则 RST 会连同未读数据一起丢弃
+                    time.sleep(0.05)
+                    self.close_connection = True
+                    self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0))
+                    self.connection.close()
+                    return
+                if self.malformed == "bad_chunk" and i == step:
+                    self._write_chunk(b"data: {\"choices\": [\n\n")
+                self._write_event({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": "mock-model",
+                    "choices": [{"index": 0, "delta": {"content": content[i:i + step]}, "finish_reason": None}]
+                })
+                if self.server.token_interval:
+                    time.sleep(self.server.token_interval)
+            if self.malformed == "truncated":
+                # 不发送结束标记直接断开，模拟上游中途掐断
+                self.close_connection = True
+                self.connection.shutdown(socket.SHUT_RDWR)
+                return
+            if include_usage:
+                self._write_event({
+                    "id": "chatcmpl-mock",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": "mock-model",
+                    "choices": [],
+                    "usage": {"prompt_tokens": 10, "completion_tokens": len(content), "total_tokens": 10 + len(content)}
+                })
+            self._write_chunk(b"data: [DONE]\n\n")
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            # 客户端提前断开（例如已凑齐选项）
+            self.close_connection = True
+
+    def _write_event(self, obj):
+        data = "data: " + json.dumps(obj, ensure_ascii=False) + "\n\n"
+        self._write_chunk(data.encode("utf-8"))
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [
+                {"id": "mock-model", "object": "model", "created": 0, "owned_by": "mock"}
+            ]})
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.request_count += 1
+        if self._apply_fault():
+            return
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if body.get("response_format") and not self.server.structured_output:
+            self._send_json(400, {"error": {"message": "response_format is not supported",
+                                            "param": "response_format"}})
+            return
+        if body.get("stream_options") and not self.server.stream_usage:
+            self._send_json(400, {"error": {"message": "stream_options is not supported",
+                                            "param": "stream_options"}})
+            return
+        content = self._malformed_content(self._reply_content(body))
+        if body.get("max_tokens"):
+            # 粗略地按一个字符一个 token 截断（预热请求只要 1 个 token）
+            content = content[:body["max_tokens"]]
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._send_stream(content, include_usage)
+            return
+        if self.server.token_interval:
+            # 非流式请求同样要等整段内容生成完毕
+            steps = -(-len(content) // max(1, self.server.chunk_chars))
+            time.sleep(steps * self.server.token_interval)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mock-model",
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 10, "total_tokens": 20}
+        })
+
+
+class MockServer:
+    """在后台线程中运行的模拟服务，base_url 形如 http://127.0.0.1:port/v1"""
+
+    def __init__(self, latency=0.0, reply_text="[热情同意] 好呀", token_interval=0.0,
+                 token_rate=None, chunk_chars=1, connect_latency=0.0, idle_timeout=None,
+                 structured_output=True, stream_usage=True):
+        """
+        latency 为首字节前的固定延迟（秒）；流式输出的速度可用 token_interval（每个事件的间隔）
+        或 token_rate（每秒事件数）指定，每个事件包含 chunk_chars 个字符。
+        connect_latency 为每个新连接的握手延迟，idle_timeout 为服务端关闭空闲连接的时长。
+        structured_output 为 False 时，带 response_format 的请求返回 400；
+        stream_usage 为 False 时，带 stream_options 的请求返回 400。
+        """
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), MockHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.latency = latency
+        self.httpd.reply_text = reply_text
+        self.httpd.token_interval = 1.0 / token_rate if token_rate else token_interval
+        self.httpd.chunk_chars = chunk_chars
+        self.httpd.connect_latency = connect_latency
+        self.httpd.idle_timeout = idle_timeout
+        self.httpd.structured_output = structured_output
+        self.httpd.stream_usage = stream_usage
+        self.httpd.connection_count = 0
+        self.httpd.request_count = 0
+        self.httpd.faults = []
+        self.httpd.fault_lock = threading.Lock()
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def connection_count(self):
+        return self.httpd.connection_count
+
+    @property
+    def request_count(self):
+        return self.httpd.request_count
+
+    def inject(self, *faults):
+        """
+        注入故障，每个请求按顺序消费一个：
+        {"status": 503, "headers": {"Retry-After": "1"}}、{"reset": True}、{"delay": 2.0}、
+        {"reset_after": n}（流式回复发出 n 个事件后重置连接）、
+        {"malformed": kind}（kind 取自 MALFORMED_KINDS）
+        """
+        with self.httpd.fault_lock:
+            self.httpd.faults.extend(faults)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
@@ -1,48 +1,136 @@
 # ----------------------------
 # ai回复接口
 # ----------------------------
+import asyncio
 import json
-import re
-from PyQt6.QtCore import QThread, pyqtSignal
-from openai import OpenAI
+import time
+from PyQt6.QtCore import QObject, pyqtSignal
+from core.client_pool import client_pool
+from core.engine import get_engine, Priority
+from core.endpoint_router import call_with_failover, rejects_param
 from core.prompt_builder import PromptBuilder, PromptMode
+from core.option_parser import OptionStreamParser, pad_options, OPTION_COUNT
+from core.response_cache import get_response_cache, make_cache_key
+from core.metrics import metrics, latency_stats
+from core.request_timing import RequestTiming, current_timing
 
+# 明确因 response_format 返回 400 的端点，本进程内不再尝试结构化输出
+structured_output_unsupported = set()
+# 不接受 stream_options（include_usage）的端点，流式请求时不再附带
+stream_usage_unsupported = set()
 
-class AIWorker(QThread):
+
+class AIWorker(QObject):
+    """
+    一次 AI 请求。不再独占线程，而是作为协程提交到共享的引擎事件循环，
+    cancel() 会直接中断进行中的 HTTP 请求/流。
+    """
+    finished = pyqtSignal()
     finished_options = pyqtSignal(list)
+    option_parsed = pyqtSignal(int, dict)  # 流式模式下逐个发出 (序号, 选项)
     finished_reply = pyqtSignal(str)
     error_occurred = pyqtSignal(str)
     log_message = pyqtSignal(str)
     debug_payload = pyqtSignal(str)
+    timing_recorded = pyqtSignal(dict)  # 请求结束后的分段耗时，见 RequestTiming
+
+    DEFAULT_PRIORITY = {
+        "generate_options": Priority.INTERACTIVE,
+        "direct_chat": Priority.CONSOLE,
+        "summarize": Priority.BACKGROUND,
+        "preload": Priority.PRELOAD,
+    }
 
     def __init__(self, config_manager, mode, prompt=None, context=None,
-                 preset_directions_str=None):
+                 preset_directions_str=None, stream=None, use_cache=True,
+                 context_usage=None, priority=None, coalesce_key=None, owner=None, warmup_mode=None):
         super().__init__()
-        self.cfg = config_manager
+        # 请求期间使用不可变快照，设置页保存不会影响进行中的请求
+        self.cfg = config_manager.snapshot()
         self.mode = mode
         self.prompt = prompt
         self.context = context
         self.preset_directions_str = preset_directions_str
+        # stream 为 None 时跟随配置；后台预生成等场景可强制关闭
+        self.stream = stream
+        # 重新生成时需要新的方案，不读缓存
+        self.use_cache = use_cache
+        # 上下文窗口占用情况，仅用于调试输出
+        self.context_usage = context_usage
+        self.priority = self.DEFAULT_PRIORITY[mode] if priority is None else priority
+        # 预热任务默认互相合并：新的预热替换排队中的旧预热
+        self.coalesce_key = "preload" if coalesce_key is None and mode == "preload" else coalesce_key
+        # 发起请求的会话，引擎据此在会话之间公平调度
+        self.owner = owner
+        # 预热方式，None 时跟随配置；空闲心跳固定为 models
+        self.warmup_mode = warmup_mode
+        self.handle = None
+        self.timing = None
+        self.submitted_at = None
+        # 当前这次尝试是否已经向界面发出过选项，决定流中途断开时能否重试
+        self._output_started = False
+
+    def start(self):
+        """提交到引擎调度执行"""
+        self.submitted_at = time.perf_counter()
+        engine = get_engine()
+        engine.max_concurrency = max(1, int(self.cfg.get("engine_max_concurrency")))
+        engine.max_per_owner = max(1, int(self.cfg.get("engine_max_per_session")))
+        self.handle = engine.submit(
+            self.run,
+            priority=self.priority,
+            coalesce_key=self.coalesce_key,
+            owner=self.owner,
+            # 同一会话的新一轮选项请求会取代仍在进行的旧请求
+            supersede=self.mode == "generate_options" and self.coalesce_key is not None
+        )
+        self.handle.add_done_callback(lambda _: self.finished.emit())
+
+    def promote(self, priority):
+        """提高优先级：仍在排队时按新的优先级出队"""
+        self.priority = min(self.priority, priority)
+        if self.handle:
+            self.handle.promote(self.priority)
 
-    def run(self):
+    def cancel(self):
+        """中断请求：取消协程，正在读取的响应流随之关闭"""
+        if self.handle and not self.handle.done():
+            self.handle.cancel()
+            self.log_message.emit("请求已取消，连接已中断")
+
+    async def run(self):
+        """执行请求并记录分段耗时；被取消的请求不计入统计"""
+        self.timing = RequestTiming(self.mode, self.cfg.get("model"), self.submitted_at)
+        token = current_timing.set(self.timing)
+        try:
+            await self._run()
+        finally:
+            current_timing.reset(token)
+        self.timing.finish()
+        record = self.timing.to_dict()
+        latency_stats.record(record)
+        self.timing_recorded.emit(record)
+
+    async def _run(self):
         api_key = self.cfg.get("api_key")
-        base_url = self.cfg.get("base_url")
         model = self.cfg.get("model")
 
         if not api_key:
+            self.timing.error = "missing api key"
             self.error_occurred.emit("请先在设置中配置 API Key")
             return
 
         try:
-            client = OpenAI(api_key=api_key, base_url=base_url)
             builder = PromptBuilder(self.cfg)
 
+            build_start = time.perf_counter()
             messages, request_type = builder.build(
                 mode=PromptMode(self.mode),
                 prompt=self.prompt,
                 context=self.context,
                 preset_directions_str=self.preset_directions_str
             )
+            self.timing.build_ms = (time.perf_counter() - build_start) * 1000
             def emit_debug_info(msgs, req_type):
                 debug_msgs = []
 
@@ -54,12 +142,16 @@ class AIWorker(QThread):
                     else:
                         debug_msgs.append(m)
 
+                payload_obj = {
+                    "request_type": req_type,
+                    "model": model,
+                    "messages": debug_msgs
+                }
+                if self.context_usage:
+                    payload_obj["context_tokens"] = self.context_usage
+
                 payload = json.dumps(
-                    {
-                        "request_type": req_type,
-                        "model": model,
-                        "messages": debug_msgs
-                    },
+                    payload_obj,
                     indent=2,
                     ensure_ascii=False
                 )
@@ -68,7 +160,14 @@ class AIWorker(QThread):
 
 
             # -------- 预热模式  --------
-            if self.mode == "preload":
+            if self.mode == "preload" and (self.warmup_mode or self.cfg.get("warmup_mode")) != "completion":
+                # 只建立 TCP/TLS 连接，不消耗 tokens
+                self.log_message.emit("正在预热 AI 连接 (GET /models)...")
+                await self._warm_connection()
+                self.log_message.emit("连接预热成功")
+                return
+
+            elif self.mode == "preload":
                 use_preset = self.cfg.get("use_preset_directions")
                 self.log_message.emit(
                     f"正在预热 AI 连接 (携带词库: {'是' if use_preset else '否'})..."
@@ -77,67 +176,227 @@ class AIWorker(QThread):
                 emit_debug_info(messages, request_type)
 
 
-                client.chat.completions.create(
-                    model=model,
+                response = await self._request(lambda client, m: client.chat.completions.create(
+                    model=m,
                     messages=messages,
                     max_tokens=1
-                )
+                ))
+                self._record_usage(response.usage)
 
                 self.log_message.emit("连接预热成功，上下文环境已建立。")
                 return
 
             # -------- 调试模式 --------
             elif self.mode == "direct_chat":
-                response = client.chat.completions.create(model=model, messages=messages)
+                response = await self._request(lambda client, m: client.chat.completions.create(
+                    model=m, messages=messages))
+                self._record_usage(response.usage)
                 reply = response.choices[0].message.content
                 self.finished_reply.emit(reply)
                 return
 
+            # -------- 历史摘要 --------
+            elif self.mode == "summarize":
+                response = await self._request(lambda client, m: client.chat.completions.create(
+                    model=m,
+                    messages=messages,
+                    temperature=0.3
+                ))
+                self._record_usage(response.usage)
+                self.finished_reply.emit(response.choices[0].message.content or "")
+                return
+
             # --------  生成选项 + 内容 --------
             elif self.mode == "generate_options":
                 self.log_message.emit("正在生成回复方案...")
 
                 emit_debug_info(messages, request_type)
 
-                response = client.chat.completions.create(
-                    model=model,
-                    messages=messages,
-                    temperature=0.8
-                )
+                cache = None
+                cache_key = None
+                if self.cfg.get("response_cache_enabled"):
+                    # 缓存读写是磁盘 IO，放到线程池中执行，不阻塞引擎上其他请求的流
+                    cache = await asyncio.to_thread(get_response_cache, self.cfg)
+                    cache_key = make_cache_key(messages, model, self.cfg.get("cache_time_bucket"))
+                    if self.use_cache:
+                        cached = await asyncio.to_thread(cache.get, cache_key)
+                        if cached:
+                            # 缓存命中单独分组，不拉低真实请求的延迟分布
+                            self.timing.mode = f"{self.mode}[cache]"
+                            self.timing.cached = True
+                            self.log_message.emit("命中本地选项缓存")
+                            for index, option in enumerate(cached):
+                                self.option_parsed.emit(index, option)
+                            self.finished_options.emit(cached)
+                            return
 
-                raw_content = response.choices[0].message.content.strip()
-                lines = [line.strip() for line in raw_content.split("\n") if line.strip()]
+                use_stream = self.cfg.get("stream_options") if self.stream is None else self.stream
+                # 重试时会从头重新解析，按序号覆盖已显示的选项
+                parser = await self._request(
+                    lambda client, m: self._generate_options(client, m, builder, messages, use_stream))
+                self._record_parse_quality(parser)
+                parsed_options = list(parser.options)
 
-                parsed_options = []
+                # 只有部分选项有效时，只补请求缺少的几个，而不是整组重新生成
+                for _ in range(int(self.cfg.get("option_refill_attempts") or 0)):
+                    missing = OPTION_COUNT - len(parsed_options)
+                    if missing <= 0:
+                        break
+                    self.log_message.emit(f"{missing} 个选项格式无效，只重新请求缺少的部分...")
+                    refill_messages = builder.build_refill(messages, parsed_options, missing)
+                    metrics.incr("options.refill.requests")
+                    try:
+                        parser = await self._request(
+                            lambda client, m, msgs=refill_messages, start=len(parsed_options), n=missing:
+                            self._generate_options(client, m, builder, msgs, use_stream, start, n))
+                    except Exception as e:
+                        # 补全失败不影响已得到的有效选项
+                        self.log_message.emit(f"补全选项失败: {e}")
+                        break
+                    metrics.incr("options.refill.recovered", len(parser.options))
+                    parsed_options.extend(parser.options)
 
-                # 正则解析：匹配 [标签] 内容
-                # ^\[(.*?)\]\s*(.*)$ 
-                # Group 1 是标签，Group 2 是内容
-                pattern = re.compile(r'^\[(.*?)\]\s*(.*)$')
+                if len(parsed_options) < OPTION_COUNT:
+                    metrics.incr("options.padded", OPTION_COUNT - len(parsed_options))
 
-                for line in lines[:3]:  # 只取前3行
-                    match = pattern.match(line)
-                    if match:
-                        label = match.group(1)
-                        content = match.group(2)
-                        parsed_options.append({"label": label, "content": content})
-                    else:
-                        # 容错处理：如果AI没按格式输出，把前几个字当标签
-                        # 比如: "热情：你好" -> label="热情", content="你好"
-                        parts = line.split(" ", 1)
-                        if len(parts) == 2:
-                            parsed_options.append({"label": parts[0], "content": parts[1]})
-                        else:
-                            # 极度甚至情况，直接把整句当标签，内容为空（需前端处理）
-                            parsed_options.append({"label": line[:5] + "..", "content": line})
-
-                # 不足3个的情况
-                while len(parsed_options) < 3:
-                    parsed_options.append({"label": "继续", "content": "..."})
-
-                self.finished_options.emit(parsed_options)
+                self.finished_options.emit(pad_options(parsed_options))
+
+                # 先上屏再写缓存；只缓存格式完整的结果，占位补齐的不缓存
+                if cache and self.use_cache and len(parsed_options) >= OPTION_COUNT:
+                    await asyncio.to_thread(cache.put, cache_key, parsed_options)
                 return
 
         except Exception as e:
+            self.timing.error = e.__class__.__name__
             self.error_occurred.emit(str(e))
-            self.log_message.emit(f"连接错误: {str(e)}")
\ No newline at end of file
+            self.log_message.emit(f"连接错误: {str(e)}")
+
+    async def _warm_connection(self):
+        """
+        用 GET /models 在共享连接池中建立到主端点的连接。
+        端点不支持该接口时返回的 4xx 同样说明连接已建立，不算失败。
+        """
+        import openai
+        async with client_pool.lease(self.cfg) as client:
+            try:
+                await client.models.list()
+            except openai.APIStatusError as e:
+                self.log_message.emit(f"端点不支持 /models（{e.status_code}），连接已建立")
+
+    async def _request(self, request_fn):
+        """带超时、退避重试与端点故障转移地执行请求"""
+        return await call_with_failover(self.cfg, request_fn, log=self.log_message.emit,
+                                        output_started=lambda: self._output_started)
+
+    async def _generate_options(self, client, model, builder, messages, stream,
+                                start_index=0, count=OPTION_COUNT):
+        """
+        请求并解析 count 个选项，返回 OptionStreamParser。
+        流式模式下每解析出一个完整的选项就立即发出（序号从 start_index 起），凑齐后提前断开。
+        """
+        parser = OptionStreamParser(count)
+        self._output_started = False
+        if start_index == 0:
+            # 重试时从头计算；补全请求则累加在首次请求之后
+            self.timing.first_token_ms = None
+            self.timing.parse_ms = 0.0
+
+        if not stream:
+            response = await self._create_options(client, model, builder, messages, temperature=0.8)
+            self._record_usage(response.usage)
+            parse_start = time.perf_counter()
+            parser.feed(response.choices[0].message.content or "")
+            parser.finish()
+            self.timing.parse_ms += (time.perf_counter() - parse_start) * 1000
+            return parser
+
+        response = await self._create_options(
+            client, model, builder, messages,
+            temperature=0.8,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in response:
+                # 开启 include_usage 后，最后一个 chunk 只携带 usage
+                if getattr(chunk, "usage", None):
+                    self._record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    self.timing.mark_first_token()
+                parse_start = time.perf_counter()
+                parsed = parser.feed(delta)
+                self.timing.parse_ms += (time.perf_counter() - parse_start) * 1000
+                for index, option in parsed:
+                    self._output_started = True
+                    self.option_parsed.emit(start_index + index, option)
+                if parser.is_complete:
+                    break
+            for index, option in parser.finish():
+                self.option_parsed.emit(start_index + index, option)
+        finally:
+            # 提前结束或被取消时关闭流，不再继续消耗 token
+            await response.close()
+        return parser
+
+    async def _create_options(self, client, model, builder, messages, **kwargs):
+        """
+        发出选项请求。配置了结构化输出时附带 response_format；
+        端点明确拒绝该参数（400）时记住该端点，改为只靠提示词约束格式，由本地解析器兜底。
+        stream_options 同理：被拒绝时去掉后重发，该端点不再统计流式请求的 usage。
+        """
+        import openai
+        base_url = str(client.base_url)
+        if base_url in stream_usage_unsupported:
+            kwargs.pop("stream_options", None)
+        response_format = builder.response_format()
+        if response_format and base_url not in structured_output_unsupported:
+            kwargs["response_format"] = response_format
+        while True:
+            try:
+                return await client.chat.completions.create(model=model, messages=messages, **kwargs)
+            except openai.BadRequestError as e:
+                if "stream_options" in kwargs and rejects_param(e, "stream_options"):
+                    stream_usage_unsupported.add(base_url)
+                    kwargs.pop("stream_options")
+                    self.log_message.emit(f"端点不支持 stream_options（{e.status_code}），流式请求不再统计用量")
+                elif "response_format" in kwargs and rejects_param(e, "response_format"):
+                    # 上下文超长、模型不存在等其他 400 与结构化输出无关，照常报错
+                    structured_output_unsupported.add(base_url)
+                    kwargs.pop("response_format")
+                    self.log_message.emit(f"端点不支持结构化输出（{e.status_code}），改用提示词约束格式")
+                else:
+                    raise
+
+    def _record_parse_quality(self, parser):
+        """统计首次回复的格式质量：clean / repaired / partial / failed"""
+        quality = parser.quality
+        metrics.incr("options.parse.total")
+        metrics.incr(f"options.parse.{quality}")
+        metrics.incr("options.parse.dropped", parser.dropped)
+        if quality != "clean":
+            self.log_message.emit(
+                f"选项格式{'已在本地修复' if quality == 'repaired' else '不完整'}："
+                f"有效 {len(parser.options)} 个，丢弃 {parser.dropped} 处无效内容")
+
+    def _record_usage(self, usage):
+        """记录 usage 中的 prompt 缓存命中情况"""
+        if not usage:
+            return
+        self.timing.add_usage(usage)
+        prompt_tokens = usage.prompt_tokens or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+        metrics.incr("usage.requests")
+        metrics.incr("usage.prompt_tokens", prompt_tokens)
+        metrics.incr("usage.cached_tokens", cached_tokens)
+        metrics.incr("usage.completion_tokens", usage.completion_tokens or 0)
+
+        ratio = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        self.log_message.emit(
+            f"提示缓存命中: {cached_tokens}/{prompt_tokens} tokens ({ratio:.0%})，"
+            f"累计命中率 {metrics.prompt_cache_ratio():.0%}"
+        )
@@ -0,0 +1,109 @@
+# ----------------------------
+# 共享连接池
+# ----------------------------
+import threading
+from contextlib import asynccontextmanager
+
+from core.request_timing import trace_request_hook
+
+
+class ClientPool:
+    """
+    进程级 OpenAI 客户端注册表。
+    以 (api_key, base_url, 超时设置) 为键缓存客户端，所有请求共用同一个
+    HTTP 连接池，避免每次请求都重新握手。
+    客户端为异步版本，只在引擎线程的事件循环中使用。
+    请求期间通过 lease() 持有客户端，配置变更时仍在使用的旧客户端
+    等最后一个请求结束后再关闭，不会中断正在进行的流式响应。
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients = {}
+        # 客户端 -> 正在使用它的请求数
+        self._in_use = {}
+        # 已从注册表移除、等待使用结束后关闭的客户端
+        self._retired = set()
+
+    @staticmethod
+    def make_key(cfg, base_url=None, api_key=None):
+        return (
+            api_key or cfg.get("api_key"),
+            base_url or cfg.get("base_url"),
+            float(cfg.get("connect_timeout")),
+            float(cfg.get("read_timeout")),
+        )
+
+    def get_client(self, cfg, base_url=None, api_key=None):
+        """获取（必要时创建）与当前配置对应的客户端，可指定备用端点"""
+        key = self.make_key(cfg, base_url, api_key)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                from openai import AsyncOpenAI, DefaultAsyncHttpxClient, Timeout
+
+                api_key, base_url, connect_timeout, read_timeout = key
+                timeout = Timeout(read_timeout, connect=connect_timeout)
+                client = AsyncOpenAI(
+                    api_key=api_key,
+                    base_url=base_url,
+                    timeout=timeout,
+                    # 重试由 endpoint_router 统一负责
+                    max_retries=0,
+                    http_client=DefaultAsyncHttpxClient(
+                        timeout=timeout,
+                        # 为计时中的请求记录取得连接与首字节的时刻
+                        event_hooks={"request": [trace_request_hook]}
+                    )
+                )
+                self._clients[key] = client
+            return client
+
+    @asynccontextmanager
+    async def lease(self, cfg, base_url=None, api_key=None):
+        """在一次请求期间持有客户端；若它在此期间被淘汰，由最后一个使用者关闭"""
+        with self._lock:
+            client = self.get_client(cfg, base_url, api_key)
+            self._in_use[client] = self._in_use.get(client, 0) + 1
+        try:
+            yield client
+        finally:
+            with self._lock:
+                self._in_use[client] -= 1
+                close = self._in_use[client] == 0
+                if close:
+                    del self._in_use[client]
+                close = close and client in self._retired
+                if close:
+                    self._retired.discard(client)
+            if close:
+                await client.close()
+
+    def retain_only(self, cfg):
+        """
+        配置变更后调用：移除与当前配置（含备用端点）不符的旧客户端。
+        返回其中已空闲的客户端，由调用方在事件循环中关闭；
+        仍有请求在使用的，等这些请求结束后由 lease() 关闭。
+        """
+        from core.endpoint_router import get_endpoints
+        keep = {self.make_key(cfg, e.base_url, e.api_key) for e in get_endpoints(cfg)}
+        with self._lock:
+            stale = [self._clients.pop(k) for k in list(self._clients) if k not in keep]
+            idle = [c for c in stale if c not in self._in_use]
+            self._retired.update(c for c in stale if c in self._in_use)
+            return idle
+
+
+def warm_sdk_import():
+    """
+    openai SDK 的导入耗时约占冷启动的九成，模块级不再导入它；
+    窗口显示后调用本函数在后台线程中提前导入，首个请求时已就绪。
+    """
+    def _import():
+        import openai  # noqa: F401
+
+    threading.Thread(target=_import, name="GalChatSdkImport", daemon=True).start()
+
+
+# 全局单例
+client_pool = ClientPool()
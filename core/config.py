@@ -1,12 +1,42 @@
 # ----------------------------
 #  配置管理
 # ----------------------------
+import atexit
+import copy
 import json
 import os
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+
+# 变更后需要重建客户端并重新预热的键
+CONNECTION_KEYS = frozenset({
+    "api_key", "base_url", "model", "system_prompt",
+    "connect_timeout", "read_timeout", "fallback_endpoints"
+})
 
 class ConfigManager:
+    """
+    配置读写：
+    - 修改以事务提交，batch() 内的多次 set 只写一次文件，单独的 set 会延迟合并写入；
+    - 写文件使用临时文件 + 原子替换，中途崩溃不会留下半截的 config.json；
+    - 每次提交都替换整个字典（写时复制），请求线程通过 snapshot() 拿到不可变副本；
+    - subscribe() 注册的回调在提交后收到实际变化的键集合。
+    """
+
+    # 单独 set 的写盘延迟（秒）
+    SAVE_DELAY = 0.5
+
     def __init__(self, filename="config.json"):
         self.filename = filename
+        self._lock = threading.RLock()
+        # 串行化写盘：延迟保存的定时器线程与界面线程的立即保存不能交错
+        self._write_lock = threading.Lock()
+        self._listeners = []
+        self._batch_depth = 0
+        self._batch_values = {}
+        self._snapshot = None
+        self._save_timer = None
         self.default_config = {
             "api_key": "",
             "base_url": "https://api.openai.com/v1",
@@ -16,26 +46,175 @@ class ConfigManager:
             "user_name": "Master",
             "ai_name": "AI Assistant",
             "use_preset_directions": True,
-            "enable_clipboard_monitor": True
+            "enable_clipboard_monitor": True,
+            "clipboard_debounce_ms": 150,
+            "clipboard_max_chars": 2000,
+            "clipboard_oversize": "reject",
+            "clipboard_recent_size": 64,
+            "clipboard_duplicate_window": 30,
+            "connect_timeout": 10,
+            "read_timeout": 60,
+            "stream_options": True,
+            "option_output_format": "text",
+            "option_refill_attempts": 1,
+            "speculation_budget_per_minute": 6,
+            "regen_pool_size": 1,
+            "response_cache_enabled": True,
+            "response_cache_max_entries": 500,
+            "response_cache_ttl": 86400,
+            "cache_time_bucket": "hour",
+            "prompt_layout": "stable",
+            "context_token_budget": 3000,
+            "context_min_recent_turns": 2,
+            "summary_trigger_tokens": 800,
+            "lexicon_top_k": 0,
+            "option_source": "remote",
+            "local_option_deadline_ms": 2500,
+            "max_retries": 2,
+            "retry_base_delay": 0.5,
+            "retry_max_delay": 8,
+            "endpoint_cooldown": 60,
+            "fallback_endpoints": [],
+            "engine_max_concurrency": 4,
+            "engine_max_per_session": 2,
+            "console_max_blocks": 2000,
+            "console_flush_ms": 100,
+            "log_level": "INFO",
+            "log_dir": "logs",
+            "log_max_bytes": 1048576,
+            "log_backup_count": 5,
+            "log_view_max_lines": 1000,
+            "session_store_enabled": True,
+            "session_db": "sessions.db",
+            "session_resume_messages": 200,
+            "transcript_page_size": 50,
+            "open_sessions": [],
+            "session_idle_unload_minutes": 10,
+            "warmup_mode": "models",
+            "heartbeat_interval": 0
         }
         self.config = self.load_config()
+        atexit.register(self.flush)
 
     def load_config(self):
         if os.path.exists(self.filename):
             try:
                 with open(self.filename, 'r', encoding='utf-8') as f:
                     return json.load(f)
-            except:
-                return self.default_config
-        return self.default_config
+            except (OSError, ValueError):
+                pass
+        return copy.deepcopy(self.default_config)
 
     def save_config(self):
-        with open(self.filename, 'w', encoding='utf-8') as f:
-            json.dump(self.config, f, indent=4, ensure_ascii=False)
+        """
+        原子写入：先写临时文件再替换，读者要么看到旧文件，要么看到完整的新文件。
+        整个写入在 _write_lock 内完成，且在锁内才取配置，后写入的一定是更新的配置。
+        """
+        with self._write_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                data = json.dumps(self.config, indent=4, ensure_ascii=False)
+            tmp_path = self.filename + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.filename)
+
+    def _schedule_save(self):
+        with self._lock:
+            if self._save_timer is None:
+                self._save_timer = threading.Timer(self.SAVE_DELAY, self.save_config)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+
+    def flush(self):
+        """立即写入尚未落盘的修改"""
+        with self._lock:
+            pending = self._save_timer is not None
+        if pending:
+            self.save_config()
 
     def get(self, key):
         return self.config.get(key, self.default_config.get(key))
 
     def set(self, key, value):
-        self.config[key] = value
-        self.save_config()
\ No newline at end of file
+        self.update({key: value})
+
+    def update(self, values):
+        """提交一组修改；在 batch() 中时推迟到批次结束统一提交"""
+        with self._lock:
+            if self._batch_depth:
+                self._batch_values.update(values)
+                return
+        self._commit(values, delay_save=len(values) == 1)
+
+    @contextmanager
+    def batch(self):
+        """with cfg.batch(): 多次 set 合并为一次写盘和一次变更通知"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                values = self._batch_values if self._batch_depth == 0 else None
+                if values is not None:
+                    self._batch_values = {}
+            if values:
+                self._commit(values, delay_save=False)
+
+    def _commit(self, values, delay_save):
+        with self._lock:
+            changed = {k for k, v in values.items() if self.get(k) != v}
+            if not changed:
+                return
+            new_config = dict(self.config)
+            for key in changed:
+                new_config[key] = copy.deepcopy(values[key])
+            self.config = new_config
+            self._snapshot = None
+            listeners = list(self._listeners)
+
+        if delay_save:
+            self._schedule_save()
+        else:
+            self.save_config()
+        for callback in listeners:
+            callback(frozenset(changed))
+
+    def snapshot(self):
+        """当前配置（含默认值）的只读副本，之后的修改不会影响已经拿到快照的请求"""
+        with self._lock:
+            if self._snapshot is None:
+                merged = copy.deepcopy(self.default_config)
+                merged.update(copy.deepcopy(self.config))
+                self._snapshot = ConfigSnapshot(merged)
+            return self._snapshot
+
+    def subscribe(self, callback):
+        """callback(changed_keys) 在提交修改的线程中调用"""
+        with self._lock:
+            self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        with self._lock:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+
+class ConfigSnapshot:
+    """与 ConfigManager 相同的 get 接口，但只读"""
+    __slots__ = ("_data",)
+
+    def __init__(self, data):
+        self._data = MappingProxyType(data)
+
+    def get(self, key):
+        return self._data.get(key)
+
+    def snapshot(self):
+        return self
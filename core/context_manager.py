@@ -0,0 +1,116 @@
+# ----------------------------
+# 上下文窗口管理
+# ----------------------------
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:
+    # tiktoken 为可选依赖，未安装时使用估算
+    _ENCODING = None
+
+# 每条消息的固定开销（role、分隔符等）
+MESSAGE_OVERHEAD = 4
+SUMMARY_PREFIX = "此前对话摘要："
+
+
+def estimate_tokens(text):
+    """本地估算 token 数：中日韩字符按 1 个计，其余按 4 字符 1 个计"""
+    if not text:
+        return 0
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E7F)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def message_tokens(message):
+    return estimate_tokens(message.get("content", "")) + MESSAGE_OVERHEAD
+
+
+class ContextWindow:
+    """
+    按 token 预算裁剪历史：始终保留最近的若干轮，
+    超出窗口的旧消息累计到阈值后交给后台请求折叠成滚动摘要。
+    """
+
+    def __init__(self, config_manager):
+        self.cfg = config_manager
+        self.summary = ""
+        self.summarized_upto = 0  # history 中已折叠进摘要的消息数
+        self.window_start = 0
+        self.last_usage = {"used": 0, "budget": 0, "messages": 0, "dropped": 0}
+        self._token_cache = {}
+
+    def reset(self):
+        self.summary = ""
+        self.summarized_upto = 0
+        self.window_start = 0
+        self._token_cache = {}
+
+    def _tokens(self, history, index):
+        # history 只追加不修改，按下标缓存每条消息的 token 数
+        if index not in self._token_cache:
+            self._token_cache[index] = message_tokens(history[index])
+        return self._token_cache[index]
+
+    def summary_message(self):
+        if not self.summary:
+            return None
+        return {"role": "system", "content": f"{SUMMARY_PREFIX}{self.summary}"}
+
+    def build(self, history):
+        """返回放入请求的上下文列表，并更新 last_usage"""
+        budget = int(self.cfg.get("context_token_budget"))
+        min_recent = int(self.cfg.get("context_min_recent_turns")) * 2
+
+        summary_msg = self.summary_message()
+        used = message_tokens(summary_msg) if summary_msg else 0
+
+        start = len(history)
+        while start > self.summarized_upto:
+            cost = self._tokens(history, start - 1)
+            kept = len(history) - start
+            if kept >= min_recent and used + cost > budget:
+                break
+            used += cost
+            start -= 1
+
+        # 按完整的一轮（user + assistant）对齐，避免窗口以 assistant 开头
+        if start < len(history) and history[start]["role"] == "assistant" \
+                and len(history) - start > min_recent:
+            used -= self._tokens(history, start)
+            start += 1
+
+        self.window_start = start
+        context = ([summary_msg] if summary_msg else []) + history[start:]
+        self.last_usage = {
+            "used": used,
+            "budget": budget,
+            "messages": len(history) - start,
+            "dropped": start - self.summarized_upto,
+        }
+        return context
+
+    def pending_fold(self, history):
+        """窗口外尚未摘要的消息达到阈值时，返回需要折叠的消息及其终点"""
+        older = history[self.summarized_upto:self.window_start]
+        if not older:
+            return None
+        older_tokens = sum(self._tokens(history, i)
+                           for i in range(self.summarized_upto, self.window_start))
+        if older_tokens < int(self.cfg.get("summary_trigger_tokens")):
+            return None
+        return older, self.window_start
+
+    def apply_summary(self, summary, upto):
+        self.summary = summary.strip()
+        self.summarized_upto = max(self.summarized_upto, upto)
+
+    def usage_text(self):
+        u = self.last_usage
+        text = f"{u['used']} / {u['budget']} tokens（{u['messages']} 条消息"
+        if u["dropped"]:
+            text += f"，{u['dropped']} 条待摘要"
+        if self.summary:
+            text += "，含摘要"
+        return text + "）"
@@ -3,12 +3,32 @@
 # ----------------------------
 import json
 import os
+import threading
+from core.lexicon_index import LexiconIndex, char_ngrams
 
 class DirectionManager:
-    def __init__(self, filename="lexicon.json"):
+    def __init__(self, filename="lexicon.json", background=False):
+        """background=True 时在后台线程读取词库并建好索引，不占用界面构建的时间"""
         self.filename = filename
         self.directions = []
-        self.load_directions()
+        self._index = None
+        self._ready = threading.Event()
+        if background:
+            threading.Thread(target=self._load, name="GalChatLexiconLoader", daemon=True).start()
+        else:
+            self._load()
+
+    def _load(self):
+        try:
+            self.load_directions()
+            if self.directions:
+                self._get_index()
+        finally:
+            self._ready.set()
+
+    def wait_ready(self, timeout=None):
+        """词库加载完成前调用查询接口会在这里等待（通常只有几毫秒）"""
+        return self._ready.wait(timeout)
 
     def load_directions(self):
         """加载词库文件"""
@@ -18,6 +38,7 @@ class DirectionManager:
                     data = json.load(f)
                     if isinstance(data, list):
                         self.directions = data
+                        self._index = None
                     else:
                         print("词库格式错误：应为字符串列表")
             except Exception as e:
@@ -35,8 +56,65 @@ class DirectionManager:
         except Exception as e:
             print(f"创建默认词库失败: {e}")
 
-    def get_all_directions_string(self):
-        """将所有选项拼接成一个字符串，供 Prompt 使用"""
+    def get_all_directions_string(self, canonical=False):
+        """
+        将所有选项拼接成一个字符串，供 Prompt 使用。
+        canonical=True 时去重、去空白并排序，词库文件顺序变化也不影响输出，
+        便于服务端的前缀缓存命中。
+        """
+        self.wait_ready()
+        if not self.directions:
+            return ""
+        if canonical:
+            entries = sorted({d.strip() for d in self.directions if d and d.strip()})
+            return "、".join(entries)
+        return "、".join(self.directions)
+
+    def get_relevant_directions_string(self, query, k):
+        """检索与当前输入最相关的 k 个方向，索引在首次检索时构建"""
+        self.wait_ready()
         if not self.directions:
             return ""
-        return "、".join(self.directions)
\ No newline at end of file
+        return "、".join(self._get_index().top_k(query, k))
+
+    def _get_index(self):
+        if self._index is None:
+            self._index = LexiconIndex(self.directions)
+        return self._index
+
+    def generate_local_options(self, query, n=3, exclude=()):
+        """
+        不调用模型，直接从词库中挑选 n 个相关且彼此不同的方向作为选项。
+        用于接口缓慢或不可用时兜底。
+        """
+        self.wait_ready()
+        if not self.directions:
+            return []
+        index = self._get_index()
+
+        excluded = set(exclude)
+        chosen = []
+        chosen_grams = []
+        candidates = index.search(query, k=n * 10)
+        # 命中不足时从词库中按输入内容做确定性的轮转补充
+        offset = sum(map(ord, query)) % len(self.directions)
+        fill = min(len(self.directions), n * 20)
+        candidates += [(offset + i) % len(self.directions) for i in range(fill)]
+
+        for doc_id in candidates:
+            if len(chosen) >= n:
+                break
+            entry = self.directions[doc_id]
+            if entry in excluded or entry in chosen:
+                continue
+            grams = set(char_ngrams(entry))
+            # 与已选方向过于相似的跳过，保证选项之间有差异
+            if any(len(grams & g) / max(1, len(grams | g)) > 0.5 for g in chosen_grams):
+                continue
+            chosen.append(entry)
+            chosen_grams.append(grams)
+
+        return [
+            {"label": entry if len(entry) <= 8 else entry[:7] + "..", "content": entry}
+            for entry in chosen
+        ]
@@ -0,0 +1,167 @@
+# ----------------------------
+# 重试与多端点故障转移
+# ----------------------------
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+from core.client_pool import client_pool
+
+# 可重试的 HTTP 状态码：超时、冲突、限流以及 5xx
+RETRYABLE_STATUS = {408, 409, 429}
+# 换一个端点可能就能成功的状态码：鉴权失败、模型不存在等
+FAILOVER_STATUS = {401, 403, 404}
+
+
+class Endpoint:
+    def __init__(self, base_url, model, api_key):
+        self.base_url = base_url
+        self.model = model
+        self.api_key = api_key
+
+    def __repr__(self):
+        return f"{self.base_url} ({self.model})"
+
+
+class EndpointHealth:
+    """记录每个端点的健康状态，连续失败的端点在冷却期内被跳过"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dead_until = {}
+
+    def is_available(self, base_url):
+        with self._lock:
+            return self._dead_until.get(base_url, 0) <= time.monotonic()
+
+    def mark_failure(self, base_url, cooldown):
+        with self._lock:
+            self._dead_until[base_url] = time.monotonic() + cooldown
+
+    def mark_success(self, base_url):
+        with self._lock:
+            self._dead_until.pop(base_url, None)
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {url: round(until - now, 1) for url, until in self._dead_until.items() if until > now}
+
+
+endpoint_health = EndpointHealth()
+
+
+def get_endpoints(cfg):
+    """主端点 + 配置中的备用端点（按顺序），备用端点未填 key 时沿用主 key"""
+    primary_key = cfg.get("api_key")
+    endpoints = [Endpoint(cfg.get("base_url"), cfg.get("model"), primary_key)]
+    for item in cfg.get("fallback_endpoints") or []:
+        if not item.get("base_url"):
+            continue
+        endpoints.append(Endpoint(
+            item["base_url"],
+            item.get("model") or cfg.get("model"),
+            item.get("api_key") or primary_key
+        ))
+    return endpoints
+
+
+def is_retryable(error):
+    import httpx
+    import openai
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError)):
+        # 包含超时与连接被重置；读流过程中断开时 SDK 不包装，直接抛出 httpx 的异常
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    return False
+
+
+def rejects_param(error, name):
+    """400 是否由请求中的某个参数引起（依据 param、code 或错误信息判断）"""
+    text = " ".join(str(part) for part in (
+        getattr(error, "param", None), getattr(error, "code", None), getattr(error, "message", None)) if part)
+    return name in text
+
+
+def retry_after_seconds(error):
+    """解析 Retry-After / retry-after-ms 响应头，没有时返回 None"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(cfg, attempt, error):
+    """指数退避 + 抖动；服务端给出 Retry-After 时以其为准"""
+    max_delay = float(cfg.get("retry_max_delay"))
+    hinted = retry_after_seconds(error)
+    if hinted is not None:
+        return min(hinted, max_delay)
+    base = float(cfg.get("retry_base_delay"))
+    return random.uniform(0, min(max_delay, base * (2 ** attempt)))
+
+
+async def call_with_failover(cfg, request_fn, log=None, output_started=None):
+    """
+    依次尝试各端点，每个端点按退避策略重试可重试错误。
+    request_fn(client, model) 返回执行实际请求的协程。
+    output_started() 为 True 表示本次尝试已向界面输出过内容，此时流中途断开或超时不再重试。
+    """
+    # SDK 导入较慢，只在真正发请求时（引擎线程中）导入
+    import httpx
+    import openai
+    log = log or (lambda text: None)
+    endpoints = get_endpoints(cfg)
+    available = [e for e in endpoints if endpoint_health.is_available(e.base_url)]
+    # 全部处于冷却期时仍按顺序尝试，避免直接失败
+    candidates = available or endpoints
+
+    max_retries = int(cfg.get("max_retries"))
+    cooldown = float(cfg.get("endpoint_cooldown"))
+    last_error = None
+
+    for endpoint in candidates:
+        async with client_pool.lease(cfg, base_url=endpoint.base_url, api_key=endpoint.api_key) as client:
+            for attempt in range(max_retries + 1):
+                try:
+                    result = await request_fn(client, endpoint.model)
+                    endpoint_health.mark_success(endpoint.base_url)
+                    return result
+                except openai.APIStatusError as e:
+                    last_error = e
+                    if e.status_code in FAILOVER_STATUS:
+                        break
+                    if not is_retryable(e):
+                        raise
+                except (openai.APIConnectionError, httpx.TransportError, asyncio.TimeoutError) as e:
+                    # 流读到一半断开时，SDK 视版本抛出 APIConnectionError 或原始的 httpx 异常；
+                    # 已输出的选项会被重试结果按序号覆盖，内容前后不一致，直接报错
+                    if output_started and output_started():
+                        raise
+                    last_error = e
+
+                if attempt < max_retries:
+                    delay = backoff_delay(cfg, attempt, last_error)
+                    log(f"请求失败（{last_error.__class__.__name__}），{delay:.1f}s 后第 {attempt + 1} 次重试...")
+                    await asyncio.sleep(delay)
+
+        endpoint_health.mark_failure(endpoint.base_url, cooldown)
+        if endpoint is not candidates[-1]:
+            log(f"端点 {endpoint} 不可用，切换到下一个端点")
+
+    raise last_error
@@ -0,0 +1,241 @@
+# ----------------------------
+# 异步请求引擎
+# ----------------------------
+import asyncio
+import itertools
+import threading
+import time
+from enum import IntEnum
+
+from core.metrics import metrics
+
+
+class Priority(IntEnum):
+    """数值越小越优先"""
+    INTERACTIVE = 0  # 生成选项
+    CONSOLE = 1      # 控制台 direct_chat
+    BACKGROUND = 2   # 备选池、历史摘要
+    PRELOAD = 3      # 连接预热
+
+
+class Job:
+    def __init__(self, fn, priority, coalesce_key, supersede, owner=None):
+        self.fn = fn
+        self.priority = priority
+        self.coalesce_key = coalesce_key
+        self.supersede = supersede
+        # 发起任务的会话，用于会话之间的公平调度；None 表示不属于任何会话
+        self.owner = owner
+        self.seq = 0
+        self.state = "pending"  # pending / running / done / cancelled
+        self.task = None
+        self.callbacks = []
+        self.enqueued_at = time.monotonic()
+
+
+class JobHandle:
+    """提交到引擎的任务句柄，cancel() 会真正中断正在进行的 HTTP 请求"""
+
+    def __init__(self, engine, job):
+        self._engine = engine
+        self._job = job
+
+    def cancel(self):
+        self._engine._call(self._engine._cancel, self._job)
+
+    def done(self):
+        return self._job.state in ("done", "cancelled")
+
+    def cancelled(self):
+        return self._job.state == "cancelled"
+
+    def promote(self, priority):
+        """调整仍在排队的任务的优先级（例如后台预测的结果被用户采用）"""
+        self._engine._call(self._engine._promote, self._job, priority)
+
+    def add_done_callback(self, fn):
+        """任务结束（含被取消、被合并）时回调，在引擎线程中执行"""
+        self._engine._call(self._engine._add_callback, self._job, fn)
+
+
+class EngineService:
+    """
+    单个后台线程 + asyncio 事件循环，所有 AI 请求都以协程形式在这里执行，
+    不再为每个请求创建新线程。结果通过 Qt 信号（跨线程自动排队）回到界面。
+
+    调度规则：
+    - 按优先级出队，同时运行的任务数不超过 max_concurrency；
+    - 同一优先级内按会话轮转：最久没有被调度的会话先出队，任务多的会话不会饿死其他会话；
+    - 每个会话同时运行的后台任务（低于 INTERACTIVE）不超过 max_per_owner，
+      生成选项等交互任务不受此限制，始终能拿到空闲的并发名额；
+    - 相同 coalesce_key 的新任务替换排队中的旧任务，supersede=True 时连运行中的也取消；
+    - 有真实请求开始执行时，排队中的预热任务直接丢弃（连接已经被预热）。
+    """
+
+    def __init__(self, max_concurrency=4, max_per_owner=2):
+        self.max_concurrency = max_concurrency
+        self.max_per_owner = max_per_owner
+        self._loop = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = []
+        self._running = set()
+        self._seq = itertools.count()
+        # 每次出队加一；会话 -> 最近一次被调度时的出队序号，以及正在运行的后台任务数
+        self._dispatch_seq = itertools.count()
+        self._served = {}
+        self._owner_running = {}
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run_loop, name="GalChatEngine", daemon=True)
+            self._thread.start()
+        self._ready.wait()
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._ready.set()
+        self._loop.run_forever()
+
+    @property
+    def loop(self):
+        self._ensure_started()
+        return self._loop
+
+    def _call(self, fn, *args):
+        self.loop.call_soon_threadsafe(fn, *args)
+
+    def submit(self, fn, priority=Priority.INTERACTIVE, coalesce_key=None, supersede=False, owner=None):
+        """
+        提交任务，fn() 返回要执行的协程（出队时才创建，被丢弃的任务不会留下未等待的协程）。
+        owner 为发起任务的会话，用于公平调度。返回可取消的 JobHandle。
+        """
+        job = Job(fn, priority, coalesce_key, supersede, owner)
+        self._call(self._enqueue, job)
+        return JobHandle(self, job)
+
+    # ---- 以下方法只在引擎线程中执行 ----
+
+    def _enqueue(self, job):
+        if job.coalesce_key is not None:
+            for old in [j for j in self._pending if j.coalesce_key == job.coalesce_key]:
+                self._drop_pending(old)
+            if job.supersede:
+                for old in [j for j in self._running if j.coalesce_key == job.coalesce_key]:
+                    metrics.incr("engine.superseded")
+                    old.task.cancel()
+
+        job.seq = next(self._seq)
+        self._pending.append(job)
+        self._dispatch()
+
+    def _limited(self, job):
+        """后台任务是否受会话并发上限限制而暂时不能出队"""
+        return (job.owner is not None and job.priority > Priority.INTERACTIVE
+                and self._owner_running.get(job.owner, 0) >= self.max_per_owner)
+
+    def _next_job(self):
+        """
+        选出下一个要执行的任务：优先级最高，其次是最久没被调度的会话，最后按提交顺序。
+        排队的任务通常只有几十个，线性扫描即可。
+        """
+        candidates = [j for j in self._pending if not self._limited(j)]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda j: (j.priority, self._served.get(j.owner, -1), j.seq))
+
+    def _dispatch(self):
+        while self._pending and len(self._running) < self.max_concurrency:
+            job = self._next_job()
+            if job is None:
+                break
+            self._pending.remove(job)
+            try:
+                job.task = self._loop.create_task(job.fn())
+            except Exception:
+                # fn 不是协程工厂等编程错误：任务直接结束，不占用并发名额
+                metrics.incr("engine.failed")
+                self._finish(job, "done")
+                continue
+            job.state = "running"
+            self._running.add(job)
+            if job.owner is not None:
+                self._served[job.owner] = next(self._dispatch_seq)
+                if job.priority > Priority.INTERACTIVE:
+                    self._owner_running[job.owner] = self._owner_running.get(job.owner, 0) + 1
+
+            wait_ms = (time.monotonic() - job.enqueued_at) * 1000
+            metrics.incr("engine.jobs_started")
+            metrics.incr("engine.wait_ms_total", wait_ms)
+            metrics.set_max("engine.wait_ms_max", wait_ms)
+
+            job.task.add_done_callback(lambda _, j=job: self._on_task_done(j))
+
+            if job.priority < Priority.PRELOAD:
+                for preload in [j for j in self._pending if j.priority == Priority.PRELOAD]:
+                    self._drop_pending(preload)
+
+        self._update_gauges()
+
+    def _drop_pending(self, job):
+        self._pending.remove(job)
+        metrics.incr("engine.coalesced")
+        self._finish(job, "cancelled")
+
+    def _on_task_done(self, job):
+        self._running.discard(job)
+        if job.owner is not None and job.priority > Priority.INTERACTIVE:
+            remaining = self._owner_running.get(job.owner, 0) - 1
+            if remaining > 0:
+                self._owner_running[job.owner] = remaining
+            else:
+                self._owner_running.pop(job.owner, None)
+        if not job.task.cancelled() and job.task.exception() is not None:
+            metrics.incr("engine.failed")
+        self._finish(job, "cancelled" if job.task.cancelled() else "done")
+        self._dispatch()
+
+    def _cancel(self, job):
+        if job.state == "pending":
+            self._pending.remove(job)
+            self._finish(job, "cancelled")
+            self._update_gauges()
+        elif job.state == "running":
+            job.task.cancel()
+
+    def _promote(self, job, priority):
+        if job.state == "pending":
+            job.priority = min(job.priority, priority)
+            self._dispatch()
+
+    def _finish(self, job, state):
+        job.state = state
+        callbacks, job.callbacks = job.callbacks, []
+        for fn in callbacks:
+            fn(job)
+
+    def _add_callback(self, job, fn):
+        if job.state in ("done", "cancelled"):
+            fn(job)
+        else:
+            job.callbacks.append(fn)
+
+    def _update_gauges(self):
+        metrics.set("engine.queue_depth", len(self._pending))
+        metrics.set("engine.running", len(self._running))
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = EngineService()
+        return _engine
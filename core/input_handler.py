@@ -1,35 +1,84 @@
 # ----------------------------
 # 输入处理
 # ----------------------------
+import time
+from collections import OrderedDict
 
-from PyQt6.QtCore import QObject, pyqtSignal
+from PyQt6.QtCore import QObject, QTimer, pyqtSignal
 from PyQt6.QtWidgets import QApplication
 
+from core.metrics import metrics
+
+
+class RecentHashes:
+    """最近出现过的文本（只保存哈希），超过容量时淘汰最早的，查询为 O(1)"""
+
+    def __init__(self, maxlen):
+        self.maxlen = maxlen
+        self._items = OrderedDict()
+
+    def add(self, key):
+        self._items[key] = time.monotonic()
+        self._items.move_to_end(key)
+        while len(self._items) > self.maxlen:
+            self._items.popitem(last=False)
+
+    def seen(self, key, within=None):
+        """是否出现过；指定 within（秒）时只看这段时间内的记录"""
+        added_at = self._items.get(key)
+        if added_at is None:
+            return False
+        return within is None or time.monotonic() - added_at <= within
+
+
+def text_key(text):
+    # 去掉首尾空白再比较，复制时多带的换行不影响判断
+    return hash(text.strip())
+
 
 class InputHandler(QObject):
     """
     输入处理器：负责监听外部输入源，并处理向外部输出（复制）的逻辑。
     目前实现方式：系统剪贴板 (Clipboard)。
     未来如果要改为其他方式，只需修改这个类，保持信号接口不变即可。
+
+    剪贴板事件先经过一个采集阶段：
+    1. 防抖：连续的 dataChanged 合并为一次读取，大量复制粘贴时不会逐条刷屏；
+    2. 非文本内容（图片、文件）不读取；
+    3. 超过长度上限的文本截断或丢弃；
+    4. 与最近的 AI 回复相同（自己写入的或之后又被粘贴回来的）不当作输入；
+    5. 短时间内重复出现的同一条输入只处理一次。
+    只有消费方调用 accept_input() 确认采用后才记为已处理的输入；
+    被消费方拒绝（例如会话正忙）的内容再次复制时仍然有效。
     """
 
     # 对外信号：当检测到新的有效用户消息时发出
     new_message_received = pyqtSignal(str)
 
-    def __init__(self):
+    def __init__(self, config_manager):
         super().__init__()
+        self.cfg = config_manager
         self.clipboard = QApplication.clipboard()
 
+        # 防抖定时器：最后一次变化后静默一段时间才读取
+        self.debounce_timer = QTimer(self)
+        self.debounce_timer.setSingleShot(True)
+        self.debounce_timer.timeout.connect(self._ingest)
+
         # 监听剪贴板变化
         self.clipboard.dataChanged.connect(self._on_source_changed)
 
-        # 记录最后一次 AI 生成的回复，用于过滤掉自己发出的内容
-        self.last_ai_reply = ""
+        # 最近的 AI 回复与最近的输入，用于过滤自己发出的内容和重复输入
+        recent_size = int(self.cfg.get("clipboard_recent_size"))
+        self.recent_outputs = RecentHashes(recent_size)
+        self.recent_inputs = RecentHashes(recent_size)
         self.is_enabled = True
 
     def set_enabled(self, enabled: bool):
         """设置是否启用监听"""
         self.is_enabled = enabled
+        if not enabled:
+            self.debounce_timer.stop()
 
     def update_ai_reply(self, text):
         """
@@ -41,28 +90,69 @@ class InputHandler(QObject):
         if not text:
             return
 
-        self.last_ai_reply = text
+        self.recent_outputs.add(text_key(text))
 
         # 写入剪贴板 (这是目前的输出方式)
-        # 注意：这一步会触发 dataChanged，但在 _on_source_changed 中会被过滤
+        # 注意：这一步会触发 dataChanged，但在采集阶段会被过滤
         self.clipboard.setText(text)
 
     def _on_source_changed(self):
+        metrics.incr("clipboard.events")
+        if not self.is_enabled:
+            self._drop("disabled")
+            return
+        if self.debounce_timer.isActive():
+            # 被后续变化取代，只处理最后一次
+            self._drop("debounced")
+        self.debounce_timer.start(int(self.cfg.get("clipboard_debounce_ms")))
 
+    def _ingest(self):
         if not self.is_enabled:
             return
 
-        # 获取内容
+        # 图片、文件等非文本内容不读取
+        mime = self.clipboard.mimeData()
+        if mime is None or not mime.hasText():
+            self._drop("non_text")
+            return
+
         current_text = self.clipboard.text()
 
         # 过滤空内容
-        if not current_text:
+        if not current_text.strip():
+            self._drop("empty")
             return
 
-        # 核心过滤逻辑：
-        # 如果当前获取的内容 == AI 刚刚回复的内容，说明这是我们自己写的，忽略
-        if current_text == self.last_ai_reply:
+        max_chars = int(self.cfg.get("clipboard_max_chars"))
+        if len(current_text) > max_chars:
+            if self.cfg.get("clipboard_oversize") != "truncate":
+                self._drop("oversize")
+                return
+            metrics.incr("clipboard.truncated")
+            current_text = current_text[:max_chars]
+
+        # 核心过滤逻辑：与最近的 AI 回复相同，说明是我们自己写的，忽略
+        key = text_key(current_text)
+        if self.recent_outputs.seen(key):
+            self._drop("echo")
+            return
+        if self.recent_inputs.seen(key, within=float(self.cfg.get("clipboard_duplicate_window"))):
+            self._drop("duplicate")
             return
 
-        # 只有内容确实不同，才通知主程序
+        # 只有内容确实不同，才通知主程序；是否采用由消费方确认
         self.new_message_received.emit(current_text)
+
+    def accept_input(self, text):
+        """消费方已采用该输入（放入输入框）：此后一段时间内重复复制的同一内容会被过滤"""
+        self.recent_inputs.add(text_key(text))
+        metrics.incr("clipboard.accepted")
+
+    def reject_input(self, reason):
+        """消费方没有采用该输入：不记录，之后再次复制仍会送达"""
+        self._drop(reason)
+
+    @staticmethod
+    def _drop(reason):
+        metrics.incr("clipboard.dropped")
+        metrics.incr(f"clipboard.dropped.{reason}")
@@ -0,0 +1,84 @@
+# ----------------------------
+# 词库检索索引
+# ----------------------------
+import heapq
+import math
+import re
+from collections import Counter
+
+# 只保留中日韩字符、字母和数字参与分词
+_CLEAN_PATTERN = re.compile(r"[^0-9a-z\u3040-\u30ff\u3400-\u9fff]+")
+
+
+def char_ngrams(text):
+    """字符级 1-gram + 2-gram，适合没有分词器的中文短句"""
+    grams = []
+    for segment in _CLEAN_PATTERN.split(text.lower()):
+        grams.extend(segment)
+        grams.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return grams
+
+
+class LexiconIndex:
+    """
+    基于字符 n-gram 的 BM25 倒排索引。
+    构建时预先算好每个倒排项的 BM25 权重，查询时只需累加。
+    """
+
+    # 出现在超过该比例词条中的 n-gram 几乎没有区分度，查询时跳过
+    MAX_DF_RATIO = 0.1
+
+    def __init__(self, entries, k1=1.2, b=0.75):
+        self.entries = list(entries)
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.idf = {}
+        self._build()
+
+    def _build(self):
+        doc_terms = [Counter(char_ngrams(entry)) for entry in self.entries]
+        doc_lens = [sum(terms.values()) for terms in doc_terms]
+        n_docs = len(self.entries)
+        avg_len = (sum(doc_lens) / n_docs) if n_docs else 0.0
+
+        postings = {}
+        for doc_id, terms in enumerate(doc_terms):
+            norm = self.k1 * (1 - self.b + self.b * doc_lens[doc_id] / avg_len) if avg_len else self.k1
+            for term, tf in terms.items():
+                weight = tf * (self.k1 + 1) / (tf + norm)
+                postings.setdefault(term, []).append((doc_id, weight))
+
+        self.postings = postings
+        self.idf = {
+            term: math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+            for term, plist in postings.items()
+        }
+
+    def search(self, query, k=30):
+        """返回与 query 最相关的前 k 个词条下标（按得分降序）"""
+        terms = [t for t in set(char_ngrams(query)) if t in self.postings]
+        max_df = max(1, int(len(self.entries) * self.MAX_DF_RATIO))
+        selective = [t for t in terms if len(self.postings[t]) <= max_df]
+        # 全是高频 n-gram 时退回使用全部，保证总有结果
+        terms = selective or terms
+
+        scores = {}
+        for term in terms:
+            plist = self.postings[term]
+            idf = self.idf[term]
+            for doc_id, weight in plist:
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * weight
+        return heapq.nlargest(k, scores, key=scores.get)
+
+    def top_k(self, query, k=30):
+        """返回前 k 个词条文本，命中不足时按词库顺序补齐"""
+        hits = self.search(query, k)
+        if len(hits) < k:
+            chosen = set(hits)
+            for doc_id in range(len(self.entries)):
+                if len(hits) >= k:
+                    break
+                if doc_id not in chosen:
+                    hits.append(doc_id)
+        return [self.entries[i] for i in hits]
@@ -0,0 +1,116 @@
+# ----------------------------
+# 异步日志管线
+# ----------------------------
+import atexit
+import json
+import os
+import queue
+import threading
+import time
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40}
+
+
+class LogPipeline:
+    """
+    结构化日志：调用方只把记录放进队列（不做任何 IO），
+    后台写线程成批取出，以 JSON Lines 写入按大小轮转的日志文件。
+    """
+
+    BATCH_SIZE = 500
+    FLUSH_INTERVAL = 0.5
+
+    def __init__(self, log_dir="logs", filename="galchat.log", level="INFO",
+                 max_bytes=1024 * 1024, backup_count=5):
+        self.log_dir = log_dir
+        self.path = os.path.join(log_dir, filename)
+        self.threshold = LEVELS.get(level, 20)
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.dropped = 0
+        self._queue = queue.SimpleQueue()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="GalChatLogWriter", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def set_level(self, level):
+        self.threshold = LEVELS.get(level, 20)
+
+    def enabled(self, level):
+        return LEVELS.get(level, 20) >= self.threshold
+
+    def log(self, level, message, **fields):
+        """热路径：低于阈值直接返回，否则只入队"""
+        if LEVELS.get(level, 20) < self.threshold:
+            return
+        self._queue.put((time.time(), level, message, fields, threading.current_thread().name))
+
+    def _run(self):
+        while not self._stop.is_set() or not self._queue.empty():
+            try:
+                first = self._queue.get(timeout=self.FLUSH_INTERVAL)
+            except queue.Empty:
+                continue
+            batch = [first]
+            while len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch):
+        lines = []
+        for ts, level, message, fields, thread in batch:
+            record = {
+                "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(ts)) + f".{int(ts * 1000) % 1000:03d}",
+                "level": level,
+                "msg": message,
+                "thread": thread,
+            }
+            if fields:
+                record["fields"] = fields
+            lines.append(json.dumps(record, ensure_ascii=False, default=str))
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                size = f.tell()
+            if size >= self.max_bytes:
+                self._rotate()
+        except OSError:
+            # 写日志失败不能影响主流程
+            self.dropped += len(batch)
+
+    def _rotate(self):
+        """galchat.log -> galchat.log.1 -> ... -> galchat.log.N（最旧的被删除）"""
+        for i in range(self.backup_count - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+
+    def close(self):
+        self._stop.set()
+        self._thread.join(timeout=2)
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_log_pipeline(cfg):
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = LogPipeline(
+                log_dir=cfg.get("log_dir"),
+                level=cfg.get("log_level"),
+                max_bytes=int(cfg.get("log_max_bytes")),
+                backup_count=int(cfg.get("log_backup_count"))
+            )
+        return _pipeline
@@ -0,0 +1,108 @@
+# ----------------------------
+# 运行指标
+# ----------------------------
+import threading
+from collections import deque
+
+
+class MetricsRegistry:
+    """进程级计数器，供各个 Worker 线程累加，UI 线程读取"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def incr(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._counters[name] = value
+
+    def set_max(self, name, value):
+        with self._lock:
+            self._counters[name] = max(self._counters.get(name, 0), value)
+
+    def get(self, name):
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counters)
+
+    def reset(self, prefix=""):
+        with self._lock:
+            for name in [n for n in self._counters if n.startswith(prefix)]:
+                del self._counters[name]
+
+    def prompt_cache_ratio(self):
+        """累计的提示缓存命中率：cached_tokens / prompt_tokens"""
+        prompt_tokens = self.get("usage.prompt_tokens")
+        if not prompt_tokens:
+            return 0.0
+        return self.get("usage.cached_tokens") / prompt_tokens
+
+
+def percentile(values, p):
+    """最近秩法百分位，values 为空时返回 None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), round(p / 100 * len(ordered) + 0.5)))
+    return ordered[rank - 1]
+
+
+class LatencyStats:
+    """
+    按 (mode, model) 分组的滚动统计：每个分段只保留最近 window 个样本，
+    同时记录这些请求中失败的比例。
+    """
+
+    FIELDS = ("queue_ms", "build_ms", "acquire_ms", "ttfb_ms", "first_token_ms",
+              "total_ms", "parse_ms", "prompt_tokens", "completion_tokens")
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def record(self, timing):
+        """timing 为 RequestTiming.to_dict() 的结果"""
+        key = (timing["mode"], timing["model"])
+        with self._lock:
+            group = self._groups.get(key)
+            if group is None:
+                group = {name: deque(maxlen=self.window) for name in self.FIELDS}
+                group["errors"] = deque(maxlen=self.window)
+                self._groups[key] = group
+            group["errors"].append(1 if timing.get("error") else 0)
+            for name in self.FIELDS:
+                value = timing.get(name)
+                # 失败请求的耗时不计入延迟分布
+                if value is not None and not timing.get("error"):
+                    group[name].append(value)
+
+    def report(self):
+        """返回 {(mode, model): {"count", "error_rate", 各分段: (p50, p95, p99)}}"""
+        with self._lock:
+            groups = {key: {name: list(values) for name, values in group.items()}
+                      for key, group in self._groups.items()}
+        result = {}
+        for key, group in groups.items():
+            errors = group.pop("errors")
+            row = {"count": len(errors), "error_rate": sum(errors) / len(errors) if errors else 0.0}
+            for name, values in group.items():
+                row[name] = tuple(percentile(values, p) for p in (50, 95, 99))
+            result[key] = row
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._groups = {}
+
+
+# 全局单例
+metrics = MetricsRegistry()
+latency_stats = LatencyStats()
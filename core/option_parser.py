@@ -0,0 +1,276 @@
+# ----------------------------
+# 选项解析
+# ----------------------------
+import json
+import re
+
+# 正则解析：匹配 [标签] 内容
+# Group 1 是标签，Group 2 是内容
+OPTION_PATTERN = re.compile(r'^\[(.*?)\]\s*(.*)$')
+OPTION_COUNT = 3
+
+# 结构化输出使用的 JSON Schema（response_format=json_schema）
+OPTION_JSON_SCHEMA = {
+    "name": "reply_options",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "options": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "label": {"type": "string"},
+                        "content": {"type": "string"},
+                    },
+                    "required": ["label", "content"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["options"],
+        "additionalProperties": False,
+    },
+}
+
+# ---- 宽松解析用到的常见变体 ----
+# 行首的序号或项目符号：1. / 2) / 3、 / - / * / •
+LIST_PREFIX = re.compile(r'^(?:\d+\s*[.)、．:：]|[-*•·])\s*')
+# 其他括号包住的标签：【标签】、「标签」、(标签)，后面可能跟冒号
+BRACKET_PATTERN = re.compile(r'^[\[【〔「(（]\s*([^\]】〕」)）]{1,16}?)\s*[\]】〕」)）]\s*[:：\-—]?\s*(.+)$')
+# 标签：内容（标签里不能有标点或空格，避免把“好的，下面是方案：”当成选项）
+COLON_PATTERN = re.compile(r'^([^\s:：，,。！？!?"{}\[\]]{1,12})\s*[:：]\s*(.+)$')
+# 选项对象中标签与正文可能使用的键名
+LABEL_KEYS = ("label", "direction", "title", "方向词", "方向")
+CONTENT_KEYS = ("content", "reply", "text", "回复正文", "回复", "正文")
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+
+
+def match_option_line(line):
+    """
+    解析一行文本，返回 (选项, 是否经过修复)；无法识别为选项时返回 (None, False)。
+    标准格式为 [标签] 内容；序号、粗体、其他括号、“标签：内容”等常见偏差在本地修复。
+    """
+    line = line.strip()
+    if not line:
+        return None, False
+
+    match = OPTION_PATTERN.match(line)
+    if match and match.group(1).strip() and match.group(2).strip():
+        return {"label": match.group(1).strip(), "content": match.group(2).strip()}, False
+
+    cleaned = LIST_PREFIX.sub("", line.replace("**", "")).strip()
+    for pattern in (OPTION_PATTERN, BRACKET_PATTERN, COLON_PATTERN):
+        match = pattern.match(cleaned)
+        if match and match.group(1).strip() and match.group(2).strip():
+            return {"label": match.group(1).strip(), "content": match.group(2).strip()}, True
+
+    # 无标签的闲聊或说明文字，不当作选项
+    return None, False
+
+
+def parse_option_line(line):
+    """将一行文本解析为 {"label", "content"}，无法识别时返回 None"""
+    return match_option_line(line)[0]
+
+
+def option_from_object(obj):
+    """从 JSON 对象中取出选项，返回 (选项, 是否经过修复)；缺少正文时返回 (None, False)"""
+    if not isinstance(obj, dict):
+        return None, False
+    label = next((obj[k] for k in LABEL_KEYS if isinstance(obj.get(k), str) and obj[k].strip()), None)
+    content = next((obj[k] for k in CONTENT_KEYS if isinstance(obj.get(k), str) and obj[k].strip()), None)
+    if content is None:
+        return None, False
+    repaired = "label" not in obj or "content" not in obj
+    if label is None:
+        # 只有正文时，取开头几个字作为方向词
+        label = content.strip()[:6]
+    # 模型偶尔会把方括号也写进标签
+    label = label.strip().strip("[]【】")
+    return {"label": label, "content": content.strip()}, repaired
+
+
+def load_json_object(text):
+    """解析单个 JSON 对象，失败时去掉多余的尾随逗号再试一次"""
+    try:
+        return json.loads(text), False
+    except ValueError:
+        pass
+    try:
+        return json.loads(TRAILING_COMMA.sub(r"\1", text)), True
+    except ValueError:
+        return None, False
+
+
+def detect_json(text):
+    """判断回复是否为 JSON（以 { 或 [{ 开头，允许 ``` 代码块包裹）；开头还不足以判断时返回 None"""
+    head = text.lstrip()
+    if head.startswith("```"):
+        if "\n" not in head:
+            return None
+        head = head.split("\n", 1)[1].lstrip()
+    if not head:
+        return None
+    if head[0] != "[":
+        return head[0] == "{"
+    rest = head[1:].lstrip()
+    return rest[0] == "{" if rest else None
+
+
+def parse_options(raw_content):
+    """一次性解析完整回复（文本或 JSON 均可），只取前3个"""
+    parser = OptionStreamParser()
+    parser.feed(raw_content)
+    parser.finish()
+    return parser.options
+
+
+def pad_options(parsed_options):
+    """不足3个的情况，用占位选项补齐"""
+    while len(parsed_options) < OPTION_COUNT:
+        parsed_options.append({"label": "继续", "content": "..."})
+    return parsed_options
+
+
+class OptionStreamParser:
+    """
+    增量解析器：逐块喂入流式文本，每凑齐一个完整的选项就解析出来。
+    按回复开头自动区分两种格式：
+    文本格式每凑齐一整行解析一次；JSON 格式每当选项数组中的一个对象闭合时解析一次。
+    文本格式中严格符合 [标签] 内容 的行立即采用；需要修复才能识别的行（序号、“标签：内容”等）
+    先留作候选，流结束时严格格式的选项仍不够才按出现顺序补位，避免开头的说明文字占掉选项。
+    截断的 JSON 对象不采用，缺少的选项交给调用方补全。
+    """
+
+    def __init__(self, count=OPTION_COUNT):
+        self.count = count
+        self.buffer = ""
+        self.options = []
+        self.json_mode = None
+        # 是否有选项经过本地修复，以及被丢弃的无效行/对象数
+        self.repaired = False
+        self.dropped = 0
+        # 宽松匹配到的候选选项
+        self._lenient = []
+        # JSON 扫描状态
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+
+    @property
+    def is_complete(self):
+        return len(self.options) >= self.count
+
+    def feed(self, chunk):
+        """喂入一段文本，返回本次新完成的 (序号, 选项) 列表"""
+        if not chunk or self.is_complete:
+            return []
+        self.buffer += chunk
+        if self.json_mode is None:
+            # 需要看到足够的开头才能区分 "[{" 与 "[标签]"
+            self.json_mode = detect_json(self.buffer)
+            if self.json_mode is None:
+                return []
+        return self._feed_json() if self.json_mode else self._feed_lines()
+
+    def finish(self):
+        """流结束时处理最后一行（可能没有换行符）"""
+        new_options = []
+        if self.json_mode is None:
+            self.json_mode = False
+            new_options = self._feed_lines()
+        if not self.is_complete and not self.json_mode and self.buffer.strip():
+            if detect_json(self.buffer):
+                new_options += self._switch_to_json("")
+            else:
+                self._take_line(self.buffer, new_options)
+        self.buffer = ""
+        while self._lenient and not self.is_complete:
+            self._add((self._lenient.pop(0), True), new_options)
+        # 没用上的候选与无效行一样计入丢弃
+        self.dropped += len(self._lenient)
+        self._lenient = []
+        return new_options
+
+    @property
+    def quality(self):
+        """clean 格式完全正确；repaired 经本地修复后完整；partial 仍有缺失；failed 一个都没有"""
+        if not self.options:
+            return "failed"
+        if not self.is_complete:
+            return "partial"
+        return "repaired" if self.repaired or self.dropped else "clean"
+
+    def _add(self, result, new_options):
+        option, repaired = result
+        if option is None:
+            return False
+        self.repaired = self.repaired or repaired
+        new_options.append((len(self.options), option))
+        self.options.append(option)
+        return True
+
+    def _take_line(self, line, new_options):
+        """严格格式的行立即采用，经修复才能识别的行留作候选"""
+        option, repaired = match_option_line(line)
+        if option is None:
+            if line.strip():
+                self.dropped += 1
+        elif repaired:
+            self._lenient.append(option)
+        else:
+            self._add((option, False), new_options)
+
+    def _feed_lines(self):
+        new_options = []
+        while "\n" in self.buffer and not self.is_complete:
+            line, self.buffer = self.buffer.split("\n", 1)
+            if detect_json(line):
+                # 开头的说明文字之后才是 JSON：从这一行起改按 JSON 解析
+                return new_options + self._switch_to_json(line + "\n")
+            self._take_line(line, new_options)
+        return new_options
+
+    def _switch_to_json(self, head):
+        self.json_mode = True
+        self.buffer = head + self.buffer
+        self._pos = 0
+        return self._feed_json()
+
+    def _feed_json(self):
+        """扫描新到达的字符，跟踪字符串与括号嵌套，取出数组中已闭合的对象"""
+        new_options = []
+        buf = self.buffer
+        for i in range(self._pos, len(buf)):
+            c = buf[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                continue
+            if c == '"':
+                self._in_string = True
+            elif c in "{[":
+                self._stack.append(c)
+                if c == "{" and len(self._stack) >= 2 and self._stack[-2] == "[":
+                    self._obj_start = i
+            elif c in "}]":
+                if c == "}" and self._obj_start is not None and len(self._stack) >= 2 and self._stack[-2] == "[":
+                    obj, fixed = load_json_object(buf[self._obj_start:i + 1])
+                    option, repaired = option_from_object(obj)
+                    if not self._add((option, repaired or fixed), new_options):
+                        self.dropped += 1
+                    self._obj_start = None
+                if self._stack:
+                    self._stack.pop()
+            if self.is_complete:
+                break
+        self._pos = len(buf)
+        return new_options
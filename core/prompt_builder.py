@@ -4,15 +4,20 @@
 from enum import Enum
 from typing import List, Dict, Optional
 from datetime import datetime
+import json
+
+from core.option_parser import OPTION_JSON_SCHEMA
 
 class PromptMode(Enum):
     PRELOAD = "preload"
     DIRECT_CHAT = "direct_chat"
     GENERATE_OPTIONS = "generate_options"
+    SUMMARIZE = "summarize"
 
 
 class PromptBuilder:
     PRESET_MARK = "### 核心指令：预设方向库###"
+    TIME_LABEL = "当前时间："
 
     def __init__(self, config_manager):
         self.cfg = config_manager
@@ -21,8 +26,14 @@ class PromptBuilder:
         messages: List[Dict] = []
         request_type: str = ""
 
+        # 0. 摘要模式：使用独立的系统指令，不携带人设与词库
+        if mode == PromptMode.SUMMARIZE:
+            return self._build_summarize_messages(prompt, context), "SUMMARIZE_HISTORY"
+
         # 1. System Prompt
-        messages.append(self._build_system_message(preset_directions_str))
+        # 稳定布局 + 词库检索时，检索结果随输入变化，放到末尾而不是 system 中
+        lexicon_in_tail = self._is_stable_layout() and self._uses_retrieval()
+        messages.append(self._build_system_message(None if lexicon_in_tail else preset_directions_str))
 
         # 2. 预热模式
         if mode == PromptMode.PRELOAD:
@@ -38,13 +49,18 @@ class PromptBuilder:
 
         # 4. 上下文
         if context:
-            messages.extend(context)
+            if self._is_stable_layout():
+                # 只保留 role/content 并固定键顺序，保证历史部分逐字节一致
+                messages.extend({"role": m["role"], "content": m["content"]} for m in context)
+            else:
+                messages.extend(context)
 
         # -------- 生成选项 + 内容 --------
         if mode == PromptMode.GENERATE_OPTIONS:
             messages.append({
                 "role": "user",
-                "content": self._build_generate_options_prompt(prompt)
+                "content": self._build_generate_options_prompt(
+                    prompt, preset_directions_str if lexicon_in_tail else None)
             })
             request_type = "GENERATE_OPTIONS_WITH_CONTENT"  # 更新类型标识
             return messages, request_type
@@ -52,6 +68,44 @@ class PromptBuilder:
 
         return messages, request_type
 
+    def build_refill(self, messages: List[Dict], valid_options: List[Dict], missing: int) -> List[Dict]:
+        """
+        部分选项格式无效时，只请求缺少的几个：
+        在原消息之后附上已得到的有效选项，要求再补充 missing 个不同的选项。
+        原消息保持不变，可以命中同一份提示缓存。
+        """
+        if self._uses_json_output():
+            previous = json.dumps({"options": valid_options}, ensure_ascii=False)
+            format_hint = '{"options": [...]}'
+        else:
+            previous = "\n".join(f"[{o['label']}] {o['content']}" for o in valid_options)
+            format_hint = "[方向词] 回复正文"
+        return messages + [
+            {"role": "assistant", "content": previous},
+            {"role": "user", "content": (
+                f"只需再补充{missing}个与上面方向不同的选项，格式同样为 {format_hint}，"
+                f"不要重复已有选项，不要输出额外说明。"
+            )},
+        ]
+
+    def response_format(self) -> Optional[Dict]:
+        """结构化输出时请求体中的 response_format，文本格式返回 None"""
+        output_format = self.cfg.get("option_output_format")
+        if output_format == "json_schema":
+            return {"type": "json_schema", "json_schema": OPTION_JSON_SCHEMA}
+        if output_format == "json_object":
+            return {"type": "json_object"}
+        return None
+
+    def _uses_json_output(self) -> bool:
+        return self.cfg.get("option_output_format") in ("json_schema", "json_object")
+
+    def _is_stable_layout(self) -> bool:
+        return self.cfg.get("prompt_layout") == "stable"
+
+    def _uses_retrieval(self) -> bool:
+        return bool(self.cfg.get("use_preset_directions")) and int(self.cfg.get("lexicon_top_k") or 0) > 0
+
     def _build_system_message(self, preset_directions_str: Optional[str]) -> Dict:
         raw_system_msg = self.cfg.get("system_prompt")
         use_preset = self.cfg.get("use_preset_directions")
@@ -69,11 +123,32 @@ class PromptBuilder:
 
         return {"role": "system", "content": content}
 
-    def _build_generate_options_prompt(self, user_input: str) -> str:
+    def _build_summarize_messages(self, previous_summary: Optional[str], context: Optional[List[Dict]]) -> List[Dict]:
+        lines = []
+        for m in context or []:
+            speaker = "我" if m["role"] == "assistant" else "对方"
+            lines.append(f"{speaker}：{m['content']}")
+
+        content = ""
+        if previous_summary:
+            content += f"已有摘要：{previous_summary}\n\n"
+        content += "需要并入摘要的新对话：\n" + "\n".join(lines)
+
+        return [
+            {"role": "system", "content": (
+                "你是对话摘要助手。请把已有摘要与新对话合并为一段不超过200字的中文摘要，"
+                "保留人物关系、关键事件、约定和情绪变化，不要编造内容，只输出摘要正文。"
+            )},
+            {"role": "user", "content": content},
+        ]
+
+    def _build_generate_options_prompt(self, user_input: str, tail_directions_str: Optional[str] = None) -> str:
 
         use_preset = self.cfg.get("use_preset_directions")
 
         base_req = f"用户输入: '{user_input}'。\n"
+        if tail_directions_str:
+            base_req += f"参考预设方向库（与本次输入相关）: {tail_directions_str}\n"
 
         if use_preset:
             instruction = (
@@ -84,12 +159,23 @@ class PromptBuilder:
                 f"请构思3个有差异的回复方向，并生成对应的回复内容。同时，你应当同时概括该回复，但不要太过于精简，作为下文提到的[方向词]，要求方向词要达到类似galgame选项的效果，介于5到7个字\n"
             )
         time_str = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        format_req = (
-            "严苛格式要求：\n"
-            "1. 仅输出3行，每行对应一个选项。\n"
-            "2. 必须严格遵守格式：[方向词] 回复正文\n"
-            "3. 不要输出任何序号或额外说明。\n"
-            f"4. 当前时间：{time_str}"
-        )
-
-        return base_req + instruction + format_req
+        if self._uses_json_output():
+            format_req = (
+                "严苛格式要求：\n"
+                "1. 仅输出一个 JSON 对象，options 数组中包含3个选项。\n"
+                '2. 必须严格遵守格式：{"options": [{"label": "方向词", "content": "回复正文"}, ...]}\n'
+                "3. 不要输出代码块标记或额外说明。\n"
+            )
+        else:
+            format_req = (
+                "严苛格式要求：\n"
+                "1. 仅输出3行，每行对应一个选项。\n"
+                "2. 必须严格遵守格式：[方向词] 回复正文\n"
+                "3. 不要输出任何序号或额外说明。\n"
+            )
+        # 稳定布局：固定的指令在前，用户输入与时间等易变内容放到最末尾；
+        # 时间不再紧跟格式要求，作为单独的一行而不是第 4 条要求
+        if self._is_stable_layout():
+            return instruction + format_req + base_req + f"{self.TIME_LABEL}{time_str}"
+
+        return base_req + instruction + format_req + f"4. {self.TIME_LABEL}{time_str}"
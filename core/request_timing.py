@@ -0,0 +1,100 @@
+# ----------------------------
+# 请求耗时分段
+# ----------------------------
+import time
+from contextvars import ContextVar
+
+# 当前协程正在计时的请求；每个引擎任务运行在独立的上下文中，互不干扰
+current_timing = ContextVar("current_timing", default=None)
+
+
+class RequestTiming:
+    """
+    单次 AIWorker 请求的分段耗时（毫秒）：
+    queue 排队、build 构建提示词、acquire 取得连接（新建连接时含握手）、
+    ttfb 发出请求到收到响应头、first_token 从开始执行到第一个内容片段、
+    total 从开始执行到结束、parse 解析选项本身的耗时。
+    """
+
+    def __init__(self, mode, model, submitted_at):
+        self.mode = mode
+        self.model = model
+        self.started_at = time.perf_counter()
+        self.queue_ms = (self.started_at - submitted_at) * 1000 if submitted_at else 0.0
+        self.build_ms = 0.0
+        self.acquire_ms = None
+        self.ttfb_ms = None
+        self.first_token_ms = None
+        self.total_ms = None
+        self.parse_ms = 0.0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.attempts = 0
+        self.new_connection = False
+        self.cached = False
+        self.error = None
+        self._http_start = None
+
+    def elapsed_ms(self):
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def mark_first_token(self):
+        if self.first_token_ms is None:
+            self.first_token_ms = self.elapsed_ms()
+
+    def add_usage(self, usage):
+        if usage:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def finish(self):
+        self.total_ms = self.elapsed_ms()
+
+    def to_dict(self):
+        return {
+            "mode": self.mode,
+            "model": self.model,
+            "queue_ms": round(self.queue_ms, 2),
+            "build_ms": round(self.build_ms, 2),
+            "acquire_ms": None if self.acquire_ms is None else round(self.acquire_ms, 2),
+            "ttfb_ms": None if self.ttfb_ms is None else round(self.ttfb_ms, 2),
+            "first_token_ms": None if self.first_token_ms is None else round(self.first_token_ms, 2),
+            "total_ms": None if self.total_ms is None else round(self.total_ms, 2),
+            "parse_ms": round(self.parse_ms, 3),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "attempts": self.attempts,
+            "new_connection": self.new_connection,
+            "cached": self.cached,
+            "error": self.error,
+        }
+
+    # ---- HTTP 层回调（引擎线程） ----
+
+    def on_http_request(self):
+        self.attempts += 1
+        self._http_start = time.perf_counter()
+        # 重试时以最后一次尝试为准
+        self.acquire_ms = None
+        self.ttfb_ms = None
+        self.new_connection = False
+
+    async def trace(self, event, info):
+        """httpcore 的 trace 扩展：据此拆出取得连接与首字节的耗时"""
+        if self._http_start is None:
+            return
+        now_ms = (time.perf_counter() - self._http_start) * 1000
+        if event == "connection.connect_tcp.started":
+            self.new_connection = True
+        elif event.endswith("send_request_headers.started") and self.acquire_ms is None:
+            self.acquire_ms = now_ms
+        elif event.endswith("receive_response_headers.complete") and self.ttfb_ms is None:
+            self.ttfb_ms = now_ms
+
+
+async def trace_request_hook(request):
+    """httpx 请求事件钩子：为当前计时中的请求挂上 trace 扩展"""
+    timing = current_timing.get()
+    if timing is not None:
+        timing.on_http_request()
+        request.extensions["trace"] = timing.trace
@@ -0,0 +1,164 @@
+# ----------------------------
+# 选项结果缓存
+# ----------------------------
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from core.prompt_builder import PromptBuilder
+
+# 匹配 _build_generate_options_prompt 注入的毫秒级时间戳
+TIME_PATTERN = re.compile(re.escape(PromptBuilder.TIME_LABEL) + r"\d{2}:\d{2}:\d{2}(\.\d{3})?")
+
+
+def time_bucket(bucket_mode, now=None):
+    """把当前时间折算成粗粒度的时间段，作为缓存键的一部分"""
+    now = now or datetime.now()
+    if bucket_mode == "hour":
+        return f"{now.hour:02d}时"
+    if bucket_mode == "period":
+        if 5 <= now.hour < 11:
+            return "早晨"
+        if 11 <= now.hour < 14:
+            return "中午"
+        if 14 <= now.hour < 18:
+            return "下午"
+        if 18 <= now.hour < 23:
+            return "晚上"
+        return "深夜"
+    return ""
+
+
+def make_cache_key(messages, model, bucket_mode="hour"):
+    """对 PromptBuilder 的输出做稳定哈希，时间戳替换为时间段"""
+    bucket = PromptBuilder.TIME_LABEL + time_bucket(bucket_mode)
+    normalized = [
+        {"role": m["role"], "content": TIME_PATTERN.sub(bucket, m["content"])}
+        for m in messages
+    ]
+    raw = json.dumps({"model": model, "messages": normalized},
+                     ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    落盘的选项缓存 (SQLite WAL)。
+    按条数上限做 LRU 淘汰，同时按创建时间做 TTL 过期。
+    命中时只在内存中记下访问时间，攒够一批或下次写入时再一并落盘；
+    所有方法都是同步 IO，引擎中通过 asyncio.to_thread 调用，不阻塞事件循环。
+    """
+
+    # 内存中积攒的访问时间达到该数量时写回
+    TOUCH_BATCH = 32
+
+    def __init__(self, filename="response_cache.db", max_entries=500, ttl=86400):
+        self.filename = filename
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> 尚未写回的最近访问时间
+        self._touched = {}
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在断电时可能丢最后几次提交，缓存丢了也无妨
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS options_cache ("
+            " key TEXT PRIMARY KEY,"
+            " options TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_options_cache_access ON options_cache(last_access)")
+        self._conn.commit()
+
+    def configure(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT options, created_at FROM options_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._touched.pop(key, None)
+                    self._conn.execute("DELETE FROM options_cache WHERE key = ?", (key,))
+                    self._conn.commit()
+                self.misses += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touches()
+                self._conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def _flush_touches(self):
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE options_cache SET last_access = ? WHERE key = ?",
+                [(at, key) for key, at in self._touched.items()])
+            self._touched.clear()
+
+    def put(self, key, options):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO options_cache (key, options, created_at, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, json.dumps(options, ensure_ascii=False), now, now)
+            )
+            # 淘汰按 last_access 排序，先写回积攒的访问时间
+            self._touched.pop(key, None)
+            self._flush_touches()
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM options_cache WHERE created_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM options_cache WHERE key NOT IN ("
+            " SELECT key FROM options_cache ORDER BY last_access DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._touched.clear()
+            self._conn.execute("DELETE FROM options_cache")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM options_cache").fetchone()[0]
+        total = self.hits + self.misses
+        ratio = self.hits / total if total else 0.0
+        return {"hits": self.hits, "misses": self.misses,
+                "entries": entries, "hit_ratio": ratio}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache(cfg):
+    """获取全局缓存实例，并同步配置中的容量与过期时间"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        _cache.configure(cfg.get("response_cache_max_entries"), cfg.get("response_cache_ttl"))
+        return _cache
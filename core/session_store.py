@@ -0,0 +1,285 @@
+# ----------------------------
+# 会话持久化
+# ----------------------------
+import sqlite3
+import threading
+import time
+
+
+def text_grams(text):
+    """
+    切分出检索用的二元组：每个字与其后一个字组成一项；
+    后面是空白或已到末尾的字单独成一项，保证每个字都是某一项的开头。
+    """
+    text = text.lower()
+    grams = set()
+    for i, char in enumerate(text):
+        if char.isspace():
+            continue
+        if i + 1 < len(text) and not text[i + 1].isspace():
+            grams.add(text[i:i + 2])
+        else:
+            grams.add(char)
+    return grams
+
+
+class SessionStore:
+    """
+    只追加的会话存储 (SQLite WAL)。
+    每轮对话（用户输入、最终回复、选中与未选中的方案）在一个事务中写入；
+    读取只走 (session_id, seq) 索引，启动耗时与历史总量无关。
+    全文检索使用 FTS5 trigram 分词（对中文按字切分同样有效），由触发器随每条消息增量更新；
+    trigram 匹配不了的 1~2 字词（中文里最常见）走二元组索引表 message_grams。
+    SQLite 不支持 FTS5 trigram 时，所有检索词都走二元组索引。
+    """
+
+    # trigram 分词无法匹配少于 3 个字符的词，这类词改用二元组索引
+    MIN_FTS_TERM = 3
+
+    def __init__(self, filename="sessions.db"):
+        self.filename = filename
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(filename, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # WAL 下 NORMAL 只在断电时可能丢最后几次提交，不会损坏数据库
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL,"
+            " summary TEXT NOT NULL DEFAULT '',"
+            " summarized_upto INTEGER NOT NULL DEFAULT 0);"
+            "CREATE TABLE IF NOT EXISTS messages ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id INTEGER NOT NULL,"
+            " seq INTEGER NOT NULL,"
+            " role TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at);"
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_messages_session_seq ON messages(session_id, seq);"
+            "CREATE TABLE IF NOT EXISTS option_events ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " session_id INTEGER NOT NULL,"
+            " message_seq INTEGER NOT NULL,"
+            " chosen INTEGER NOT NULL,"
+            " label TEXT NOT NULL,"
+            " content TEXT NOT NULL,"
+            " created_at REAL NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS idx_option_events_message ON option_events(session_id, message_seq);"
+        )
+        self.fts_enabled = self._init_fts()
+        self._init_grams()
+        self._conn.commit()
+
+    def _table_exists(self, name):
+        return self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone() is not None
+
+    def _init_fts(self):
+        """建立 trigram 全文索引；SQLite 过旧（< 3.34）或未编译 FTS5 时返回 False"""
+        exists = self._table_exists("messages_fts")
+        try:
+            self._conn.executescript(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+                " content, content='messages', content_rowid='id', tokenize='trigram');"
+                "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN"
+                " INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content);"
+                " END;"
+            )
+        except sqlite3.OperationalError:
+            return False
+        if not exists:
+            # 旧版本数据库：一次性为已有消息建立索引
+            self._conn.execute("INSERT INTO messages_fts(messages_fts) VALUES ('rebuild')")
+        return True
+
+    def _init_grams(self):
+        exists = self._table_exists("message_grams")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS message_grams ("
+            " gram TEXT NOT NULL,"
+            " message_id INTEGER NOT NULL,"
+            " PRIMARY KEY (gram, message_id)) WITHOUT ROWID")
+        if not exists:
+            # 旧版本数据库：一次性为已有消息建立索引
+            rows = self._conn.execute("SELECT id, content FROM messages").fetchall()
+            self._insert_grams(rows)
+
+    def _insert_grams(self, rows):
+        self._conn.executemany(
+            "INSERT OR IGNORE INTO message_grams (gram, message_id) VALUES (?, ?)",
+            [(gram, message_id) for message_id, content in rows for gram in text_grams(content)])
+
+    def latest_session(self):
+        """最近一次使用的会话 id，没有时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM sessions ORDER BY updated_at DESC LIMIT 1").fetchone()
+        return row[0] if row else None
+
+    def session_exists(self, session_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def create_session(self):
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO sessions (created_at, updated_at) VALUES (?, ?)", (now, now))
+            self._conn.commit()
+            return cur.lastrowid
+
+    def session_info(self, session_id):
+        """返回 (消息总数, 摘要, 摘要覆盖到的 seq)"""
+        with self._lock:
+            count = self._conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?",
+                (session_id,)).fetchone()[0]
+            row = self._conn.execute(
+                "SELECT summary, summarized_upto FROM sessions WHERE id = ?",
+                (session_id,)).fetchone()
+        summary, upto = row if row else ("", 0)
+        return count, summary, upto
+
+    def append_turn(self, session_id, seq, user_name, user_text, ai_name, reply,
+                    chosen=None, rejected=()):
+        """写入一轮对话：seq 为用户消息的序号，回复为 seq + 1"""
+        now = time.time()
+        rows = [(session_id, seq, "user", user_name, user_text, now),
+                (session_id, seq + 1, "assistant", ai_name, reply, now)]
+        options = []
+        if chosen:
+            options.append((session_id, seq, 1, chosen.get("label", ""), chosen.get("content", ""), now))
+        for opt in rejected:
+            if opt:
+                options.append((session_id, seq, 0, opt.get("label", ""), opt.get("content", ""), now))
+        with self._lock:
+            with self._conn:
+                indexed = []
+                for row in rows:
+                    cur = self._conn.execute(
+                        "INSERT INTO messages (session_id, seq, role, name, content, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)", row)
+                    indexed.append((cur.lastrowid, row[4]))
+                self._insert_grams(indexed)
+                if options:
+                    self._conn.executemany(
+                        "INSERT INTO option_events (session_id, message_seq, chosen, label, content, created_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)", options)
+                self._conn.execute(
+                    "UPDATE sessions SET updated_at = ? WHERE id = ?", (now, session_id))
+
+    def save_summary(self, session_id, summary, upto):
+        with self._lock:
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE sessions SET summary = ?, summarized_upto = ? WHERE id = ?",
+                    (summary, upto, session_id))
+
+    def load_range(self, session_id, start, end):
+        """按序号读取 [start, end) 区间的消息，返回 (seq, role, name, content) 列表"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, role, name, content FROM messages"
+                " WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start, end)).fetchall()
+
+    def load_before(self, session_id, before_seq, limit):
+        """读取 before_seq 之前的最多 limit 条消息（升序）"""
+        return self.load_range(session_id, max(0, before_seq - limit), before_seq)
+
+    def option_history(self, session_id, message_seq):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chosen, label, content FROM option_events"
+                " WHERE session_id = ? AND message_seq = ? ORDER BY id",
+                (session_id, message_seq)).fetchall()
+        return [{"chosen": bool(c), "label": l, "content": t} for c, l, t in rows]
+
+    def search(self, query, limit=50):
+        """
+        在所有会话中检索消息，按时间倒序返回。
+        用户消息附带紧随其后的回复，方便查看当时是怎么回答的。
+        """
+        terms = [t.lower() for t in query.split()]
+        if not terms:
+            return []
+        fts_terms = [t for t in terms if self.fts_enabled and len(t) >= self.MIN_FTS_TERM]
+        like_terms = [t for t in terms if t not in fts_terms]
+
+        # 只用一个索引条件驱动查询（FTS，或最长检索词的二元组），其余词在候选行上用 LIKE 确认，
+        # 多个常见词不会各自展开成一份完整的候选列表
+        if fts_terms:
+            match = " AND ".join('"' + t.replace('"', '""') + '"' for t in fts_terms)
+            driver, driver_args, id_column = "SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?", [match], "rowid"
+        else:
+            term = max(like_terms, key=len)
+            like_terms.remove(term)
+            driver, driver_args = self._gram_driver(term)
+            id_column = "message_id"
+            if len(term) > 2:
+                # 二元组都出现不代表连续出现
+                like_terms.append(term)
+        if not like_terms:
+            # 没有其他过滤条件时，倒序截断直接在索引内完成
+            driver += f" ORDER BY {id_column} DESC LIMIT ?"
+            driver_args.append(limit)
+
+        like_sql = "".join(" AND m.content LIKE ? ESCAPE '\\'" for _ in like_terms)
+        like_args = [f"%{self._escape_like(t)}%" for t in like_terms]
+        select = ("SELECT m.session_id, m.seq, m.role, m.name, m.content, m.created_at, r.content"
+                  " FROM messages m"
+                  " LEFT JOIN messages r ON m.role = 'user'"
+                  " AND r.session_id = m.session_id AND r.seq = m.seq + 1")
+        sql = f"{select} WHERE m.id IN ({driver}){like_sql} ORDER BY m.id DESC LIMIT ?"
+        args = driver_args + like_args + [limit]
+
+        with self._lock:
+            rows = self._conn.execute(sql, args).fetchall()
+        return [{"session_id": sid, "seq": seq, "role": role, "name": name, "content": content,
+                 "created_at": created_at, "reply": reply}
+                for sid, seq, role, name, content, created_at, reply in rows]
+
+    @staticmethod
+    def _gram_driver(term):
+        """
+        用二元组索引取出可能包含检索词的消息：单字按前缀范围查，两字直接查，
+        更长的词（仅在没有 FTS5 时）取其全部二元组的交集。
+        """
+        if len(term) == 1:
+            # 同一条消息可能有多个以该字开头的二元组，去重后再截断，否则重复的 id 会占掉 LIMIT
+            sql = "SELECT DISTINCT message_id FROM message_grams WHERE gram >= ? AND gram < ?"
+            return sql, [term, chr(ord(term) + 1)]
+        grams = sorted({term[i:i + 2] for i in range(len(term) - 1)})
+        sql = " INTERSECT ".join("SELECT message_id FROM message_grams WHERE gram = ?" for _ in grams)
+        return sql, grams
+
+    @staticmethod
+    def _escape_like(text):
+        return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+    def stats(self):
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"sessions": sessions, "messages": messages}
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store(cfg):
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(cfg.get("session_db"))
+        return _store
@@ -1,14 +1,23 @@
+import time
+
+# 冷启动计时的起点，尽量早于其他导入
+STARTUP_T0 = time.perf_counter()
+
 import sys
+from collections import deque
 from PyQt6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                              QHBoxLayout, QPushButton, QStackedWidget, QFrame)
 from PyQt6.QtCore import QTimer
 from PyQt6.QtGui import QFont
 
-from core.config import ConfigManager
+from core.config import ConfigManager, CONNECTION_KEYS
+from core.client_pool import client_pool, warm_sdk_import
+from core.engine import get_engine, Priority
+from core.metrics import metrics
 from ui.logs_widget import LogsWidget
 from ui.console_widget import ConsoleWidget
 from ui.settings_widget import SettingsWidget
-from ui.chat_widget import ChatWidget
+from ui.session_tabs import SessionTabs
 
 
 class MainWindow(QMainWindow):
@@ -20,11 +29,51 @@ class MainWindow(QMainWindow):
         # 初始化配置
         self.cfg = ConfigManager()
 
+        # 设置页与终端页在第一次切换过去时才创建
+        self.settings_page = None
+        self.console_page = None
+        self.page_factories = {1: self.build_settings_page, 3: self.build_console_page}
+        # 终端页创建前，发往终端的监视数据先缓存
+        self.console_backlog = deque(maxlen=200)
+        self.startup_marks = {}
+
         self.init_ui()
 
+    def showEvent(self, event):
+        super().showEvent(event)
+        if "shown" not in self.startup_marks:
+            self.startup_marks["shown"] = time.perf_counter()
+            # 排在首次绘制之后执行
+            QTimer.singleShot(0, self.on_first_idle)
+
+    def on_first_idle(self):
+        """首帧已绘制、事件循环空闲：记录启动耗时，再开始后台的重活"""
+        self.startup_marks["interactive"] = time.perf_counter()
+        shown_ms = (self.startup_marks["shown"] - STARTUP_T0) * 1000
+        interactive_ms = (self.startup_marks["interactive"] - STARTUP_T0) * 1000
+        metrics.set("startup.shown_ms", shown_ms)
+        metrics.set("startup.interactive_ms", interactive_ms)
+        self.logs_page.append_log(f"启动耗时: 窗口显示 {shown_ms:.0f}ms，可交互 {interactive_ms:.0f}ms")
+
+        warm_sdk_import()
         # 启动 1 秒后执行预热，避开 UI 初始化的高峰
         QTimer.singleShot(1000, self.chat_page.run_preload)
 
+    def on_config_changed(self, keys):
+        """只在相关配置真正变化时才重建客户端、重新预热"""
+        self.logs_page.append_log(f"配置已更新: {', '.join(sorted(keys))}", level="DEBUG")
+        if keys & CONNECTION_KEYS:
+            stale = client_pool.retain_only(self.cfg)
+            for client in stale:
+                get_engine().submit(client.close, priority=Priority.BACKGROUND)
+            if stale:
+                self.logs_page.append_log("连接配置已变更，已重建 API 客户端")
+            self.chat_page.run_preload()
+        if "enable_clipboard_monitor" in keys:
+            self.chat_page.apply_config()
+        if "heartbeat_interval" in keys:
+            self.chat_page.apply_heartbeat()
+
     def init_ui(self):
         main_widget = QWidget()
         self.setCentralWidget(main_widget)
@@ -36,31 +85,30 @@ class MainWindow(QMainWindow):
         self.stack = QStackedWidget()
 
         # 初始化各个子页面
-        self.logs_page = LogsWidget()
-        self.console_page = ConsoleWidget(self.cfg)
-        self.chat_page = ChatWidget(self.cfg, self.logs_page.append_log)
-
-        # 设置页面保存时，触发 chat_page 的重新预热
-        def on_settings_saved():
-            self.chat_page.run_preload()  # 预热连接
-            self.chat_page.apply_config()  # 应用新配置（如剪贴板开关）
-
-        self.settings_page = SettingsWidget(
-            self.cfg,
-            self.logs_page.append_log,
-            on_save_callback=on_settings_saved  # 使用新的回调
-        )
-
-        # 信号连接：将 ChatWidget 的监视数据传给 ConsoleWidget
-        self.chat_page.payload_captured.connect(self.console_page.append_outgoing_payload)
-        self.chat_page.options_generated.connect(self.console_page.append_generated_options)
-        self.chat_page.reply_received.connect(self.console_page.append_incoming_reply)
-
-        # 添加到堆栈
+        self.logs_page = LogsWidget(self.cfg)
+        self.chat_page = SessionTabs(self.cfg, self.logs_page.append_log)
+        self.cfg.subscribe(self.on_config_changed)
+
+        self.chat_page.context_usage_changed.connect(
+            lambda text: self.settings_page and self.settings_page.update_context_usage(text))
+        # 每个请求的分段耗时以结构化字段写入日志文件
+        self.chat_page.request_timed.connect(
+            lambda t: self.logs_page.append_log(
+                f"[耗时] {t['mode']} {t['total_ms']:.0f}ms", level="DEBUG", **t))
+
+        # 信号连接：将各会话的监视数据传给 ConsoleWidget
+        self.chat_page.payload_captured.connect(
+            lambda payload: self.to_console("append_outgoing_payload", payload))
+        self.chat_page.options_generated.connect(
+            lambda options: self.to_console("append_generated_options", options))
+        self.chat_page.reply_received.connect(
+            lambda reply: self.to_console("append_incoming_reply", reply))
+
+        # 添加到堆栈，延迟创建的页面先放占位
         self.stack.addWidget(self.chat_page)  # Index 0
-        self.stack.addWidget(self.settings_page)  # Index 1
+        self.stack.addWidget(QWidget())  # Index 1 设置
         self.stack.addWidget(self.logs_page)  # Index 2
-        self.stack.addWidget(self.console_page)  # Index 3
+        self.stack.addWidget(QWidget())  # Index 3 终端
 
         # 左侧导航栏
         sidebar = QFrame()
@@ -97,7 +145,31 @@ class MainWindow(QMainWindow):
         # 默认选中第一个
         self.nav_btns[0].setChecked(True)
 
+    def build_settings_page(self):
+        self.settings_page = SettingsWidget(self.cfg, self.logs_page.append_log)
+        self.settings_page.update_context_usage(self.chat_page.current_chat().context_window.usage_text())
+        return self.settings_page
+
+    def build_console_page(self):
+        self.console_page = ConsoleWidget(self.cfg)
+        while self.console_backlog:
+            method, arg = self.console_backlog.popleft()
+            getattr(self.console_page, method)(arg)
+        return self.console_page
+
+    def to_console(self, method, arg):
+        if self.console_page is None:
+            self.console_backlog.append((method, arg))
+        else:
+            getattr(self.console_page, method)(arg)
+
     def switch_page(self, index):
+        factory = self.page_factories.pop(index, None)
+        if factory:
+            placeholder = self.stack.widget(index)
+            self.stack.removeWidget(placeholder)
+            placeholder.deleteLater()
+            self.stack.insertWidget(index, factory())
         self.stack.setCurrentIndex(index)
         for i, btn in enumerate(self.nav_btns):
             btn.setChecked(i == index)
@@ -0,0 +1,89 @@
+# ----------------------------
+# 引擎调度测试
+# ----------------------------
+# 用法：python -m pytest tests
+import asyncio
+import threading
+import unittest
+
+from core.engine import EngineService, Job, Priority
+
+
+class NextJobOrderTest(unittest.TestCase):
+    """直接检查 _next_job 的出队顺序，不启动事件循环"""
+
+    def setUp(self):
+        self.engine = EngineService(max_concurrency=1, max_per_owner=1)
+
+    def queue(self, owner, priority=Priority.INTERACTIVE):
+        job = Job(None, priority, None, False, owner)
+        job.seq = next(self.engine._seq)
+        self.engine._pending.append(job)
+        return job
+
+    def drain(self):
+        """模拟逐个出队并立即完成，返回出队的 owner 顺序"""
+        order = []
+        while self.engine._pending:
+            job = self.engine._next_job()
+            self.engine._pending.remove(job)
+            self.engine._served[job.owner] = next(self.engine._dispatch_seq)
+            order.append(job.owner)
+        return order
+
+    def test_owners_alternate_even_if_one_queued_first(self):
+        for _ in range(8):
+            self.queue("A")
+        for _ in range(3):
+            self.queue("B")
+        self.assertEqual(self.drain(), ["A", "B"] * 3 + ["A"] * 5)
+
+    def test_priority_before_fairness(self):
+        self.queue("A", Priority.BACKGROUND)
+        self.queue("B", Priority.BACKGROUND)
+        self.queue("A", Priority.INTERACTIVE)
+        self.assertEqual(self.drain(), ["A", "B", "A"])
+
+    def test_per_owner_cap_skips_background_only(self):
+        self.engine._owner_running["A"] = 1
+        background = self.queue("A", Priority.BACKGROUND)
+        interactive = self.queue("A", Priority.INTERACTIVE)
+        self.assertIs(self.engine._next_job(), interactive)
+        self.engine._pending.remove(interactive)
+        self.assertIsNone(self.engine._next_job())
+        self.engine._owner_running.pop("A")
+        self.assertIs(self.engine._next_job(), background)
+
+
+class DispatchOrderTest(unittest.TestCase):
+    """在真实的事件循环中提交任务，检查执行顺序"""
+
+    def test_round_robin_with_single_slot(self):
+        engine = EngineService(max_concurrency=1)
+        gate = threading.Event()
+        done = threading.Event()
+        names = [f"A{i}" for i in range(8)] + [f"B{i}" for i in range(3)]
+        order = []
+
+        async def blocker():
+            # 占住唯一的并发名额，让后面的任务全部进入队列
+            while not gate.is_set():
+                await asyncio.sleep(0.001)
+
+        def record(name):
+            async def run():
+                order.append(name)
+                if len(order) == len(names):
+                    done.set()
+            return run
+
+        engine.submit(blocker)
+        for name in names:
+            engine.submit(record(name), owner=name[0])
+        gate.set()
+        self.assertTrue(done.wait(5))
+        self.assertEqual(order, ["A0", "B0", "A1", "B1", "A2", "B2", "A3", "A4", "A5", "A6", "A7"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+# ----------------------------
+# 选项解析测试
+# ----------------------------
+# 用法：python -m pytest tests
+import unittest
+
+from core.option_parser import OptionStreamParser
+
+
+def parse(text, chunk_size=None):
+    """整段或按 chunk_size 分块喂入，返回解析器与按发出顺序排列的选项"""
+    parser = OptionStreamParser()
+    emitted = []
+    chunks = [text] if chunk_size is None else [text[i:i + chunk_size] for i in range(0, len(text), chunk_size)]
+    for chunk in chunks:
+        emitted += parser.feed(chunk)
+    emitted += parser.finish()
+    return parser, [option for _, option in sorted(emitted, key=lambda item: item[0])]
+
+
+class StrictFirstTest(unittest.TestCase):
+
+    OPTIONS = "[热情同意] 好呀，几点见？\n[委婉拒绝] 这周有点忙\n[调侃] 你请客吗"
+
+    def test_preamble_does_not_take_option_slots(self):
+        for preamble in ("注意：以下内容仅供参考", "好的：这是三个选项"):
+            for chunk_size in (None, 1, 7):
+                with self.subTest(preamble=preamble, chunk_size=chunk_size):
+                    parser, options = parse(f"{preamble}\n{self.OPTIONS}", chunk_size)
+                    self.assertEqual([o["label"] for o in options], ["热情同意", "委婉拒绝", "调侃"])
+                    self.assertEqual(parser.options, options)
+                    self.assertEqual(parser.dropped, 1)
+                    self.assertEqual(parser.quality, "repaired")
+
+    def test_lenient_lines_fill_missing_slots(self):
+        parser, options = parse("1. 同意：好呀\n[拒绝] 不要\n3. 调侃：你请客吗")
+        self.assertEqual([o["label"] for o in options], ["拒绝", "同意", "调侃"])
+        self.assertEqual(parser.quality, "repaired")
+
+    def test_clean_output_stops_early(self):
+        parser = OptionStreamParser()
+        parser.feed(self.OPTIONS + "\n")
+        self.assertTrue(parser.is_complete)
+        self.assertEqual(parser.quality, "clean")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+# ----------------------------
+# 会话检索测试
+# ----------------------------
+# 用法：python -m pytest tests
+import os
+import random
+import tempfile
+import unittest
+
+from core.session_store import SessionStore
+
+
+class SingleCharSearchTest(unittest.TestCase):
+    """单字检索走二元组索引，结果应与逐条扫描完全一致"""
+
+    ALPHABET = "周末一起去看电影吧好呀ab_%"
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = SessionStore(os.path.join(self.tmp.name, "sessions.db"))
+        rng = random.Random(17)
+        session_id = self.store.create_session()
+        self.messages = []
+        for seq in range(0, 2000, 2):
+            user_text, reply = ("".join(rng.choice(self.ALPHABET) for _ in range(rng.randint(1, 12)))
+                                for _ in range(2))
+            self.store.append_turn(session_id, seq, "我", user_text, "她", reply)
+            self.messages += [(seq, user_text), (seq + 1, reply)]
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def brute_force(self, term, limit):
+        matched = [seq for seq, content in self.messages if term in content.lower()]
+        return sorted(matched, reverse=True)[:limit]
+
+    def test_matches_full_scan(self):
+        for term in ("周", "_", "%", "a"):
+            for limit in (5, 50, 5000):
+                with self.subTest(term=term, limit=limit):
+                    found = [row["seq"] for row in self.store.search(term, limit=limit)]
+                    self.assertEqual(found, self.brute_force(term, limit))
+
+
+if __name__ == "__main__":
+    unittest.main()
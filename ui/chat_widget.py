@@ -2,17 +2,23 @@
 # 主聊天窗口
 # ----------------------------
 from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout,
-                             QPushButton, QTextEdit, QLineEdit,
-                             QMessageBox, QGridLayout, QGraphicsBlurEffect)
-from PyQt6.QtCore import Qt, pyqtSignal
-from PyQt6.QtGui import QTextCursor, QTextBlockFormat
+                             QPushButton, QLineEdit, QListWidget, QListWidgetItem,
+                             QMessageBox, QGridLayout, QGraphicsBlurEffect, QAbstractItemView)
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer
 from enum import Enum, auto
+from collections import deque
+import time
 
 # --- 模块导入 ---
 from core.input_handler import InputHandler
 from core.direction_manager import DirectionManager
 from core.ai_engine import AIWorker
+from core.engine import Priority
 from core.prompt_builder import PromptMode
+from core.context_manager import ContextWindow
+from core.session_store import get_session_store
+from core.metrics import metrics
+from ui.transcript_view import TranscriptView, MessageRecord
 
 
 class ConversationState(Enum):
@@ -20,17 +26,49 @@ class ConversationState(Enum):
     WAIT_OPTIONS = auto()
 
 
+class Speculation:
+    """剪贴板文本进入输入框后提前发出的选项请求；用户发送同样的文本时直接采用其结果"""
+
+    def __init__(self, key, worker):
+        self.key = key
+        self.worker = worker
+        self.started_at = time.perf_counter()
+        self.options = {}  # 流式模式下已解析的 序号 -> 选项
+        self.result = None
+        self.error = None
+        # 被采用后，之后到达的信号直接转给界面
+        self.adopted = False
+
+
 class ChatWidget(QWidget):
     # 信号定义
     payload_captured = pyqtSignal(str)
     reply_received = pyqtSignal(str)
     options_generated = pyqtSignal(list)
+    context_usage_changed = pyqtSignal(str)
+    request_timed = pyqtSignal(dict)
+    state_changed = pyqtSignal()
+    open_session_requested = pyqtSignal(int, int)  # 搜索结果属于其他会话时 (session_id, seq)
 
-    def __init__(self, config_manager, log_callback):
+    def __init__(self, config_manager, log_callback, input_handler=None, dir_manager=None, session_id=None):
+        """
+        多会话时 input_handler 与 dir_manager 由外部共享传入，session_id 指定要打开的会话；
+        单独使用时自行创建，并恢复最近的会话。
+        """
         super().__init__()
         self.cfg = config_manager
         self.log = log_callback
+        # 引擎按会话公平调度，同时作为合并请求的键
+        self.owner = f"chat:{id(self)}"
         self.history = []
+        # 会话持久化：history[0] 对应存储中的序号 history_offset，
+        # transcript_start 为聊天记录中最早一条已显示消息的序号
+        self.session_store = None
+        self.session_id = None
+        self.history_offset = 0
+        self.transcript_start = 0
+        self.context_window = ContextWindow(self.cfg)
+        self.summary_worker = None
         self.current_user_input = ""
 
         self.current_options_data = []
@@ -38,12 +76,56 @@ class ChatWidget(QWidget):
         self.state = ConversationState.IDLE
         self.worker = None
 
-        self.input_handler = InputHandler()
-        self.input_handler.new_message_received.connect(self.on_external_message)
-        self.apply_config()
-        self.dir_manager = DirectionManager()
+        # 备选选项池：当前轮次在后台预先生成的其他方案，供“重新生成”直接取用
+        self.option_pool = []
+        self.prefetch_workers = []
+        self.turn_id = 0
+        # 竞速模式：模型超过期限未返回时先显示本地词库方案
+        self.showing_local_options = False
+        self.race_timer = QTimer(self)
+        self.race_timer.setSingleShot(True)
+        self.race_timer.timeout.connect(self.on_race_deadline)
+        # 空闲心跳：聊天页可见且空闲时定期预热，避免连接因空闲被服务端关闭
+        self.heartbeat_timer = QTimer(self)
+        self.heartbeat_timer.timeout.connect(self.on_heartbeat)
+
+        # 预测生成：当前输入框文本对应的后台请求，以及最近一分钟内的发起时间（用于限额）
+        self.speculation = None
+        self.speculation_times = deque()
+
+        # 持有仍在进行的请求引用，直到引擎中的任务结束
+        self.running_workers = set()
+
+        self.input_handler = input_handler
+        if input_handler is None:
+            self.input_handler = InputHandler(self.cfg)
+            self.input_handler.new_message_received.connect(self.on_external_message)
+            self.apply_config()
+        # 词库在后台加载，首次查询时才可能需要等待
+        self.dir_manager = dir_manager or DirectionManager(background=True)
         self.init_ui()
         self.update_ui_by_state()
+        self.resume_session(session_id)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.apply_heartbeat()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.heartbeat_timer.stop()
+
+    def apply_heartbeat(self):
+        interval = int(self.cfg.get("heartbeat_interval") or 0)
+        if interval > 0 and self.isVisible():
+            self.heartbeat_timer.start(interval * 1000)
+        else:
+            self.heartbeat_timer.stop()
+
+    def on_heartbeat(self):
+        # 有请求在进行时连接本来就是热的
+        if self.state == ConversationState.IDLE and not self.running_workers:
+            self.run_preload(heartbeat=True)
 
     def apply_config(self):
         is_monitor_on = self.cfg.get("enable_clipboard_monitor")
@@ -51,10 +133,24 @@ class ChatWidget(QWidget):
         state_text = "开启" if is_monitor_on else "关闭"
         self.log(f"剪贴板监听已{state_text}")
 
+    def get_preset_directions_str(self, query=None):
+        # 配置了 lexicon_top_k 时只检索与输入相关的方向
+        top_k = int(self.cfg.get("lexicon_top_k") or 0)
+        if top_k > 0:
+            if not query:
+                return ""
+            recent = " ".join(m["content"] for m in self.history[-2:])
+            return self.dir_manager.get_relevant_directions_string(f"{query} {recent}", top_k)
+
+        # 稳定布局下使用规范化的词库序列化，保证 system 前缀逐字节一致
+        canonical = self.cfg.get("prompt_layout") == "stable"
+        return self.dir_manager.get_all_directions_string(canonical=canonical)
+
     def set_state(self, new_state: ConversationState):
-        self.log(f"[状态切换] {self.state.name} -> {new_state.name}")
+        self.log(f"[状态切换] {self.state.name} -> {new_state.name}", level="DEBUG")
         self.state = new_state
         self.update_ui_by_state()
+        self.state_changed.emit()
 
     def update_ui_by_state(self):
         """根据状态切换按钮功能和样式"""
@@ -81,14 +177,10 @@ class ChatWidget(QWidget):
 
     def handle_cancel(self):
         """取消逻辑：中断线程监听并重置 UI"""
-        if self.worker:
-            try:
-                # 断开所有信号，防止线程完成后继续触发 UI 逻辑
-                self.worker.finished_options.disconnect()
-                self.worker.finished_reply.disconnect()
-                self.worker.error_occurred.disconnect()
-            except:
-                pass
+        self.race_timer.stop()
+        self.showing_local_options = False
+        self._detach_worker(self.worker)
+        self.discard_option_pool()
 
         self.log("用户取消了当前操作")
         self.options_overlay.hide()
@@ -96,6 +188,41 @@ class ChatWidget(QWidget):
         self.current_options_data = []  # 清空缓存
         self.set_state(ConversationState.IDLE)
 
+    def is_busy(self):
+        """是否有进行中的轮次、请求或未发送的输入（忙碌的会话不能被卸载）"""
+        return (self.state != ConversationState.IDLE or bool(self.running_workers)
+                or self.speculation is not None or bool(self.input_field.text().strip()))
+
+    def shutdown(self):
+        """关闭或卸载会话前中断它的所有请求"""
+        self.race_timer.stop()
+        self.heartbeat_timer.stop()
+        self.cancel_speculation()
+        self.discard_option_pool()
+        self._detach_worker(self.worker)
+        self.worker = None
+        if self.summary_worker is not None:
+            self._detach_worker(self.summary_worker)
+            self.summary_worker = None
+
+    def _track_worker(self, worker):
+        worker.timing_recorded.connect(self.request_timed.emit)
+        self.running_workers.add(worker)
+        worker.finished.connect(lambda w=worker: self.running_workers.discard(w))
+
+    @staticmethod
+    def _detach_worker(worker):
+        """断开所有信号并中断请求，被取消的请求不再继续消耗 token"""
+        if not worker:
+            return
+        for signal in (worker.finished_options, worker.option_parsed,
+                       worker.finished_reply, worker.error_occurred):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+        worker.cancel()
+
     def start_chat_flow(self, is_regenerate=False):
         """开始流程。is_regenerate 为 True 时不重复打印用户消息"""
         if self.state != ConversationState.IDLE and not is_regenerate:
@@ -108,36 +235,241 @@ class ChatWidget(QWidget):
         self.set_state(ConversationState.WAIT_OPTIONS)
 
         # 记录用户输入并上屏
+        speculation = None
         if not is_regenerate:
+            # 清空输入框会取消预测，必须先取出
+            speculation = self.take_speculation(text)
+            self.discard_option_pool()
             self.current_user_input = text
             user_name = self.cfg.get("user_name")
             self.append_chat(user_name, text, "#333333", align_right=False)
             self.input_field.clear()
 
         # 清空旧数据
+        previous_contents = [d.get("content") for d in self.current_options_data if d]
         self.current_options_data = []
+        self.showing_local_options = False
+
+        option_source = self.cfg.get("option_source")
+        if option_source == "local":
+            self.discard_speculation(speculation)
+            self.show_local_options(text, exclude=previous_contents if is_regenerate else ())
+            return
+
+        if speculation:
+            self.adopt_speculation(speculation)
+        else:
+            self.start_options_worker(text, use_cache=not is_regenerate)
+
+        if option_source == "race":
+            self.race_timer.start(int(self.cfg.get("local_option_deadline_ms")))
+
+    def start_options_worker(self, text, use_cache=True):
+        preset_str = self.get_preset_directions_str(text)
 
-        preset_str = self.dir_manager.get_all_directions_string()
+        # 按 token 预算裁剪上下文
+        context = self.build_context()
 
         # 启动 AI Worker
         self.worker = AIWorker(
             self.cfg,
             mode=PromptMode.GENERATE_OPTIONS.value,
             prompt=text,
-            context=self.history,
-            preset_directions_str=preset_str
+            context=context,
+            preset_directions_str=preset_str,
+            use_cache=use_cache,
+            context_usage=dict(self.context_window.last_usage),
+            coalesce_key=f"options:{self.owner}",
+            owner=self.owner
         )
         self.worker.finished_options.connect(self.show_options)
+        self.worker.option_parsed.connect(self.show_option_at)
         self.worker.error_occurred.connect(self.handle_error)
         self.worker.log_message.connect(self.log)
         self.worker.debug_payload.connect(self.payload_captured.emit)
+        self._track_worker(self.worker)
         self.worker.start()
 
+    # --- 预测生成 ---
+    def speculation_key(self, text):
+        """文本与上下文都相同时预测结果才能采用：历史长度与摘要进度代表上下文"""
+        return text, self.history_offset + len(self.history), self.context_window.summarized_upto
+
+    def start_speculation(self, text):
+        """剪贴板文本进入输入框后，以后台优先级提前生成选项"""
+        key = self.speculation_key(text)
+        if self.speculation and self.speculation.key == key:
+            return
+        self.cancel_speculation()
+        budget = int(self.cfg.get("speculation_budget_per_minute") or 0)
+        if not text or budget <= 0 or self.cfg.get("option_source") == "local":
+            return
+
+        now = time.monotonic()
+        while self.speculation_times and now - self.speculation_times[0] > 60:
+            self.speculation_times.popleft()
+        if len(self.speculation_times) >= budget:
+            metrics.incr("speculation.over_budget")
+            self.log(f"预测生成已达每分钟 {budget} 次的上限，本次跳过", level="DEBUG")
+            return
+        self.speculation_times.append(now)
+
+        worker = AIWorker(
+            self.cfg,
+            mode=PromptMode.GENERATE_OPTIONS.value,
+            prompt=text,
+            context=self.build_context(),
+            preset_directions_str=self.get_preset_directions_str(text),
+            context_usage=dict(self.context_window.last_usage),
+            priority=Priority.BACKGROUND,
+            coalesce_key=f"speculate:{self.owner}",
+            owner=self.owner
+        )
+        spec = Speculation(key, worker)
+        # 信号只在这里连接一次：采用前记录结果，采用后转给界面。
+        # 采用时再连接会漏掉已经发出、仍在队列中的信号
+        worker.option_parsed.connect(lambda index, option, s=spec: self.on_speculation_option(s, index, option))
+        worker.finished_options.connect(lambda options, s=spec: self.on_speculation_finished(s, options))
+        worker.error_occurred.connect(lambda err, s=spec: self.on_speculation_error(s, err))
+        worker.log_message.connect(lambda msg: self.log(msg, level="DEBUG"))
+        self._track_worker(worker)
+        self.speculation = spec
+        metrics.incr("speculation.started")
+        self.log(f"预测生成已开始（最近一分钟 {len(self.speculation_times)}/{budget} 次）", level="DEBUG")
+        worker.start()
+
+    def cancel_speculation(self):
+        spec, self.speculation = self.speculation, None
+        self.discard_speculation(spec)
+
+    def discard_speculation(self, spec):
+        """作废一个预测并中断其请求"""
+        if spec is None:
+            return
+        # 已完成但未被采用的结果计为浪费
+        metrics.incr("speculation.cancelled" if spec.result is None and spec.error is None else "speculation.wasted")
+        self._detach_worker(spec.worker)
+
+    def take_speculation(self, text):
+        """取出与本次发送匹配的预测，不匹配或已失败的直接作废"""
+        spec = self.speculation
+        if spec is None:
+            return None
+        if spec.key != self.speculation_key(text) or spec.error is not None:
+            self.cancel_speculation()
+            return None
+        self.speculation = None
+        return spec
+
+    def adopt_speculation(self, spec):
+        """采用预测结果：已完成的直接显示，进行中的提升优先级并接管后续信号"""
+        metrics.incr("speculation.adopted")
+        ahead_ms = (time.perf_counter() - spec.started_at) * 1000
+        self.log(f"采用预测生成的方案（已提前 {ahead_ms:.0f}ms 开始）")
+        self.worker = spec.worker
+        spec.adopted = True
+        if spec.result is not None:
+            self.show_options(spec.result)
+            return
+        spec.worker.promote(Priority.INTERACTIVE)
+        for index, option in sorted(spec.options.items()):
+            self.show_option_at(index, option)
+        spec.worker.debug_payload.connect(self.payload_captured.emit)
+
+    def on_speculation_option(self, spec, index, option):
+        spec.options[index] = option
+        if spec.adopted:
+            self.show_option_at(index, option)
+
+    def on_speculation_finished(self, spec, options):
+        spec.result = options
+        if spec.adopted:
+            self.show_options(options)
+
+    def on_speculation_error(self, spec, err):
+        spec.error = err
+        if spec.adopted:
+            self.handle_error(err)
+
+    def on_input_changed(self, text):
+        # 输入框内容被修改或清空，预测作废
+        if self.speculation and text.strip() != self.speculation.key[0]:
+            self.cancel_speculation()
+
+    def on_race_deadline(self):
+        if self.state != ConversationState.WAIT_OPTIONS: return
+        if any(self.current_options_data): return
+        self.log(f"模型超过 {self.cfg.get('local_option_deadline_ms')}ms 未响应，先显示本地方案")
+        self.show_local_options(self.current_user_input)
+
+    def show_local_options(self, text, exclude=()):
+        """使用本地词库即时生成选项（不请求模型）"""
+        options = self.dir_manager.generate_local_options(text, exclude=exclude)
+        if not options:
+            self.log("本地词库为空，无法生成本地方案")
+            return
+
+        self.showing_local_options = self.cfg.get("option_source") == "race"
+        self.current_options_data = list(options)
+        self.log(f"本地方案: {len(options)} 条")
+
+        self.blur_effect.setBlurRadius(15)
+        for i, btn in enumerate(self.option_btns):
+            if i < len(options):
+                self._fill_option_button(btn, options[i])
+                btn.setToolTip(f"[本地] {options[i]['content'][:50]}")
+            else:
+                btn.hide()
+        self.options_overlay.show()
+
+    def fill_missing_options(self):
+        """流式生成中途失败：空缺的选项位用本地方案补齐，补不上的按钮隐藏"""
+        shown = [d.get("content") for d in self.current_options_data if d]
+        local = iter(self.dir_manager.generate_local_options(self.current_user_input, exclude=shown) or [])
+        while len(self.current_options_data) < len(self.option_btns):
+            self.current_options_data.append({})
+        for i, btn in enumerate(self.option_btns):
+            if self.current_options_data[i]:
+                continue
+            option = next(local, None)
+            if option:
+                self.current_options_data[i] = option
+                self._fill_option_button(btn, option)
+                btn.setToolTip(f"[本地] {option['content'][:50]}")
+            else:
+                btn.hide()
+
+    def show_option_at(self, index: int, data: dict):
+        """流式模式：单个选项解析完成后立即填入对应按钮"""
+        if self.state != ConversationState.WAIT_OPTIONS: return
+        if index >= len(self.option_btns): return
+        self.race_timer.stop()
+        if self.showing_local_options:
+            self.log("模型方案已到达，逐个替换本地方案")
+            self.showing_local_options = False
+
+        # 第一个选项到达时打开覆盖层，其余按钮先显示占位
+        if self.options_overlay.isHidden():
+            self.blur_effect.setBlurRadius(15)
+            for btn in self.option_btns:
+                btn.setText("生成中...")
+                btn.setToolTip("")
+                btn.setEnabled(False)
+                btn.show()
+            self.options_overlay.show()
+
+        while len(self.current_options_data) <= index:
+            self.current_options_data.append({})
+        self.current_options_data[index] = data
+        self._fill_option_button(self.option_btns[index], data)
+
     def show_options(self, options_data: list):
         """
         [修改] 接收结构化数据 [{"label":Str, "content":Str}, ...]
         """
         if self.state != ConversationState.WAIT_OPTIONS: return
+        self.race_timer.stop()
+        self.showing_local_options = False
 
         self.current_options_data = options_data
         self.log(f"生成数据包: {len(options_data)} 条方案")
@@ -145,25 +477,31 @@ class ChatWidget(QWidget):
         # 提取 Label 用于 Console 显示和 UI 按钮
         self.options_generated.emit(options_data)  # 发送给 Console
 
+        # 当前方案已上屏，后台补充备选池
+        self.refill_option_pool()
+
         self.blur_effect.setBlurRadius(15)
 
         for i, btn in enumerate(self.option_btns):
             if i < len(options_data):
-                data = options_data[i]
-                label_text = data.get("label", "选项")
-
-                # 设置按钮文本（截断过长文本）
-                display_text = label_text[:10] + ".." if len(label_text) > 10 else label_text
-                btn.setText(display_text)
-
-                # 设置鼠标悬停提示显示完整回复预览
-                btn.setToolTip(f"预览：{data.get('content', '')[:50]}...")
-                btn.show()
+                self._fill_option_button(btn, options_data[i])
             else:
                 btn.hide()
 
         self.options_overlay.show()
 
+    def _fill_option_button(self, btn, data):
+        label_text = data.get("label", "选项")
+
+        # 设置按钮文本（截断过长文本）
+        display_text = label_text[:10] + ".." if len(label_text) > 10 else label_text
+        btn.setText(display_text)
+
+        # 设置鼠标悬停提示显示完整回复预览
+        btn.setToolTip(f"预览：{data.get('content', '')[:50]}...")
+        btn.setEnabled(True)
+        btn.show()
+
     def on_option_clicked(self, index):
         """
         [修改] 用户点击后直接上屏，无需再次请求 AI
@@ -171,8 +509,8 @@ class ChatWidget(QWidget):
         if self.state != ConversationState.WAIT_OPTIONS: return
 
         # 1. 安全检查
-        if index >= len(self.current_options_data):
-            self.log("错误：选中的索引超出数据范围")
+        if index >= len(self.current_options_data) or not self.current_options_data[index]:
+            self.log("错误：选中的索引超出数据范围", level="ERROR")
             return
 
         selected_data = self.current_options_data[index]
@@ -181,24 +519,90 @@ class ChatWidget(QWidget):
 
         self.log(f"用户选择了方向: [{label}]")
 
-        # 2. 隐藏 UI 并恢复清晰度
+        # 选择本地方案时模型请求可能仍在进行，结果不再需要
+        self.race_timer.stop()
+        self.showing_local_options = False
+        self._detach_worker(self.worker)
+
+        # 2. 隐藏 UI 并恢复清晰度，本轮备选方案作废
+        self.discard_option_pool()
         self.options_overlay.hide()
         self.blur_effect.setBlurRadius(0)
 
         # 3. 直接上屏回复 (Skip Stage 2)
-        self.display_final_reply(content)
+        rejected = [d for i, d in enumerate(self.current_options_data) if i != index and d]
+        self.display_final_reply(content, chosen=selected_data, rejected=rejected)
 
     def on_regenerate_clicked(self):
         """重新生成选项逻辑"""
         self.log("用户请求重新生成选项...")
+
+        # 备选池中有现成方案时直接换上，无需等待新的请求
+        if self.option_pool:
+            self.log(f"使用预生成的备选方案（剩余 {len(self.option_pool) - 1} 组）")
+            self.show_options(self.option_pool.pop(0))
+            return
+
         self.options_overlay.hide()
         self.blur_effect.setBlurRadius(0)
+        self._detach_worker(self.worker)
 
         # 必须先回到 IDLE 状态，start_chat_flow 才会执行
         self.state = ConversationState.IDLE
         self.start_chat_flow(is_regenerate=True)
 
-    def display_final_reply(self, reply):
+    def refill_option_pool(self):
+        """在后台为当前输入预生成备选方案，直到池满"""
+        pool_size = self.cfg.get("regen_pool_size") or 0
+        missing = pool_size - len(self.option_pool) - len(self.prefetch_workers)
+        if missing <= 0 or not self.current_user_input:
+            return
+
+        preset_str = self.get_preset_directions_str(self.current_user_input)
+        for _ in range(missing):
+            worker = AIWorker(
+                self.cfg,
+                mode=PromptMode.GENERATE_OPTIONS.value,
+                prompt=self.current_user_input,
+                context=self.build_context(),
+                preset_directions_str=preset_str,
+                stream=False,
+                use_cache=False,
+                priority=Priority.BACKGROUND,
+                owner=self.owner
+            )
+            turn_id = self.turn_id
+            worker.finished_options.connect(
+                lambda options, w=worker, t=turn_id: self.on_prefetch_finished(w, t, options))
+            worker.error_occurred.connect(
+                lambda err, w=worker: self.on_prefetch_failed(w, err))
+            self.prefetch_workers.append(worker)
+            self._track_worker(worker)
+            worker.start()
+
+    def on_prefetch_finished(self, worker, turn_id, options):
+        if worker in self.prefetch_workers:
+            self.prefetch_workers.remove(worker)
+        # 轮次已变化（用户已选择或取消），结果作废
+        if turn_id != self.turn_id:
+            return
+        self.option_pool.append(options)
+        self.log(f"备选方案已就绪（池中 {len(self.option_pool)} 组）")
+
+    def on_prefetch_failed(self, worker, err):
+        if worker in self.prefetch_workers:
+            self.prefetch_workers.remove(worker)
+        self.log(f"备选方案预生成失败: {err}", level="WARNING")
+
+    def discard_option_pool(self):
+        """丢弃本轮备选方案，并让进行中的预生成结果失效"""
+        self.turn_id += 1
+        self.option_pool = []
+        for worker in self.prefetch_workers:
+            self._detach_worker(worker)
+        self.prefetch_workers = []
+
+    def display_final_reply(self, reply, chosen=None, rejected=()):
         """上屏最终回复"""
         ai_name = self.cfg.get("ai_name")
         self.append_chat(ai_name, reply, "#0984e3", align_right=True)
@@ -206,37 +610,207 @@ class ChatWidget(QWidget):
         # 更新历史
         self.history.append({"role": "user", "content": self.current_user_input})
         self.history.append({"role": "assistant", "content": reply})
+        self.persist_turn(reply, chosen, rejected)
 
         # 输出到剪贴板
         self.input_handler.update_ai_reply(reply)
 
+        # 窗口外的旧消息累计过多时，后台折叠为摘要
+        self.build_context()
+        self.maybe_fold_history()
+
         # 状态回归
         self.set_state(ConversationState.IDLE)
         self.reply_received.emit(reply)
 
+    # --- 会话持久化 ---
+    def resume_session(self, session_id=None):
+        """恢复会话（默认最近的一个）：只读取上下文窗口与首屏需要的尾部消息"""
+        if not self.cfg.get("session_store_enabled"):
+            return
+        self.session_store = get_session_store(self.cfg)
+        self.session_id = session_id or self.session_store.latest_session() or self.session_store.create_session()
+        count, summary, summarized_upto = self.session_store.session_info(self.session_id)
+        if count == 0:
+            return
+
+        # 已折叠进摘要的消息不再需要原文；按完整的一轮对齐，但不能退回到摘要已覆盖的范围
+        start = max(0, count - int(self.cfg.get("session_resume_messages")))
+        start = max(summarized_upto, start - start % 2)
+        rows = self.session_store.load_range(self.session_id, start, count)
+        self.history = [{"role": role, "content": content} for _, role, _, content in rows]
+        self.history_offset = start
+        if summary:
+            # 存储中的摘要进度是绝对序号，上下文窗口使用相对 history 的下标
+            self.context_window.apply_summary(summary, max(0, summarized_upto - self.history_offset))
+
+        page_size = int(self.cfg.get("transcript_page_size"))
+        # 全部消息都已折叠进摘要时，首屏仍显示最后一页原文
+        page = rows[-page_size:] or self.session_store.load_range(self.session_id, max(0, count - page_size), count)
+        self.transcript_start = page[0][0]
+        self.chat_display.transcript_model.prepend([self._make_record(row) for row in page])
+        self.chat_display.scrollToBottom()
+        self.build_context()
+        self.log(f"已恢复会话（共 {count} 条消息，载入 {len(rows)} 条）")
+
+    def persist_turn(self, reply, chosen, rejected):
+        if not self.session_store:
+            return
+        seq = self.history_offset + len(self.history) - 2
+        self.session_store.append_turn(
+            self.session_id, seq,
+            self.cfg.get("user_name"), self.current_user_input,
+            self.cfg.get("ai_name"), reply,
+            chosen=chosen, rejected=rejected
+        )
+        # 给刚上屏的两条气泡记下序号（取消过的输入不会被保存，也就没有序号）
+        records = self.chat_display.transcript_model.records
+        records[-1].seq = seq + 1
+        for record in reversed(records[:-1]):
+            if not record.align_right and record.seq is None:
+                record.seq = seq
+                break
+
+    def load_older_messages(self):
+        """聊天记录滚动到顶部时向前翻页"""
+        if not self.session_store or self.transcript_start <= 0:
+            return
+        rows = self.session_store.load_before(
+            self.session_id, self.transcript_start, int(self.cfg.get("transcript_page_size")))
+        if not rows:
+            return
+        self.transcript_start = rows[0][0]
+        self.chat_display.prepend_messages([self._make_record(row) for row in rows])
+
+    @staticmethod
+    def _make_record(row):
+        seq, role, name, content = row
+        if role == "assistant":
+            return MessageRecord(name, content, "#0984e3", True, seq)
+        return MessageRecord(name, content, "#333333", False, seq)
+
+    def on_search(self):
+        query = self.search_input.text().strip()
+        self.search_results.clear()
+        if not query or not self.session_store:
+            self.search_results.hide()
+            return
+
+        start = time.perf_counter()
+        results = self.session_store.search(query)
+        self.log(f"搜索“{query}”: {len(results)} 条结果（{(time.perf_counter() - start) * 1000:.1f}ms）")
+        if not results:
+            self.search_results.addItem("没有找到相关对话")
+        for r in results:
+            text = f"{r['name']}: {r['content']}"
+            if r["reply"]:
+                text += f"\n    ↳ {r['reply']}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.ItemDataRole.UserRole, (r["session_id"], r["seq"]))
+            self.search_results.addItem(item)
+        self.search_results.show()
+
+    def on_search_result_clicked(self, item):
+        target = item.data(Qt.ItemDataRole.UserRole)
+        if target:
+            self.jump_to_message(*target)
+
+    def jump_to_message(self, session_id, seq):
+        """把聊天记录向前加载到目标消息并滚动过去；其他会话的消息交给外部打开对应会话"""
+        if session_id != self.session_id:
+            self.open_session_requested.emit(session_id, seq)
+            return
+        if seq < self.transcript_start:
+            rows = self.session_store.load_range(self.session_id, seq - seq % 2, self.transcript_start)
+            self.transcript_start = rows[0][0]
+            self.chat_display.prepend_messages([self._make_record(row) for row in rows])
+        row = self.chat_display.transcript_model.row_of_seq(seq)
+        if row < 0:
+            return
+        self.chat_display.scrollTo(self.chat_display.transcript_model.index(row),
+                                   QAbstractItemView.ScrollHint.PositionAtTop)
+        self.search_results.hide()
+
+    def build_context(self):
+        """生成本次请求使用的上下文，并通知外部当前占用"""
+        context = self.context_window.build(self.history)
+        self.context_usage_changed.emit(self.context_window.usage_text())
+        return context
+
+    def maybe_fold_history(self):
+        if self.summary_worker is not None:
+            return
+        pending = self.context_window.pending_fold(self.history)
+        if not pending:
+            return
+
+        older, upto = pending
+        self.log(f"正在将 {len(older)} 条旧消息折叠为摘要...")
+        self.summary_worker = AIWorker(
+            self.cfg,
+            mode=PromptMode.SUMMARIZE.value,
+            prompt=self.context_window.summary,
+            context=list(older),
+            owner=self.owner
+        )
+        self.summary_worker.finished_reply.connect(
+            lambda summary, u=upto: self.on_summary_finished(summary, u))
+        self.summary_worker.error_occurred.connect(self.on_summary_failed)
+        self._track_worker(self.summary_worker)
+        self.summary_worker.start()
+
+    def on_summary_finished(self, summary, upto):
+        self.summary_worker = None
+        if summary.strip():
+            self.context_window.apply_summary(summary, upto)
+            if self.session_store:
+                self.session_store.save_summary(self.session_id, self.context_window.summary,
+                                                self.history_offset + self.context_window.summarized_upto)
+            self.log(f"历史摘要已更新（已折叠 {upto} 条消息）")
+        self.build_context()
+
+    def on_summary_failed(self, err):
+        self.summary_worker = None
+        self.log(f"历史摘要生成失败: {err}", level="WARNING")
+
     def handle_error(self, error_msg):
+        if self.cfg.get("option_source") == "race" and any(self.current_options_data):
+            # 竞速模式：已上屏的本地方案或部分模型方案仍可选择，只记录错误
+            self.race_timer.stop()
+            self.showing_local_options = False
+            self.fill_missing_options()
+            self.log(f"模型请求失败，保留已显示的方案: {error_msg}", level="WARNING")
+            return
+        self.log(f"AI 错误: {error_msg}", level="ERROR")
         QMessageBox.critical(self, "AI 错误", error_msg)
         self.handle_cancel()
 
     # --- UI 构建逻辑 ---
     def init_ui(self):
         main_layout = QVBoxLayout(self)
+
+        # 历史搜索
+        self.search_input = QLineEdit()
+        self.search_input.setPlaceholderText("搜索历史对话...")
+        self.search_input.setClearButtonEnabled(True)
+        self.search_input.returnPressed.connect(self.on_search)
+        self.search_input.textChanged.connect(lambda text: text or self.search_results.hide())
+        main_layout.addWidget(self.search_input)
+
+        self.search_results = QListWidget()
+        self.search_results.setMaximumHeight(200)
+        self.search_results.setWordWrap(True)
+        self.search_results.itemClicked.connect(self.on_search_result_clicked)
+        self.search_results.hide()
+        main_layout.addWidget(self.search_results)
         self.display_container = QWidget()
         self.stack_layout = QGridLayout(self.display_container)
 
-        # 聊天显示
-        self.chat_display = QTextEdit()
-        self.chat_display.setReadOnly(True)
-        self.chat_display.setStyleSheet("""
-        QTextEdit {
-            background-color: #f8f9fa;
-            color: #2d3436;
-            border-radius: 10px;
-            padding: 15px;
-            font-size: 15px;
-        }
-        """)
+        # 聊天显示：模型/视图，只绘制可见的气泡
+        self.chat_display = TranscriptView()
+        self.chat_display.top_reached.connect(self.load_older_messages)
         self.blur_effect = QGraphicsBlurEffect()
+        self.blur_effect.setBlurRadius(0)
         self.chat_display.setGraphicsEffect(self.blur_effect)
         self.stack_layout.addWidget(self.chat_display, 0, 0)
 
@@ -297,6 +871,7 @@ class ChatWidget(QWidget):
         self.input_field.setFixedHeight(40)
         self.input_field.setPlaceholderText("在此输入对话内容...")
         self.input_field.returnPressed.connect(self.on_send_or_cancel_clicked)
+        self.input_field.textChanged.connect(self.on_input_changed)
 
         self.send_btn = QPushButton("发送")
         self.send_btn.setFixedSize(80, 40)
@@ -307,43 +882,31 @@ class ChatWidget(QWidget):
         main_layout.addLayout(input_layout)
 
     def on_external_message(self, text):
-        if self.state == ConversationState.IDLE:
-            self.input_field.setText(text)
-
-    def run_preload(self):
-        preset_str = self.dir_manager.get_all_directions_string()
-        self.preload_worker = AIWorker(self.cfg, mode=PromptMode.PRELOAD.value, preset_directions_str=preset_str)
-        self.preload_worker.log_message.connect(self.log)
+        if self.state != ConversationState.IDLE:
+            self.input_handler.reject_input("busy")
+            return
+        self.input_handler.accept_input(text)
+        self.input_field.setText(text)
+        self.start_speculation(text.strip())
+
+    def run_preload(self, heartbeat=False):
+        # warmup_mode 只决定启动与保存设置时的预热；心跳只为保持连接，始终用不消耗 token 的 GET /models
+        if heartbeat:
+            warmup_mode = "models"
+        else:
+            warmup_mode = self.cfg.get("warmup_mode")
+            if warmup_mode == "off":
+                return
+        preset_str = self.get_preset_directions_str()
+        self.preload_worker = AIWorker(self.cfg, mode=PromptMode.PRELOAD.value, preset_directions_str=preset_str,
+                                       warmup_mode=warmup_mode)
+        if heartbeat:
+            self.preload_worker.log_message.connect(lambda text: self.log(text, level="DEBUG"))
+        else:
+            self.preload_worker.log_message.connect(self.log)
         self.preload_worker.debug_payload.connect(self.payload_captured.emit)
+        self.preload_worker.timing_recorded.connect(self.request_timed.emit)
         self.preload_worker.start()
 
     def append_chat(self, role, text, color, align_right=False):
-        cursor = self.chat_display.textCursor()
-        cursor.movePosition(QTextCursor.MoveOperation.End)
-
-        block_format = QTextBlockFormat()
-        block_format.setAlignment(
-            Qt.AlignmentFlag.AlignRight if align_right else Qt.AlignmentFlag.AlignLeft
-        )
-        cursor.insertBlock(block_format)
-
-        bubble_bg = "#dfefff" if align_right else "#ffffff"
-        bubble_text_color = "#2d3436"
-
-        # 简单的 HTML 转义防止显示异常
-        safe_text = text.replace("<", "&lt;").replace(">", "&gt;").replace("\n", "<br>")
-
-        html = f"""
-        <div style="margin: 5px;">
-            <span style="font-weight:bold; color:{color}; font-size:12px;">{role}</span><br>
-            <span style="
-                background-color: {bubble_bg};
-                color: {bubble_text_color};
-                padding: 8px;
-                border-radius: 8px;
-                display: inline-block;
-            ">{safe_text}</span>
-        </div>
-        """
-        cursor.insertHtml(html)
-        self.chat_display.ensureCursorVisible()
\ No newline at end of file
+        self.chat_display.append_message(role, text, color, align_right)
@@ -2,10 +2,18 @@
 # 自定义终端
 # ----------------------------
 from PyQt6.QtWidgets import QWidget, QVBoxLayout, QLabel, QTextEdit
-from PyQt6.QtCore import Qt, pyqtSignal
+from PyQt6.QtCore import Qt, pyqtSignal, QTimer
 from PyQt6.QtGui import QFont, QTextCursor, QTextCharFormat, QColor
+from collections import deque
 from datetime import datetime
+import html as html_lib
+import json
+import re
+import time
 from core.ai_engine import AIWorker
+from core.session_store import get_session_store
+from core.response_cache import get_response_cache
+from core.metrics import metrics, latency_stats
 
 
 class TerminalTextEdit(QTextEdit):
@@ -83,6 +91,12 @@ class TerminalTextEdit(QTextEdit):
         self.moveCursor(QTextCursor.MoveOperation.End)
 
     def append_html_log(self, html):
+        self.append_html_batch([html])
+
+    def append_html_batch(self, html_list):
+        """一次性插入多条日志，只做一次删除/恢复提示符"""
+        if not html_list:
+            return
         self.moveCursor(QTextCursor.MoveOperation.End)
         cursor = self.textCursor()
         cursor.select(QTextCursor.SelectionType.BlockUnderCursor)
@@ -97,7 +111,7 @@ class TerminalTextEdit(QTextEdit):
 
         # 插入日志
         self.moveCursor(QTextCursor.MoveOperation.End)
-        self.textCursor().insertHtml(html)
+        self.textCursor().insertHtml("".join(html_list))
 
         # 恢复提示符
         self.append("")
@@ -119,6 +133,20 @@ class ConsoleWidget(QWidget):
 
         self.terminal = TerminalTextEdit()
         self.terminal.command_signal.connect(self.execute_command)
+        # 超过上限后自动丢弃最早的行，文档大小保持有界
+        max_blocks = int(self.cfg.get("console_max_blocks"))
+        self.terminal.document().setMaximumBlockCount(max_blocks)
+
+        # 待输出的日志先缓冲，由定时器合并成一次插入
+        self.pending_html = deque(maxlen=max_blocks)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(int(self.cfg.get("console_flush_ms")))
+        self.flush_timer.timeout.connect(self.flush)
+
+        # 上一次 payload 的消息列表，用于只显示新增部分
+        self.last_payload = None
+        self.last_payload_messages = []
 
         layout.addWidget(self.terminal)
         self.setLayout(layout)
@@ -130,13 +158,214 @@ class ConsoleWidget(QWidget):
             self.terminal.insert_prompt()
             return
 
+        if cmd == "/payload":
+            self.show_full_payload()
+            return
+
+        if cmd == "/engine":
+            self.show_engine_stats()
+            return
+
+        if cmd == "/cache" or cmd == "/cache clear":
+            self.show_cache_stats(clear=cmd.endswith("clear"))
+            return
+
+        if cmd == "/stats" or cmd == "/stats reset":
+            self.show_latency_stats(reset=cmd.endswith("reset"))
+            return
+
+        if cmd == "/search" or cmd.startswith("/search "):
+            self.show_search_results(cmd[len("/search"):].strip())
+            return
+
         # 调用 AIWorker - direct_chat 模式
         # 这里仅作简单的 direct_chat 测试，不走 Options 逻辑
         self.worker = AIWorker(self.cfg, mode="direct_chat", prompt=cmd, context=[])
         self.worker.finished_reply.connect(self.on_worker_reply)
         self.worker.error_occurred.connect(self.on_worker_error)
+        self.worker.timing_recorded.connect(self.on_worker_timing)
         self.worker.start()
 
+    def post(self, html):
+        """缓冲一条日志，稍后批量刷新到终端"""
+        self.pending_html.append(html)
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def post_now(self, html):
+        """命令的直接回显：连同缓冲区一起立即刷新"""
+        self.pending_html.append(html)
+        self.flush()
+
+    def flush(self):
+        self.flush_timer.stop()
+        if not self.pending_html:
+            return
+        batch = list(self.pending_html)
+        self.pending_html.clear()
+        self.terminal.append_html_batch(batch)
+
+    def show_full_payload(self):
+        if not self.last_payload:
+            self.post_now('<div style="color: #888;">[PAYLOAD] 暂无请求</div>')
+            return
+        self.post_now(self._payload_html(self.last_payload, "[PAYLOAD FULL]"))
+
+    def _payload_html(self, text, tag):
+        time_str = datetime.now().strftime("%H:%M:%S.%f")[:-3]
+        safe_text = html_lib.escape(text).replace("\n", "<br>").replace("  ", "&nbsp;&nbsp;")
+        return f"""
+        <div style="border-top: 1px dashed #444; margin-top:5px;">
+          <span style="color: #666;">[{time_str}]</span>
+          <span style="color: #ffff00; font-weight: bold;">{tag} &gt;&gt;</span><br>
+          <span style="color: #808080; font-size: 11px;">
+            {safe_text}
+          </span>
+        </div>
+        """
+
+    def show_cache_stats(self, clear=False):
+        cache = get_response_cache(self.cfg)
+        if clear:
+            cache.clear()
+        stats = cache.stats()
+        html = f"""
+        <div style="color: #ffffff;">
+           <span style="color: #ffb86c; font-weight: bold;">[CACHE]</span>
+           <span> 命中 {stats['hits']} / 未命中 {stats['misses']}
+           （命中率 {stats['hit_ratio']:.1%}），缓存条目 {stats['entries']}</span><br>
+           <span style="color: #ffb86c; font-weight: bold;">[PROMPT CACHE]</span>
+           <span> 请求 {metrics.get('usage.requests')} 次，
+           cached {metrics.get('usage.cached_tokens')} / prompt {metrics.get('usage.prompt_tokens')} tokens
+           （命中率 {metrics.prompt_cache_ratio():.1%}）</span>
+        </div>
+        """
+        self.post_now(html)
+
+    def show_engine_stats(self):
+        started = metrics.get("engine.jobs_started")
+        avg_wait = metrics.get("engine.wait_ms_total") / started if started else 0.0
+        html = f"""
+        <div style="color: #ffffff;">
+           <span style="color: #8be9fd; font-weight: bold;">[ENGINE]</span>
+           <span> 排队 {metrics.get('engine.queue_depth')}，运行中 {metrics.get('engine.running')}，
+           已启动 {started}，合并/丢弃 {metrics.get('engine.coalesced')}，被取代 {metrics.get('engine.superseded')}，
+           平均等待 {avg_wait:.1f}ms，最长等待 {metrics.get('engine.wait_ms_max'):.1f}ms</span><br>
+           <span style="color: #8be9fd; font-weight: bold;">[SPECULATION]</span>
+           <span> 预测生成 {metrics.get('speculation.started')} 次，采用 {metrics.get('speculation.adopted')}，
+           中途取消 {metrics.get('speculation.cancelled')}，完成未采用 {metrics.get('speculation.wasted')}，
+           超出限额 {metrics.get('speculation.over_budget')}</span><br>
+           <span style="color: #8be9fd; font-weight: bold;">[CLIPBOARD]</span>
+           <span> 事件 {metrics.get('clipboard.events')}，接收 {metrics.get('clipboard.accepted')}，
+           丢弃 {metrics.get('clipboard.dropped')}（{self._clipboard_drop_reasons()}），
+           截断 {metrics.get('clipboard.truncated')}</span>
+        </div>
+        """
+        self.post_now(html)
+
+    @staticmethod
+    def _clipboard_drop_reasons():
+        reasons = (("debounced", "合并"), ("echo", "自身回复"), ("duplicate", "重复"), ("oversize", "过长"),
+                   ("non_text", "非文本"), ("empty", "空"), ("disabled", "未启用"),
+                   ("busy", "会话忙"))
+        return "，".join(f"{title} {metrics.get('clipboard.dropped.' + name)}" for name, title in reasons)
+
+    def show_latency_stats(self, reset=False):
+        if reset:
+            latency_stats.reset()
+            metrics.reset("options.")
+        report = latency_stats.report()
+        if not report:
+            self.post_now('<div style="color: #888;">[STATS] 暂无请求记录</div>')
+            return
+
+        def fmt(values):
+            if values[0] is None:
+                return "-"
+            return " / ".join(f"{v:.0f}" for v in values)
+
+        columns = [("total_ms", "总耗时"), ("first_token_ms", "首个片段"), ("ttfb_ms", "首字节"),
+                   ("acquire_ms", "取连接"), ("queue_ms", "排队"), ("build_ms", "构建"),
+                   ("parse_ms", "解析")]
+        header = "".join(f'<th style="padding: 0 8px;">{title}</th>' for _, title in columns)
+        rows = []
+        for (mode, model), row in sorted(report.items()):
+            cells = "".join(f'<td style="padding: 0 8px;">{fmt(row[name])}</td>' for name, _ in columns)
+            tokens = f"{row['prompt_tokens'][0] or 0:.0f}+{row['completion_tokens'][0] or 0:.0f}"
+            error_color = "#ff5555" if row["error_rate"] else "#aaa"
+            rows.append(
+                f'<tr><td style="padding: 0 8px; color: #8be9fd;">{html_lib.escape(mode)}</td>'
+                f'<td style="padding: 0 8px;">{html_lib.escape(str(model))}</td>'
+                f'<td style="padding: 0 8px;">{row["count"]}</td>'
+                f'<td style="padding: 0 8px; color: {error_color};">{row["error_rate"]:.0%}</td>'
+                f'{cells}<td style="padding: 0 8px;">{tokens}</td></tr>')
+
+        html = f"""
+        <div style="color: #ffffff;">
+           <span style="color: #bd93f9; font-weight: bold;">[STATS]</span>
+           <span> 最近 {latency_stats.window} 次请求，单位 ms，格式 p50 / p95 / p99</span>
+           <table style="color: #ddd; font-size: 11px;">
+             <tr style="color: #888;"><th style="padding: 0 8px;">模式</th><th style="padding: 0 8px;">模型</th>
+             <th style="padding: 0 8px;">次数</th><th style="padding: 0 8px;">错误率</th>{header}
+             <th style="padding: 0 8px;">tokens(p50)</th></tr>
+             {"".join(rows)}
+           </table>
+           {self._option_quality_html()}
+        </div>
+        """
+        self.post_now(html)
+
+    @staticmethod
+    def _option_quality_html():
+        """选项格式质量：首次回复中格式正确 / 本地修复 / 不完整 / 失败的比例，以及补全请求的效果"""
+        total = metrics.get("options.parse.total")
+        if not total:
+            return ""
+        rates = "，".join(
+            f"{title} {metrics.get('options.parse.' + name) / total:.0%}"
+            for name, title in (("clean", "格式正确"), ("repaired", "本地修复"),
+                                ("partial", "不完整"), ("failed", "失败")))
+        return (f'<span style="color: #bd93f9; font-weight: bold;">[OPTIONS]</span>'
+                f'<span> 解析 {total} 次：{rates}；补全请求 {metrics.get("options.refill.requests")} 次，'
+                f'补回 {metrics.get("options.refill.recovered")} 个，占位 {metrics.get("options.padded")} 个</span>')
+
+    def show_search_results(self, query, limit=20):
+        if not query:
+            self.post_now('<div style="color: #888;">[SEARCH] 用法: /search &lt;关键词&gt;</div>')
+            return
+        if not self.cfg.get("session_store_enabled"):
+            self.post_now('<div style="color: #888;">[SEARCH] 会话存储未开启</div>')
+            return
+
+        start = time.perf_counter()
+        results = get_session_store(self.cfg).search(query, limit=limit)
+        elapsed = (time.perf_counter() - start) * 1000
+
+        terms = [re.escape(html_lib.escape(t)) for t in query.split()]
+        pattern = re.compile("|".join(terms))
+
+        def mark(text):
+            return pattern.sub(lambda m: f'<span style="color: #f1fa8c;">{m.group(0)}</span>',
+                               html_lib.escape(text))
+
+        lines = []
+        for r in results:
+            time_str = datetime.fromtimestamp(r["created_at"]).strftime("%Y-%m-%d %H:%M")
+            line = (f'<span style="color: #666;">[{time_str} #{r["session_id"]}:{r["seq"]}]</span> '
+                    f'<span style="color: #8be9fd;">{html_lib.escape(r["name"])}:</span> {mark(r["content"])}')
+            if r["reply"]:
+                line += f'<br><span style="color: #666; margin-left: 10px;">&nbsp;&nbsp;↳ {mark(r["reply"])}</span>'
+            lines.append(line)
+
+        html = f"""
+        <div style="color: #ffffff;">
+           <span style="color: #50fa7b; font-weight: bold;">[SEARCH]</span>
+           <span> “{html_lib.escape(query)}” {len(results)} 条结果（{elapsed:.1f}ms）</span><br>
+           {"<br>".join(lines)}
+        </div>
+        """
+        self.post_now(html)
+
     def on_worker_reply(self, reply):
         time_str = datetime.now().strftime("%H:%M:%S")
         html = f"""
@@ -146,7 +375,13 @@ class ConsoleWidget(QWidget):
            <span> {reply}</span>
         </div>
         """
-        self.terminal.append_html_log(html)
+        self.post(html)
+
+    def on_worker_timing(self, timing):
+        parts = [f"{name}={timing[name]:.0f}ms" for name in ("queue_ms", "acquire_ms", "ttfb_ms", "total_ms")
+                 if timing[name] is not None]
+        self.post(f'<div style="color: #666;">[TIMING] {" ".join(parts)}'
+                  f' tokens={timing["prompt_tokens"]}+{timing["completion_tokens"]}</div>')
 
     def on_worker_error(self, err):
         html = f"""
@@ -155,21 +390,29 @@ class ConsoleWidget(QWidget):
            {err}
         </div>
         """
-        self.terminal.append_html_log(html)
+        self.post(html)
 
     # --- 外部监视接口 ---
     def append_outgoing_payload(self, json_str):
-        time_str = datetime.now().strftime("%H:%M:%S.%f")[:-3]
-        html = f"""
-        <div style="border-top: 1px dashed #444; margin-top:5px;">
-          <span style="color: #666;">[{time_str}]</span>
-          <span style="color: #ffff00; font-weight: bold;">[PAYLOAD] &gt;&gt;</span><br>
-          <span style="color: #808080; font-size: 11px;">
-            {json_str}
-          </span>
-        </div>
-        """
-        self.terminal.append_html_log(html)
+        """只显示相对上一次请求新增的消息，完整内容可用 /payload 查看"""
+        self.last_payload = json_str
+        try:
+            payload = json.loads(json_str)
+        except ValueError:
+            self.post(self._payload_html(json_str, "[PAYLOAD]"))
+            return
+
+        messages = payload.get("messages", [])
+        prev = self.last_payload_messages
+        common = 0
+        while common < min(len(prev), len(messages)) and prev[common] == messages[common]:
+            common += 1
+        self.last_payload_messages = messages
+
+        payload["messages"] = messages[common:]
+        if common:
+            payload["omitted_messages"] = f"与上次相同的 {common} 条（/payload 查看完整内容）"
+        self.post(self._payload_html(json.dumps(payload, indent=2, ensure_ascii=False), "[PAYLOAD]"))
 
     def append_generated_options(self, options):
 
@@ -198,7 +441,7 @@ class ConsoleWidget(QWidget):
         </div>
         """
 
-        self.terminal.append_html_log(html)
+        self.post(html)
 
     def append_incoming_reply(self, content):
         time_str = datetime.now().strftime("%H:%M:%S.%f")[:-3]
@@ -213,4 +456,4 @@ class ConsoleWidget(QWidget):
           </span>
         </div>
         """
-        self.terminal.append_html_log(html)
+        self.post(html)
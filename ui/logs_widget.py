@@ -1,21 +1,99 @@
 # ----------------------------
 # 日志界面
 # ----------------------------
-from PyQt6.QtWidgets import QWidget, QVBoxLayout, QTextEdit
+from PyQt6.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QPlainTextEdit,
+                             QComboBox, QLabel)
+from PyQt6.QtCore import QTimer
+from collections import deque
 from datetime import datetime
 
+from core.log_pipeline import get_log_pipeline, LEVELS
+
+
 class LogsWidget(QWidget):
-    def __init__(self):
+    """
+    日志的实时视图：append_log 只写入环形缓冲并交给后台管线落盘，
+    界面由定时器限速刷新，只保留最近的若干行。
+    缓冲保存所有级别的记录，级别下拉框只在显示时过滤；
+    写入文件的级别由 log_level 决定，与界面无关。
+    """
+
+    # 每次刷新最多插入的行数，超出部分只计数
+    MAX_LINES_PER_FLUSH = 200
+
+    def __init__(self, config_manager):
         super().__init__()
+        self.cfg = config_manager
+        self.pipeline = get_log_pipeline(self.cfg)
+        max_lines = int(self.cfg.get("log_view_max_lines"))
+        self.records = deque(maxlen=max_lines)
+        self.pending = deque(maxlen=max_lines)
+        self.pending_total = 0
+
         layout = QVBoxLayout()
         layout.setContentsMargins(0, 0, 0, 0)
-        self.log_area = QTextEdit()
+        layout.setSpacing(0)
+
+        bar = QHBoxLayout()
+        bar.setContentsMargins(10, 5, 10, 5)
+        bar.addWidget(QLabel("级别:"))
+        self.level_combo = QComboBox()
+        self.level_combo.addItems(list(LEVELS))
+        self.level_combo.setCurrentText("INFO")
+        self.level_combo.currentTextChanged.connect(self.rebuild_view)
+        bar.addWidget(self.level_combo)
+        bar.addStretch()
+        layout.addLayout(bar)
+
+        self.log_area = QPlainTextEdit()
         self.log_area.setReadOnly(True)
+        self.log_area.setMaximumBlockCount(max_lines)
         self.log_area.setStyleSheet(
             "background-color: #222; color: #888; border: none; font-family: Consolas; font-size: 12px;")
         layout.addWidget(self.log_area)
         self.setLayout(layout)
 
-    def append_log(self, text):
-        time_str = datetime.now().strftime("%H:%M:%S")
-        self.log_area.append(f"[{time_str}] {text}")
+        self.flush_timer = QTimer(self)
+        self.flush_timer.setSingleShot(True)
+        self.flush_timer.setInterval(200)
+        self.flush_timer.timeout.connect(self.flush)
+
+    def append_log(self, text, level="INFO", **fields):
+        # 低于 log_level 的记录由管线自行跳过，不写入文件
+        self.pipeline.log(level, text, **fields)
+
+        record = (datetime.now().strftime("%H:%M:%S"), level, text)
+        self.records.append(record)
+        self.pending.append(record)
+        self.pending_total += 1
+        if not self.flush_timer.isActive():
+            self.flush_timer.start()
+
+    def _visible(self, record):
+        return LEVELS[record[1]] >= LEVELS[self.level_combo.currentText()]
+
+    @staticmethod
+    def _format(record):
+        time_str, level, text = record
+        prefix = "" if level == "INFO" else f"[{level}] "
+        return f"[{time_str}] {prefix}{text}"
+
+    def flush(self):
+        # 缓冲溢出被挤掉的记录也计入省略数
+        overflow = self.pending_total - len(self.pending)
+        lines = [self._format(r) for r in self.pending if self._visible(r)]
+        self.pending.clear()
+        self.pending_total = 0
+        if len(lines) > self.MAX_LINES_PER_FLUSH:
+            overflow += len(lines) - self.MAX_LINES_PER_FLUSH
+            lines = lines[-self.MAX_LINES_PER_FLUSH:]
+        if overflow:
+            lines.insert(0, f"... 日志过多，已省略 {overflow} 条（完整内容见日志文件）")
+        if lines:
+            self.log_area.appendPlainText("\n".join(lines))
+
+    def rebuild_view(self):
+        """切换级别过滤后，用环形缓冲中的记录重绘"""
+        self.pending.clear()
+        self.pending_total = 0
+        self.log_area.setPlainText("\n".join(self._format(r) for r in self.records if self._visible(r)))
@@ -0,0 +1,247 @@
+# ----------------------------
+# 多会话标签页
+# ----------------------------
+import time
+
+from PyQt6.QtWidgets import QWidget, QVBoxLayout, QTabWidget, QToolButton
+from PyQt6.QtCore import pyqtSignal, QTimer
+
+from core.input_handler import InputHandler
+from core.direction_manager import DirectionManager
+from core.session_store import get_session_store
+from ui.chat_widget import ChatWidget, ConversationState
+
+
+class SessionPlaceholder(QWidget):
+    """尚未打开（或已卸载）的会话：只记住会话 id，切换过去时才创建 ChatWidget"""
+
+    def __init__(self, session_id):
+        super().__init__()
+        self.session_id = session_id
+
+
+class SessionTabs(QWidget):
+    """
+    每个标签页是一个独立的会话（历史、状态机、待选方案各自独立），
+    所有会话共享同一个请求引擎、剪贴板监听与词库。
+    引擎按会话公平调度，一个会话生成选项不会阻塞其他会话。
+
+    为了让大量空闲会话保持轻量：
+    - 启动时只创建当前标签的 ChatWidget，其余标签在第一次切换过去时才创建；
+    - 长时间没有切换回来、且没有进行中请求的会话会被卸载为占位页，
+      内容已写入会话存储，再次打开时按需恢复。
+    """
+
+    # 与 ChatWidget 相同的对外信号，来自任意一个会话
+    payload_captured = pyqtSignal(str)
+    reply_received = pyqtSignal(str)
+    options_generated = pyqtSignal(list)
+    context_usage_changed = pyqtSignal(str)
+    request_timed = pyqtSignal(dict)
+
+    def __init__(self, config_manager, log_callback):
+        super().__init__()
+        self.cfg = config_manager
+        self.log = log_callback
+        # ChatWidget -> 最近一次处于当前标签的时间（离开时也会更新）
+        self.last_active = {}
+        self.active_chat = None
+
+        self.input_handler = InputHandler(self.cfg)
+        self.input_handler.new_message_received.connect(self.on_external_message)
+        self.dir_manager = DirectionManager(background=True)
+        self.session_store = get_session_store(self.cfg) if self.cfg.get("session_store_enabled") else None
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.tabs = QTabWidget()
+        self.tabs.setTabsClosable(True)
+        self.tabs.setMovable(True)
+        self.tabs.setDocumentMode(True)
+        self.tabs.currentChanged.connect(self.on_current_changed)
+        self.tabs.tabCloseRequested.connect(self.close_session)
+        new_btn = QToolButton()
+        new_btn.setText("+")
+        new_btn.setToolTip("新建会话")
+        new_btn.clicked.connect(lambda: self.new_session())
+        self.tabs.setCornerWidget(new_btn)
+        layout.addWidget(self.tabs)
+
+        self.unload_timer = QTimer(self)
+        self.unload_timer.timeout.connect(self.unload_idle_sessions)
+        self.unload_timer.start(60 * 1000)
+
+        self.apply_config()
+        self.restore_sessions()
+
+    # --- 会话管理 ---
+    def restore_sessions(self):
+        """恢复上次打开的会话：只为第一个标签创建 ChatWidget"""
+        session_ids = []
+        if self.session_store:
+            session_ids = [sid for sid in self.cfg.get("open_sessions") or [] if self.session_store.session_exists(sid)]
+            if not session_ids:
+                latest = self.session_store.latest_session()
+                session_ids = [latest] if latest else []
+        if not session_ids:
+            self.new_session()
+            return
+        self.tabs.blockSignals(True)
+        for sid in session_ids:
+            self.tabs.addTab(SessionPlaceholder(sid), self.session_title(sid))
+        self.tabs.blockSignals(False)
+        self.on_current_changed(self.tabs.currentIndex())
+        self.save_open_sessions()
+
+    def new_session(self):
+        session_id = self.session_store.create_session() if self.session_store else None
+        index = self.tabs.addTab(SessionPlaceholder(session_id), self.session_title(session_id))
+        self.tabs.setCurrentIndex(index)
+        self.save_open_sessions()
+        return self.tabs.widget(index)
+
+    def open_session(self, session_id, seq=None):
+        """切换到指定会话（没有打开时新开一个标签），可选地跳转到某条消息"""
+        index = self.index_of_session(session_id)
+        if index < 0:
+            index = self.tabs.addTab(SessionPlaceholder(session_id), self.session_title(session_id))
+            self.save_open_sessions()
+        self.tabs.setCurrentIndex(index)
+        if seq is not None:
+            self.current_chat().jump_to_message(session_id, seq)
+
+    def close_session(self, index):
+        widget = self.tabs.widget(index)
+        if isinstance(widget, ChatWidget):
+            widget.shutdown()
+            self.last_active.pop(widget, None)
+        self.tabs.removeTab(index)
+        widget.deleteLater()
+        if self.tabs.count() == 0:
+            self.new_session()
+        self.save_open_sessions()
+
+    def index_of_session(self, session_id):
+        for i in range(self.tabs.count()):
+            if session_id is not None and self.tabs.widget(i).session_id == session_id:
+                return i
+        return -1
+
+    def session_title(self, session_id):
+        if session_id is None:
+            return f"会话 {self.tabs.count() + 1}"
+        first = self.session_store.load_range(session_id, 0, 1)
+        snippet = first[0][3][:8] if first else "新会话"
+        return f"#{session_id} {snippet}"
+
+    def save_open_sessions(self):
+        if not self.session_store:
+            return
+        ids = [self.tabs.widget(i).session_id for i in range(self.tabs.count())]
+        if ids != self.cfg.get("open_sessions"):
+            self.cfg.set("open_sessions", ids)
+
+    def current_chat(self):
+        widget = self.tabs.currentWidget()
+        return widget if isinstance(widget, ChatWidget) else None
+
+    def chats(self):
+        return [w for w in (self.tabs.widget(i) for i in range(self.tabs.count())) if isinstance(w, ChatWidget)]
+
+    def on_current_changed(self, index):
+        if index < 0:
+            return
+        now = time.monotonic()
+        # 离开的标签从此刻起才开始计算空闲时间
+        if self.active_chat in self.last_active:
+            self.last_active[self.active_chat] = now
+        widget = self.tabs.widget(index)
+        if isinstance(widget, SessionPlaceholder):
+            widget = self.materialize(index)
+        self.last_active[widget] = now
+        self.active_chat = widget
+        self.update_tab_title(widget)
+        self.context_usage_changed.emit(widget.context_window.usage_text())
+
+    def materialize(self, index):
+        """把占位页替换为真正的 ChatWidget"""
+        placeholder = self.tabs.widget(index)
+        chat = ChatWidget(self.cfg, self.log, input_handler=self.input_handler,
+                          dir_manager=self.dir_manager, session_id=placeholder.session_id)
+        chat.payload_captured.connect(self.payload_captured.emit)
+        chat.reply_received.connect(self.reply_received.emit)
+        chat.options_generated.connect(self.options_generated.emit)
+        chat.request_timed.connect(self.request_timed.emit)
+        chat.context_usage_changed.connect(
+            lambda text, c=chat: c is self.tabs.currentWidget() and self.context_usage_changed.emit(text))
+        chat.state_changed.connect(lambda c=chat: self.update_tab_title(c))
+        chat.open_session_requested.connect(self.open_session)
+        self.replace_tab(index, chat)
+        return chat
+
+    def replace_tab(self, index, widget):
+        old = self.tabs.widget(index)
+        title = self.tabs.tabText(index)
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, widget, title)
+        self.tabs.setCurrentIndex(index)
+        self.tabs.blockSignals(False)
+        old.deleteLater()
+
+    def update_tab_title(self, chat):
+        index = self.tabs.indexOf(chat)
+        if index < 0:
+            return
+        title = self.session_title(chat.session_id) if chat.session_id else self.tabs.tabText(index).lstrip("● ")
+        # 后台标签有待选方案时加上标记
+        if chat.state != ConversationState.IDLE:
+            title = "● " + title
+        self.tabs.setTabText(index, title)
+
+    def unload_idle_sessions(self):
+        """卸载长时间未切换回来、且空闲的会话，释放其界面与历史占用的内存"""
+        minutes = float(self.cfg.get("session_idle_unload_minutes") or 0)
+        if minutes <= 0 or not self.session_store:
+            return
+        now = time.monotonic()
+        current = self.tabs.currentWidget()
+        for chat in self.chats():
+            if chat is current or chat.is_busy():
+                continue
+            if now - self.last_active.get(chat, now) < minutes * 60:
+                continue
+            index = self.tabs.indexOf(chat)
+            chat.shutdown()
+            self.last_active.pop(chat, None)
+            self.tabs.blockSignals(True)
+            self.tabs.removeTab(index)
+            self.tabs.insertTab(index, SessionPlaceholder(chat.session_id), self.session_title(chat.session_id))
+            self.tabs.setCurrentWidget(current)
+            self.tabs.blockSignals(False)
+            chat.deleteLater()
+            self.log(f"会话 #{chat.session_id} 长时间未使用，已卸载", level="DEBUG")
+
+    # --- 与单个 ChatWidget 相同的接口，作用于当前会话 ---
+    def on_external_message(self, text):
+        chat = self.current_chat()
+        if chat:
+            chat.on_external_message(text)
+        else:
+            self.input_handler.reject_input("busy")
+
+    def apply_config(self):
+        is_monitor_on = self.cfg.get("enable_clipboard_monitor")
+        self.input_handler.set_enabled(is_monitor_on)
+        state_text = "开启" if is_monitor_on else "关闭"
+        self.log(f"剪贴板监听已{state_text}")
+
+    def apply_heartbeat(self):
+        for chat in self.chats():
+            chat.apply_heartbeat()
+
+    def run_preload(self):
+        # 连接池是共享的，预热一次即可
+        chat = self.current_chat()
+        if chat:
+            chat.run_preload()
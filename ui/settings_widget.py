@@ -4,15 +4,14 @@
 from PyQt6.QtWidgets import (
     QWidget, QFormLayout, QLineEdit,
     QTextEdit, QPushButton, QMessageBox,
-    QLabel, QComboBox, QCheckBox
+    QLabel, QComboBox, QCheckBox, QSpinBox
 )
 
 class SettingsWidget(QWidget):
-    def __init__(self, config_manager, log_callback, on_save_callback=None):
+    def __init__(self, config_manager, log_callback):
         super().__init__()
         self.cfg = config_manager
         self.log = log_callback
-        self.on_save_callback = on_save_callback
         self.init_ui()
 
     def init_ui(self):
@@ -33,6 +32,23 @@ class SettingsWidget(QWidget):
         self.model_combo.setCurrentText(self.cfg.get("model"))
         layout.addRow("聊天模型:", self.model_combo)
 
+        self.connect_timeout_spin = QSpinBox()
+        self.connect_timeout_spin.setRange(1, 120)
+        self.connect_timeout_spin.setSuffix(" s")
+        self.connect_timeout_spin.setValue(int(self.cfg.get("connect_timeout")))
+        layout.addRow("连接超时:", self.connect_timeout_spin)
+
+        self.read_timeout_spin = QSpinBox()
+        self.read_timeout_spin.setRange(5, 600)
+        self.read_timeout_spin.setSuffix(" s")
+        self.read_timeout_spin.setValue(int(self.cfg.get("read_timeout")))
+        layout.addRow("读取超时:", self.read_timeout_spin)
+
+        self.retries_spin = QSpinBox()
+        self.retries_spin.setRange(0, 10)
+        self.retries_spin.setValue(int(self.cfg.get("max_retries")))
+        layout.addRow("失败重试次数:", self.retries_spin)
+
         layout.addRow(QLabel("<b>--- 个性化设置 ---</b>"))
 
         self.user_name_input = QLineEdit(self.cfg.get("user_name"))
@@ -45,10 +61,89 @@ class SettingsWidget(QWidget):
         self.clipboard_check.setChecked(self.cfg.get("enable_clipboard_monitor"))
         layout.addRow("输入源:", self.clipboard_check)
 
+        self.clipboard_max_spin = QSpinBox()
+        self.clipboard_max_spin.setRange(100, 100000)
+        self.clipboard_max_spin.setSingleStep(500)
+        self.clipboard_max_spin.setSuffix(" 字")
+        self.clipboard_max_spin.setValue(int(self.cfg.get("clipboard_max_chars")))
+        layout.addRow("剪贴板长度上限:", self.clipboard_max_spin)
+
+        self.clipboard_truncate_check = QCheckBox("超长时截断（否则忽略）")
+        self.clipboard_truncate_check.setChecked(self.cfg.get("clipboard_oversize") == "truncate")
+        layout.addRow("", self.clipboard_truncate_check)
+
+        self.speculation_spin = QSpinBox()
+        self.speculation_spin.setRange(0, 60)
+        self.speculation_spin.setSuffix(" 次/分钟")
+        self.speculation_spin.setSpecialValueText("关闭")
+        self.speculation_spin.setValue(int(self.cfg.get("speculation_budget_per_minute")))
+        self.speculation_spin.setToolTip("剪贴板文本进入输入框后提前生成选项，发送同样的文本时直接显示")
+        layout.addRow("预测生成:", self.speculation_spin)
+
         self.preset_checkbox = QCheckBox("启用预设回复库")
         self.preset_checkbox.setChecked(self.cfg.get("use_preset_directions"))
         layout.addRow("回复策略:", self.preset_checkbox)
 
+        self.option_source_combo = QComboBox()
+        for text, value in [("模型生成", "remote"), ("仅本地词库", "local"), ("竞速（超时先显示本地）", "race")]:
+            self.option_source_combo.addItem(text, value)
+        index = self.option_source_combo.findData(self.cfg.get("option_source"))
+        self.option_source_combo.setCurrentIndex(max(0, index))
+        layout.addRow("选项来源:", self.option_source_combo)
+
+        self.deadline_spin = QSpinBox()
+        self.deadline_spin.setRange(200, 30000)
+        self.deadline_spin.setSingleStep(250)
+        self.deadline_spin.setSuffix(" ms")
+        self.deadline_spin.setValue(int(self.cfg.get("local_option_deadline_ms")))
+        layout.addRow("竞速期限:", self.deadline_spin)
+
+        self.warmup_combo = QComboBox()
+        for text, value in [("仅建立连接 (GET /models)", "models"),
+                            ("发送预热请求（消耗 tokens，同时预热提示缓存）", "completion"),
+                            ("关闭", "off")]:
+            self.warmup_combo.addItem(text, value)
+        index = self.warmup_combo.findData(self.cfg.get("warmup_mode"))
+        self.warmup_combo.setCurrentIndex(max(0, index))
+        layout.addRow("连接预热:", self.warmup_combo)
+
+        self.heartbeat_spin = QSpinBox()
+        self.heartbeat_spin.setRange(0, 600)
+        self.heartbeat_spin.setSingleStep(15)
+        self.heartbeat_spin.setSuffix(" s")
+        self.heartbeat_spin.setSpecialValueText("关闭")
+        self.heartbeat_spin.setValue(int(self.cfg.get("heartbeat_interval")))
+        layout.addRow("空闲心跳:", self.heartbeat_spin)
+
+        self.stream_checkbox = QCheckBox("流式生成选项（逐个显示）")
+        self.stream_checkbox.setChecked(self.cfg.get("stream_options"))
+        layout.addRow("生成方式:", self.stream_checkbox)
+
+        self.output_format_combo = QComboBox()
+        for text, value in [("文本行 [方向词] 正文", "text"),
+                            ("结构化输出 (JSON Schema)", "json_schema"),
+                            ("JSON 模式 (json_object)", "json_object")]:
+            self.output_format_combo.addItem(text, value)
+        index = self.output_format_combo.findData(self.cfg.get("option_output_format"))
+        self.output_format_combo.setCurrentIndex(max(0, index))
+        layout.addRow("选项格式:", self.output_format_combo)
+
+        self.refill_spin = QSpinBox()
+        self.refill_spin.setRange(0, 3)
+        self.refill_spin.setSpecialValueText("不补全（用占位补齐）")
+        self.refill_spin.setSuffix(" 次")
+        self.refill_spin.setValue(int(self.cfg.get("option_refill_attempts")))
+        layout.addRow("补全缺失选项:", self.refill_spin)
+
+        self.context_budget_spin = QSpinBox()
+        self.context_budget_spin.setRange(200, 200000)
+        self.context_budget_spin.setSingleStep(500)
+        self.context_budget_spin.setValue(int(self.cfg.get("context_token_budget")))
+        layout.addRow("上下文预算 (tokens):", self.context_budget_spin)
+
+        self.context_usage_label = QLabel("尚未发送请求")
+        layout.addRow("当前上下文占用:", self.context_usage_label)
+
         self.sys_prompt_edit = QTextEdit(self.cfg.get("system_prompt"))
         self.sys_prompt_edit.setMaximumHeight(100)
         layout.addRow("系统人设:", self.sys_prompt_edit)
@@ -59,16 +154,33 @@ class SettingsWidget(QWidget):
         layout.addRow(self.save_btn)
         self.setLayout(layout)
 
+    def update_context_usage(self, text):
+        self.context_usage_label.setText(text)
+
     def save_settings(self):
-        self.cfg.set("api_key", self.api_input.text().strip())
-        self.cfg.set("base_url", self.url_input.text().strip())
-        self.cfg.set("model", self.model_combo.currentText().strip())
-        self.cfg.set("system_prompt", self.sys_prompt_edit.toPlainText().strip())
-        self.cfg.set("user_name", self.user_name_input.text().strip())
-        self.cfg.set("ai_name", self.ai_name_input.text().strip())
-        self.cfg.set("use_preset_directions", self.preset_checkbox.isChecked())
-        self.cfg.set("enable_clipboard_monitor", self.clipboard_check.isChecked())
+        # 一次提交、一次写盘；后续动作由配置变更通知按实际变化的键触发
+        with self.cfg.batch():
+            self.cfg.set("api_key", self.api_input.text().strip())
+            self.cfg.set("base_url", self.url_input.text().strip())
+            self.cfg.set("model", self.model_combo.currentText().strip())
+            self.cfg.set("connect_timeout", self.connect_timeout_spin.value())
+            self.cfg.set("read_timeout", self.read_timeout_spin.value())
+            self.cfg.set("max_retries", self.retries_spin.value())
+            self.cfg.set("system_prompt", self.sys_prompt_edit.toPlainText().strip())
+            self.cfg.set("user_name", self.user_name_input.text().strip())
+            self.cfg.set("ai_name", self.ai_name_input.text().strip())
+            self.cfg.set("use_preset_directions", self.preset_checkbox.isChecked())
+            self.cfg.set("enable_clipboard_monitor", self.clipboard_check.isChecked())
+            self.cfg.set("clipboard_max_chars", self.clipboard_max_spin.value())
+            self.cfg.set("clipboard_oversize", "truncate" if self.clipboard_truncate_check.isChecked() else "reject")
+            self.cfg.set("speculation_budget_per_minute", self.speculation_spin.value())
+            self.cfg.set("stream_options", self.stream_checkbox.isChecked())
+            self.cfg.set("option_output_format", self.output_format_combo.currentData())
+            self.cfg.set("option_refill_attempts", self.refill_spin.value())
+            self.cfg.set("context_token_budget", self.context_budget_spin.value())
+            self.cfg.set("option_source", self.option_source_combo.currentData())
+            self.cfg.set("local_option_deadline_ms", self.deadline_spin.value())
+            self.cfg.set("warmup_mode", self.warmup_combo.currentData())
+            self.cfg.set("heartbeat_interval", self.heartbeat_spin.value())
 
         QMessageBox.information(self, "成功", "设置已保存")
-        if self.on_save_callback:
-            self.on_save_callback()
\ No newline at end of file
@@ -0,0 +1,185 @@
+# ----------------------------
+# 聊天记录视图（模型/视图）
+# ----------------------------
+from PyQt6.QtWidgets import QListView, QStyledItemDelegate, QAbstractItemView
+from PyQt6.QtCore import Qt, QAbstractListModel, QModelIndex, QRect, QSize, pyqtSignal
+from PyQt6.QtGui import QColor, QFont, QFontMetrics, QPainter
+
+RECORD_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+class MessageRecord:
+    """单条消息的紧凑记录，附带按宽度缓存的气泡布局"""
+    __slots__ = ("name", "text", "color", "align_right", "seq", "layout_width", "layout")
+
+    def __init__(self, name, text, color, align_right, seq=None):
+        self.name = name
+        self.text = text
+        self.color = color
+        self.align_right = align_right
+        self.seq = seq  # 在会话存储中的序号，尚未保存时为 None
+        self.layout_width = -1
+        self.layout = None  # (气泡文字区域宽, 文字高, 行总高)
+
+
+class TranscriptModel(QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.records = []
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.records)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        record = self.records[index.row()]
+        if role == RECORD_ROLE:
+            return record
+        if role == Qt.ItemDataRole.DisplayRole:
+            return record.text
+        return None
+
+    def append(self, record):
+        row = len(self.records)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self.records.append(record)
+        self.endInsertRows()
+
+    def prepend(self, records):
+        """在顶部插入更早的消息（向上翻页加载历史）"""
+        if not records:
+            return
+        self.beginInsertRows(QModelIndex(), 0, len(records) - 1)
+        self.records[0:0] = records
+        self.endInsertRows()
+
+    def row_of_seq(self, seq):
+        for row in range(len(self.records) - 1, -1, -1):
+            if self.records[row].seq == seq:
+                return row
+        return -1
+
+    def clear(self):
+        self.beginResetModel()
+        self.records = []
+        self.endResetModel()
+
+
+class BubbleDelegate(QStyledItemDelegate):
+    """绘制聊天气泡，只有可见行会被绘制；气泡尺寸按视图宽度缓存在记录上"""
+
+    MARGIN = 8
+    PADDING = 8
+    NAME_GAP = 4
+    RADIUS = 8
+    MAX_RATIO = 0.7
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.text_font = QFont()
+        self.text_font.setPointSize(11)
+        self.name_font = QFont()
+        self.name_font.setPointSize(9)
+        self.name_font.setBold(True)
+        self.text_metrics = QFontMetrics(self.text_font)
+        self.name_metrics = QFontMetrics(self.name_font)
+
+    def _layout(self, record, width):
+        if record.layout_width != width:
+            max_text_width = max(40, int(width * self.MAX_RATIO) - 2 * self.PADDING)
+            rect = self.text_metrics.boundingRect(
+                QRect(0, 0, max_text_width, 100000),
+                Qt.TextFlag.TextWordWrap, record.text
+            )
+            text_width = min(max_text_width, rect.width())
+            height = (self.MARGIN + self.name_metrics.height() + self.NAME_GAP
+                      + rect.height() + 2 * self.PADDING + self.MARGIN)
+            record.layout = (text_width, rect.height(), height)
+            record.layout_width = width
+        return record.layout
+
+    def sizeHint(self, option, index):
+        record = index.data(RECORD_ROLE)
+        width = option.rect.width() if option.rect.width() > 0 else 600
+        return QSize(width, self._layout(record, width)[2])
+
+    def paint(self, painter, option, index):
+        record = index.data(RECORD_ROLE)
+        text_width, text_height, _ = self._layout(record, option.rect.width())
+        rect = option.rect
+
+        painter.save()
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing)
+
+        bubble_width = text_width + 2 * self.PADDING
+        if record.align_right:
+            x = rect.right() - self.MARGIN - bubble_width
+        else:
+            x = rect.left() + self.MARGIN
+        y = rect.top() + self.MARGIN
+
+        # 名字
+        painter.setFont(self.name_font)
+        painter.setPen(QColor(record.color))
+        name_align = Qt.AlignmentFlag.AlignRight if record.align_right else Qt.AlignmentFlag.AlignLeft
+        painter.drawText(QRect(rect.left() + self.MARGIN, y, rect.width() - 2 * self.MARGIN,
+                               self.name_metrics.height()), name_align, record.name)
+        y += self.name_metrics.height() + self.NAME_GAP
+
+        # 气泡
+        bubble = QRect(x, y, bubble_width, text_height + 2 * self.PADDING)
+        painter.setPen(Qt.PenStyle.NoPen)
+        painter.setBrush(QColor("#dfefff" if record.align_right else "#ffffff"))
+        painter.drawRoundedRect(bubble, self.RADIUS, self.RADIUS)
+
+        painter.setFont(self.text_font)
+        painter.setPen(QColor("#2d3436"))
+        painter.drawText(bubble.adjusted(self.PADDING, self.PADDING, -self.PADDING, -self.PADDING),
+                         Qt.TextFlag.TextWordWrap, record.text)
+        painter.restore()
+
+
+class TranscriptView(QListView):
+    # 滚动到顶部，需要加载更早的消息
+    top_reached = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.transcript_model = TranscriptModel(self)
+        self.setModel(self.transcript_model)
+        self.setItemDelegate(BubbleDelegate(self))
+        self.setSelectionMode(QAbstractItemView.SelectionMode.NoSelection)
+        self.setVerticalScrollMode(QAbstractItemView.ScrollMode.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarPolicy.ScrollBarAlwaysOff)
+        self.setResizeMode(QListView.ResizeMode.Adjust)
+        self.setLayoutMode(QListView.LayoutMode.Batched)
+        self.setBatchSize(200)
+        self.setFocusPolicy(Qt.FocusPolicy.NoFocus)
+        self.verticalScrollBar().valueChanged.connect(self._on_scrolled)
+        self.setStyleSheet("""
+        QListView {
+            background-color: #f8f9fa;
+            border-radius: 10px;
+            padding: 15px;
+        }
+        """)
+
+    def append_message(self, name, text, color, align_right=False):
+        bar = self.verticalScrollBar()
+        at_bottom = bar.value() >= bar.maximum() - 4
+        self.transcript_model.append(MessageRecord(name, text, color, align_right))
+        if at_bottom:
+            self.scrollToBottom()
+
+    def prepend_messages(self, records):
+        """在顶部插入更早的消息，保持当前看到的内容不跳动"""
+        bar = self.verticalScrollBar()
+        old_max, old_value = bar.maximum(), bar.value()
+        self.transcript_model.prepend(records)
+        self.doItemsLayout()
+        bar.setValue(old_value + bar.maximum() - old_max)
+
+    def _on_scrolled(self, value):
+        if value == 0 and self.verticalScrollBar().maximum() > 0:
+            self.top_reached.emit()